@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional, Tuple
+
+from src.alert_plan import determine_zone
+from src.subscriber_table import ZONE_ABOVE, ZONE_BELOW, ZONE_NEUTRAL, load_numpy
+
+# Pair events processed per batch; bounds memory whatever the grid size
+_BATCH_EVENTS = 4_000_000
+
+
+def numpy() -> Any:
+    np = load_numpy()
+    if np is None:
+        raise SystemExit("backtesting needs NumPy: pip install -r requirements.txt")
+    return np
+
+
+@dataclass
+class Series:
+    """Dominance samples: unix timestamps (increasing) and values in percent."""
+
+    ts: Any  # float64 array
+    values: Any  # float64 array
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def resample(self, step_seconds: float) -> "Series":
+        """The first sample of every `step_seconds` window, as the bot's checks would see it."""
+        np = numpy()
+        if step_seconds <= 0 or not len(self):
+            return self
+        window = np.floor(self.ts / step_seconds)
+        keep = np.flatnonzero(np.r_[True, window[1:] != window[:-1]])
+        return Series(self.ts[keep], self.values[keep])
+
+
+@dataclass
+class Replay:
+    """Per-configuration results of `replay`; entry i belongs to (upper[i], lower[i])."""
+
+    upper: Any
+    lower: Any
+    alerts: Any  # zone changes, i.e. messages a subscriber with these thresholds receives
+    above: Any  # alerts into each zone
+    below: Any
+    neutral: Any
+    flaps: Any  # alerts that come within the flap window of the previous one
+    time_above: Any  # fraction of the covered time spent in each zone
+    time_below: Any
+    time_neutral: Any
+    peak_per_check: float = 0.0  # most weighted alerts a single check produced
+
+
+def _ranges(starts: Any, counts: Any) -> Any:
+    """Concatenated `arange(start, start + count)` for every pair, without a Python loop."""
+    np = numpy()
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    ends = np.cumsum(counts)
+    return np.arange(total, dtype=np.int64) + np.repeat(starts - (ends - counts), counts)
+
+
+def _crossings(values: Any, thresholds: Any, upper: bool) -> Tuple[Any, Any]:
+    """Steps at which each threshold's side of the value flips, as (ptr, steps) in CSR form.
+
+    For an upper threshold u the "above" test `value >= u` flips at step t
+    when u lies in (lo, hi] of that step's move; for a lower threshold l the
+    "below" test `value <= l` flips when l lies in [lo, hi). Step 0 flips
+    when the first value is already beyond the threshold, as the bot treats
+    a new subscriber as neutral.
+    """
+    np = numpy()
+    lo = np.minimum(values[:-1], values[1:])
+    hi = np.maximum(values[:-1], values[1:])
+    side = "right" if upper else "left"
+    starts = np.searchsorted(thresholds, lo, side)
+    ends = np.searchsorted(thresholds, hi, side)
+    if upper:
+        first = (0, int(np.searchsorted(thresholds, values[0], "right")))
+    else:
+        first = (int(np.searchsorted(thresholds, values[0], "left")), len(thresholds))
+    starts = np.r_[first[0], starts].astype(np.int64)
+    counts = np.r_[first[1] - first[0], ends - starts[1:]].astype(np.int64)
+    steps = np.repeat(np.arange(len(values), dtype=np.int64), counts)
+    owner = _ranges(starts, counts)
+    # Steps are generated in order, so a stable sort by threshold keeps each list sorted
+    order = np.argsort(owner, kind="stable")
+    ptr = np.r_[0, np.cumsum(np.bincount(owner, minlength=len(thresholds)))].astype(np.int64)
+    return ptr, steps[order]
+
+
+def _batches(sizes: Any) -> Iterator[Tuple[int, int]]:
+    """Consecutive [start, end) pair ranges holding about _BATCH_EVENTS events each."""
+    np = numpy()
+    start, count = 0, len(sizes)
+    bounds = np.cumsum(sizes)
+    while start < count:
+        base = bounds[start - 1] if start else 0
+        end = max(start + 1, int(np.searchsorted(bounds, base + _BATCH_EVENTS, "right")))
+        yield start, min(end, count)
+        start = end
+
+
+def replay(
+    series: Series, upper: Any, lower: Any, flap_seconds: float = 3600.0, weights: Optional[Any] = None
+) -> Replay:
+    """Replay `series` through the bot's zone logic for every (upper[i], lower[i]) pair.
+
+    Zone flips are found per distinct threshold with one sorted pass over the
+    series, then merged per pair, so the cost grows with the number of
+    alerts rather than samples x pairs. `weights` (e.g. subscribers per
+    pair) only affects `peak_per_check`. Pairs must have lower < upper.
+    """
+    np = numpy()
+    upper = np.asarray(upper, dtype=np.float64)
+    lower = np.asarray(lower, dtype=np.float64)
+    pairs = len(upper)
+    ts, values = series.ts, series.values
+    result = Replay(
+        upper=upper,
+        lower=lower,
+        alerts=np.zeros(pairs, dtype=np.int64),
+        above=np.zeros(pairs, dtype=np.int64),
+        below=np.zeros(pairs, dtype=np.int64),
+        neutral=np.zeros(pairs, dtype=np.int64),
+        flaps=np.zeros(pairs, dtype=np.int64),
+        time_above=np.zeros(pairs),
+        time_below=np.zeros(pairs),
+        time_neutral=np.zeros(pairs),
+    )
+    if not pairs or not len(series):
+        return result
+
+    uppers, upper_idx = np.unique(upper, return_inverse=True)
+    lowers, lower_idx = np.unique(lower, return_inverse=True)
+    up_ptr, up_steps = _crossings(values, uppers, upper=True)
+    low_ptr, low_steps = _crossings(values, lowers, upper=False)
+    up_counts = np.diff(up_ptr)[upper_idx]
+    low_counts = np.diff(low_ptr)[lower_idx]
+
+    per_step = None
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)
+        per_step = np.zeros(len(series))
+    for start, end in _batches(up_counts + low_counts):
+        ids = np.arange(start, end, dtype=np.int64)
+        pair = np.r_[np.repeat(ids, up_counts[start:end]), np.repeat(ids, low_counts[start:end])]
+        step = np.r_[
+            up_steps[_ranges(up_ptr[upper_idx[start:end]], up_counts[start:end])],
+            low_steps[_ranges(low_ptr[lower_idx[start:end]], low_counts[start:end])],
+        ]
+        order = np.lexsort((step, pair))
+        pair, step = pair[order], step[order]
+        # Jumping straight across both thresholds flips both tests but is one alert
+        keep = np.r_[True, (pair[1:] != pair[:-1]) | (step[1:] != step[:-1])]
+        pair, step = pair[keep], step[keep]
+
+        value = values[step]
+        zone = np.where(value >= upper[pair], ZONE_ABOVE, np.where(value <= lower[pair], ZONE_BELOW, ZONE_NEUTRAL))
+        result.alerts += np.bincount(pair, minlength=pairs)
+        result.above += np.bincount(pair[zone == ZONE_ABOVE], minlength=pairs)
+        result.below += np.bincount(pair[zone == ZONE_BELOW], minlength=pairs)
+        result.neutral += np.bincount(pair[zone == ZONE_NEUTRAL], minlength=pairs)
+        quick = (pair[1:] == pair[:-1]) & (ts[step[1:]] - ts[step[:-1]] <= flap_seconds)
+        result.flaps += np.bincount(pair[1:][quick], minlength=pairs)
+        if per_step is not None:
+            per_step += np.bincount(step, weights=weights[pair], minlength=len(series))
+    if per_step is not None:
+        result.peak_per_check = float(per_step.max())
+
+    # Each sample holds until the next one; time in zone comes from sorted values and cumulative durations
+    durations = np.r_[np.diff(ts), 0.0]
+    total = float(durations.sum())
+    if total > 0:
+        order = np.argsort(values, kind="stable")
+        sorted_values = values[order]
+        covered = np.r_[0.0, np.cumsum(durations[order])]
+        result.time_above = (total - covered[np.searchsorted(sorted_values, upper, "left")]) / total
+        result.time_below = covered[np.searchsorted(sorted_values, lower, "right")] / total
+        result.time_neutral = 1.0 - result.time_above - result.time_below
+    return result
+
+
+def replay_scalar(values: Any, upper: float, lower: float) -> int:
+    """Alerts for one pair, value by value with the bot's determine_zone; used to cross-check `replay`."""
+    previous, alerts = "neutral", 0
+    for value in values.tolist():
+        zone = determine_zone(value, lower, upper)
+        if zone != previous:
+            alerts += 1
+            previous = zone
+    return alerts
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from backtest.engine import Replay, Series, numpy, replay, replay_scalar
+from backtest.series import read_series, threshold_distribution
+
+_SORT_KEYS = ("alerts", "flaps", "time_neutral")
+
+
+def _grid(raw: str) -> List[float]:
+    """`50,55,60` or `start:stop:step` (stop included)."""
+    if ":" in raw:
+        parts = [float(part) for part in raw.split(":")]
+        if len(parts) != 3 or parts[2] <= 0 or parts[1] < parts[0]:
+            raise argparse.ArgumentTypeError(f"expected start:stop:step, got {raw!r}")
+        start, stop, step = parts
+        count = int(round((stop - start) / step)) + 1
+        return [round(start + i * step, 10) for i in range(count)]
+    try:
+        return [float(part) for part in raw.split(",") if part.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected numbers or start:stop:step, got {raw!r}") from None
+
+
+def _rows(result: Replay, span_days: float, index: Any) -> List[Dict[str, float]]:
+    rows = []
+    for i in index.tolist():
+        alerts = int(result.alerts[i])
+        rows.append(
+            {
+                "upper": float(result.upper[i]),
+                "lower": float(result.lower[i]),
+                "alerts": alerts,
+                "alerts_per_day": alerts / span_days if span_days else 0.0,
+                "above": int(result.above[i]),
+                "below": int(result.below[i]),
+                "neutral": int(result.neutral[i]),
+                "flaps": int(result.flaps[i]),
+                "flap_ratio": int(result.flaps[i]) / alerts if alerts else 0.0,
+                "time_above": float(result.time_above[i]),
+                "time_below": float(result.time_below[i]),
+                "time_neutral": float(result.time_neutral[i]),
+            }
+        )
+    return rows
+
+
+def _distribution(name: str, series: Series, subscribers: dict, args: argparse.Namespace) -> Dict[str, object]:
+    """Totals for a subscriber population: every alert each subscriber would have received."""
+    upper, lower, counts = threshold_distribution(subscribers, args.default_upper, args.default_lower)
+    valid = lower < upper
+    result = replay(series, upper[valid], lower[valid], args.flap_window, weights=counts[valid])
+    weights = counts[valid]
+    alerts = int((result.alerts * weights).sum())
+    return {
+        "name": name,
+        "subscribers": int(counts.sum()),
+        "distinct_pairs": int(valid.sum()),
+        "invalid_subscribers": int(counts[~valid].sum()),
+        "alerts": alerts,
+        "alerts_per_subscriber": alerts / max(1, int(weights.sum())),
+        "flaps": int((result.flaps * weights).sum()),
+        "peak_alerts_per_check": result.peak_per_check,
+    }
+
+
+def _verify(series: Series, result: Replay, count: int, seed: int) -> List[Dict[str, float]]:
+    """Recount `count` random pairs with the bot's own determine_zone; returns the mismatches."""
+    np = numpy()
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(result.upper), size=min(count, len(result.upper)), replace=False)
+    mismatches = []
+    for i in picks.tolist():
+        expected = replay_scalar(series.values, float(result.upper[i]), float(result.lower[i]))
+        if expected != int(result.alerts[i]):
+            pair = {"upper": float(result.upper[i]), "lower": float(result.lower[i])}
+            mismatches.append({**pair, "expected": expected, "got": int(result.alerts[i])})
+    return mismatches
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m backtest", description="Replay dominance history through the alert logic for many thresholds."
+    )
+    parser.add_argument("series", help="HISTORY_FILE_PATH of the bot, or a timestamp,value CSV")
+    parser.add_argument("--upper", type=_grid, default=_grid("50:60:0.5"), help="upper thresholds: list or a:b:step")
+    parser.add_argument("--lower", type=_grid, default=_grid("40:50:0.5"), help="lower thresholds: list or a:b:step")
+    parser.add_argument("--step", type=float, default=0, help="check interval in seconds (default: every sample)")
+    parser.add_argument("--start", type=float, help="first unix timestamp to replay")
+    parser.add_argument("--end", type=float, help="unix timestamp to stop at (exclusive)")
+    parser.add_argument("--flap-window", type=float, default=3600, help="alerts this soon after the previous one flap")
+    parser.add_argument("--subscribers", help="subscriber store whose thresholds to replay as a distribution")
+    parser.add_argument("--synthetic", type=int, default=0, help="also replay N synthetic subscribers")
+    parser.add_argument("--default-upper", type=float, default=float(os.getenv("UPPER_THRESHOLD_PERCENT", "55")))
+    parser.add_argument("--default-lower", type=float, default=float(os.getenv("LOWER_THRESHOLD_PERCENT", "45")))
+    parser.add_argument("--sort", choices=_SORT_KEYS, default="alerts", help="result order, highest first")
+    parser.add_argument("--top", type=int, default=20, help="rows of the printed table")
+    parser.add_argument("--verify", type=int, default=0, help="recount N random pairs with the bot's own logic")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    np = numpy()
+    started = time.perf_counter()
+    series = read_series(args.series)
+    if args.start is not None or args.end is not None:
+        keep = (series.ts >= (args.start if args.start is not None else -np.inf)) & (
+            series.ts < (args.end if args.end is not None else np.inf)
+        )
+        series = Series(series.ts[keep], series.values[keep])
+    series = series.resample(args.step)
+    if not len(series):
+        print(f"{args.series}: no samples to replay", file=sys.stderr)
+        return 1
+    loaded_s = time.perf_counter() - started
+    span_days = float(series.ts[-1] - series.ts[0]) / 86400
+
+    upper = np.repeat(np.asarray(args.upper, dtype=np.float64), len(args.lower))
+    lower = np.tile(np.asarray(args.lower, dtype=np.float64), len(args.upper))
+    valid = lower < upper
+    t = time.perf_counter()
+    result = replay(series, upper[valid], lower[valid], args.flap_window)
+    replay_s = time.perf_counter() - t
+
+    distributions = []
+    if args.subscribers:
+        from src.subscribers import close_stores, read_subscribers
+
+        distributions.append(_distribution(args.subscribers, series, read_subscribers(args.subscribers), args))
+        close_stores()
+    if args.synthetic:
+        from bench.synthetic import make_subscribers
+
+        synthetic = make_subscribers(args.synthetic, seed=args.seed)
+        distributions.append(_distribution(f"synthetic-{args.synthetic}", series, synthetic, args))
+
+    key = getattr(result, args.sort)
+    order = np.lexsort((result.lower, result.upper, -key))
+    mismatches = _verify(series, result, args.verify, args.seed) if args.verify else []
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "options": vars(args),
+        },
+        "series": {
+            "samples": len(series),
+            "start": float(series.ts[0]),
+            "end": float(series.ts[-1]),
+            "days": span_days,
+            "min": float(series.values.min()),
+            "max": float(series.values.max()),
+        },
+        "pairs": len(result.upper),
+        "invalid_pairs": int((~valid).sum()),
+        "load_s": loaded_s,
+        "replay_s": replay_s,
+        "results": _rows(result, span_days, order),
+        "distributions": distributions,
+        "verified": min(args.verify, len(result.upper)),
+        "mismatches": mismatches,
+    }
+
+    print(
+        f"{len(series)} samples over {span_days:.1f} days, {len(result.upper)} pairs replayed in {replay_s:.3f}s",
+        file=sys.stderr,
+    )
+    header = f"{'upper':>7} {'lower':>7} {'alerts':>8} {'/day':>7} {'flaps':>7} {'above':>6} {'below':>6}"
+    print(header, file=sys.stderr)
+    for row in report["results"][: args.top]:
+        print(
+            f"{row['upper']:>7.2f} {row['lower']:>7.2f} {row['alerts']:>8} {row['alerts_per_day']:>7.2f} "
+            f"{row['flaps']:>7} {row['time_above']:>6.1%} {row['time_below']:>6.1%}",
+            file=sys.stderr,
+        )
+    for dist in distributions:
+        print(
+            f"{dist['name']}: {dist['subscribers']} subscribers, {dist['alerts']} alerts "
+            f"({dist['alerts_per_subscriber']:.1f} each), {dist['flaps']} flaps, "
+            f"peak {dist['peak_alerts_per_check']:.0f} per check",
+            file=sys.stderr,
+        )
+    if args.verify:
+        verified = f"verified {report['verified']} pairs against determine_zone"
+        print(f"{verified}: {len(mismatches)} mismatches", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 1 if mismatches else 0
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import csv
+from datetime import datetime, timezone
+from typing import Any, Dict, Tuple
+
+from backtest.engine import Series, numpy
+from src.subscribers import Subscriber
+
+
+def read_history(path: str) -> Series:
+    """Raw samples of the bot's HISTORY_FILE_PATH (little-endian (ts, value) doubles)."""
+    np = numpy()
+    with open(path, "rb") as f:
+        data = f.read()
+    # A torn trailing record from a crash is ignored, as HistoryStore does
+    data = data[: len(data) - len(data) % 16]
+    records = np.frombuffer(data, dtype=[("ts", "<f8"), ("value", "<f8")])
+    return _clean(records["ts"].astype(np.float64), records["value"].astype(np.float64))
+
+
+def _timestamp(raw: str) -> float:
+    try:
+        return float(raw)
+    except ValueError:
+        parsed = datetime.fromisoformat(raw.strip().replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+
+def read_csv(path: str) -> Series:
+    """`timestamp,value` rows; timestamps are unix seconds or ISO-8601 (UTC unless given). A header is skipped."""
+    np = numpy()
+    ts, values = [], []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for number, row in enumerate(csv.reader(f), 1):
+            if len(row) < 2 or not row[0].strip() or row[0].lstrip().startswith("#"):
+                continue
+            try:
+                stamp, value = _timestamp(row[0]), float(row[1])
+            except ValueError:
+                if number == 1:
+                    continue
+                raise ValueError(f"{path}:{number}: expected timestamp,value, got {row[:2]}") from None
+            ts.append(stamp)
+            values.append(value)
+    return _clean(np.asarray(ts, dtype=np.float64), np.asarray(values, dtype=np.float64))
+
+
+def read_series(path: str) -> Series:
+    return read_csv(path) if path.lower().endswith((".csv", ".txt")) else read_history(path)
+
+
+def _clean(ts: Any, values: Any) -> Series:
+    """Time-ordered samples without NaNs; later duplicates of a timestamp win."""
+    np = numpy()
+    keep = ~(np.isnan(ts) | np.isnan(values))
+    ts, values = ts[keep], values[keep]
+    order = np.argsort(ts, kind="stable")
+    ts, values = ts[order], values[order]
+    last = np.r_[ts[1:] != ts[:-1], True] if len(ts) else np.zeros(0, dtype=bool)
+    return Series(ts[last], values[last])
+
+
+def threshold_distribution(subscribers: Dict[int, Subscriber], upper: float, lower: float) -> Tuple[Any, Any, Any]:
+    """Distinct effective (upper, lower) pairs of a subscriber population and how many subscribers use each."""
+    np = numpy()
+    pairs = np.array(
+        [
+            (sub.upper if sub.upper is not None else upper, sub.lower if sub.lower is not None else lower)
+            for sub in subscribers.values()
+        ],
+        dtype=np.float64,
+    ).reshape(-1, 2)
+    unique, counts = np.unique(pairs, axis=0, return_counts=True)
+    return unique[:, 0], unique[:, 1], counts
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence
+
+
+@dataclass
+class Behaviour:
+    """How a stand-in responds: added latency, and a 429 for every Nth request (0 = never)."""
+
+    latency_seconds: float = 0.0
+    rate_limit_every: int = 0
+    retry_after_seconds: int = 1
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, handler, stand_in: "_StandIn") -> None:  # noqa: ANN001 - http.server types
+        super().__init__(address, handler)
+        self.stand_in = stand_in
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+    disable_nagle_algorithm = True  # headers and body are separate writes
+    server: _Server
+
+    def do_GET(self) -> None:  # noqa: N802 - http.server naming
+        self.server.stand_in.handle(self, "GET")
+
+    def do_POST(self) -> None:  # noqa: N802 - http.server naming
+        self.server.stand_in.handle(self, "POST")
+
+    def read_json(self) -> object:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def send_json(self, status: int, payload: object, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002 - http.server signature
+        pass
+
+
+class _StandIn:
+    """Base for the local API stand-ins; `/_bench/stats` returns request counters."""
+
+    def __init__(self, behaviour: Behaviour, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.behaviour = behaviour
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._server = _Server((host, port), _Handler, self)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "_StandIn":
+        self._thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, name: str, amount: int = 1) -> int:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+            return self._counters[name]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+    def _throttled(self) -> bool:
+        number = self.count("requests")
+        every = self.behaviour.rate_limit_every
+        return every > 0 and number % every == 0
+
+    def handle(self, request: _Handler, method: str) -> None:
+        path = request.path.split("?", 1)[0]
+        if path == "/_bench/stats":
+            request.send_json(200, self.stats())
+            return
+        if self.behaviour.latency_seconds > 0:
+            time.sleep(self.behaviour.latency_seconds)
+        if self._throttled():
+            self.count("rate_limited")
+            self.rate_limited(request)
+            return
+        self.serve(request, method, path)
+
+    def rate_limited(self, request: _Handler) -> None:
+        retry_after = self.behaviour.retry_after_seconds
+        request.send_json(429, {"error": "rate limited"}, {"Retry-After": str(retry_after)})
+
+    def serve(self, request: _Handler, method: str, path: str) -> None:
+        raise NotImplementedError
+
+
+class FakeTelegram(_StandIn):
+    """Bot API stand-in: sendMessage, getUpdates, setWebhook/deleteWebhook.
+
+    Update batches are queued with POST `/_bench/updates` (a JSON list) and
+    handed out one batch per getUpdates call.
+    """
+
+    def __init__(self, behaviour: Behaviour, host: str = "127.0.0.1", port: int = 0) -> None:
+        super().__init__(behaviour, host, port)
+        self._batches: List[list] = []
+
+    def handle(self, request: _Handler, method: str) -> None:
+        if request.path == "/_bench/updates":
+            batch = request.read_json()
+            with self._lock:
+                self._batches.append(list(batch or []))
+            request.send_json(200, {"ok": True})
+            return
+        super().handle(request, method)
+
+    def rate_limited(self, request: _Handler) -> None:
+        retry_after = self.behaviour.retry_after_seconds
+        request.send_json(
+            429,
+            {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            },
+            {"Retry-After": str(retry_after)},
+        )
+
+    def serve(self, request: _Handler, method: str, path: str) -> None:
+        api_method = path.rsplit("/", 1)[-1]
+        if method == "POST":
+            request.read_json()
+        if api_method == "sendMessage":
+            self.count("sent")
+            request.send_json(200, {"ok": True, "result": {"message_id": self.count("message_id")}})
+        elif api_method == "getUpdates":
+            with self._lock:
+                batch = self._batches.pop(0) if self._batches else []
+            self.count("updates", len(batch))
+            request.send_json(200, {"ok": True, "result": batch})
+        elif api_method in ("setWebhook", "deleteWebhook"):
+            request.send_json(200, {"ok": True, "result": True})
+        else:
+            request.send_json(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+
+
+class FakeCoinGecko(_StandIn):
+    """`/api/v3/global` stand-in cycling through `values` for BTC dominance."""
+
+    def __init__(
+        self, behaviour: Behaviour, values: Sequence[float] = (60.0, 40.0), host: str = "127.0.0.1", port: int = 0
+    ) -> None:
+        super().__init__(behaviour, host, port)
+        self.values = list(values)
+
+    @property
+    def global_url(self) -> str:
+        return f"{self.base_url}/api/v3/global"
+
+    def serve(self, request: _Handler, method: str, path: str) -> None:
+        if path != "/api/v3/global":
+            request.send_json(404, {"error": "not found"})
+            return
+        value = self.values[(self.count("served") - 1) % len(self.values)]
+        request.send_json(200, {"data": {"market_cap_percentage": {"btc": value, "eth": 100 - value}}})
@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from bench.fake_servers import Behaviour, FakeCoinGecko, FakeTelegram
+
+# Metrics compared by --compare; lower is better for all but alerts_per_s
+_COMPARED = (
+    "import_s",
+    "write_full_s",
+    "read_s",
+    "write_incremental_s",
+    "startup_s",
+    "startup_snapshot_s",
+    "updates_s",
+    "cycle_s",
+    "peak_rss_mb",
+)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run_size(count: int, options: Dict[str, object], telegram_base: str, coingecko_url: str) -> Dict[str, object]:
+    """Benchmark one population size. Runs in a fresh process so import time and peak RSS are its own."""
+    started = time.perf_counter()
+    import logging
+
+    import requests
+
+    from bench.synthetic import make_subscribers, make_updates
+    from src.bot import answer_value_requests, ensure_last_value, fetch_check_value, handle_updates, load_context
+    from src.bot import queue_alerts, queue_replies, run_check
+    from src.config import load_settings
+    from src.http_session import configure_session, set_telegram_api_base
+    from src.main import start_drainer
+    from src.snapshot import write_snapshot
+    from src.subscribers import close_stores, read_subscribers, write_subscribers
+    from src.updates import get_updates
+
+    import_s = time.perf_counter() - started
+
+    workdir = tempfile.mkdtemp(prefix=f"bench-{count}-")
+    suffix = ".db" if options["store"] == "sqlite" else ".json"
+    os.environ.update(
+        TELEGRAM_BOT_TOKEN="bench",
+        TELEGRAM_API_BASE=telegram_base,
+        DOMINANCE_PROVIDERS=f"fake={coingecko_url}#data.market_cap_percentage.btc",
+        SUBSCRIBERS_FILE_PATH=os.path.join(workdir, f"subscribers{suffix}"),
+        STATE_FILE_PATH=os.path.join(workdir, "state.json"),
+        HISTORY_FILE_PATH=os.path.join(workdir, "history.bin"),
+        LOG_FILE_PATH=os.path.join(workdir, "bot.log"),
+        OUTBOX_FILE_PATH=os.path.join(workdir, "outbox.jsonl"),
+        VALUE_CACHE_TTL_SECONDS="0",
+        VALUE_CACHE_STALE_SECONDS="0",
+        UPDATES_POLL_SECONDS="0",
+        ALERT_WORKERS=str(options["workers"]),
+        SEND_RATE_PER_SECOND=str(options["send_rate"]),
+        SEND_CHAT_RATE_PER_SECOND=str(options["chat_rate"]),
+    )
+    settings = load_settings()
+    logging.basicConfig(
+        filename=settings.log_file_path, level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    configure_session(settings.http_pool_connections, settings.http_pool_maxsize)
+    set_telegram_api_base(settings.telegram_api_base)
+    result: Dict[str, object] = {"subscribers": count, "store": options["store"], "import_s": import_s}
+
+    subscribers = make_subscribers(count, seed=int(options["seed"]))
+    t = time.perf_counter()
+    write_subscribers(settings.subscribers_file_path, subscribers)
+    result["write_full_s"] = time.perf_counter() - t
+    # SQLite keeps recent writes in the -wal file until a checkpoint, so it counts too
+    store_files = [settings.subscribers_file_path + extra for extra in ("", "-wal", "-shm")]
+    result["store_bytes"] = sum(os.path.getsize(path) for path in store_files if os.path.exists(path))
+    close_stores()
+
+    t = time.perf_counter()
+    subscribers = read_subscribers(settings.subscribers_file_path)
+    result["read_s"] = time.perf_counter() - t
+
+    dirty = set(list(subscribers)[:: 100])
+    for cid in dirty:
+        subscribers[cid].last_value = 50.0
+    t = time.perf_counter()
+    write_subscribers(settings.subscribers_file_path, subscribers, dirty=dirty, removed=set())
+    result["write_incremental_s"] = time.perf_counter() - t
+    del subscribers
+    close_stores()
+
+    t = time.perf_counter()
+    ctx = load_context(settings)
+    result["startup_s"] = time.perf_counter() - t
+
+    # Restart from the binary snapshot a clean shutdown leaves behind
+    close_stores()
+    write_snapshot(settings.subscribers_file_path, ctx.subscribers)
+    ctx.outbox.close()
+    t = time.perf_counter()
+    ctx = load_context(settings)
+    result["startup_snapshot_s"] = time.perf_counter() - t
+
+    def stats() -> Dict[str, int]:
+        return requests.get(f"{telegram_base}/_bench/stats", timeout=10).json()
+
+    batch = make_updates(int(options["batch"]), count)
+    requests.post(f"{telegram_base}/_bench/updates", json=batch, timeout=10).raise_for_status()
+    drainer = start_drainer(settings, ctx.outbox)
+    replies: List[tuple] = []
+    t = time.perf_counter()
+    _, updates = get_updates(settings.telegram_bot_token, None, 0)
+    value_ids = handle_updates(ctx, updates, lambda *message: replies.append(message))
+    if value_ids:
+        ensure_last_value(ctx)
+        answer_value_requests(ctx, value_ids, lambda *message: replies.append(message))
+    queue_replies(ctx, updates, replies)
+    ctx.outbox.join(timeout=300)
+    result["updates_s"] = time.perf_counter() - t
+    result["updates_batch"] = len(updates)
+
+    cycles: List[Dict[str, object]] = []
+    for _ in range(int(options["cycles"])):
+        before = stats()
+        t = time.perf_counter()
+        value = fetch_check_value(ctx)
+        check = run_check(ctx, value, lambda res: queue_alerts(ctx, res))
+        queued = time.perf_counter() - t
+        ctx.outbox.join(timeout=600)
+        wall = time.perf_counter() - t
+        after = stats()
+        alerts = len(check.plan)
+        cycles.append(
+            {
+                "value": value,
+                "wall_s": wall,
+                "queued_s": queued,
+                "alerts": alerts,
+                "distinct_messages": check.plan.message_count,
+                "alerts_per_s": alerts / wall if wall > 0 else 0.0,
+                "sent": after.get("sent", 0) - before.get("sent", 0),
+                "rate_limited": after.get("rate_limited", 0) - before.get("rate_limited", 0),
+            }
+        )
+    result["cycles"] = cycles
+    result["cycle_s"] = max((c["wall_s"] for c in cycles), default=0.0)
+    result["alerts_per_s"] = max((c["alerts_per_s"] for c in cycles), default=0.0)
+    drainer.stop()
+    ctx.outbox.close()
+    close_stores()
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_rss_mb"] = rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    result["workdir"] = workdir
+    return result
+
+
+def run(options: Dict[str, object]) -> Dict[str, object]:
+    telegram = FakeTelegram(
+        Behaviour(options["telegram_latency_ms"] / 1000.0, options["rate_limit_every"], options["retry_after"])
+    ).start()
+    coingecko = FakeCoinGecko(Behaviour(options["coingecko_latency_ms"] / 1000.0)).start()
+    mp = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        for count in options["sizes"]:
+            with mp.Pool(1) as pool:
+                result = pool.apply(run_size, (count, options, telegram.base_url, coingecko.global_url))
+            results.append(result)
+            print(_summary_line(result), file=sys.stderr)
+    finally:
+        telegram.stop()
+        coingecko.stop()
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "options": options,
+        },
+        "results": results,
+    }
+
+
+def _summary_line(result: Dict[str, object]) -> str:
+    return (
+        f"{result['subscribers']:>9} subs  startup {result['startup_s']:.3f}s/{result['startup_snapshot_s']:.3f}s  "
+        f"read {result['read_s']:.3f}s  "
+        f"write {result['write_full_s']:.3f}s/{result['write_incremental_s']:.3f}s  "
+        f"updates {result['updates_s']:.3f}s  cycle {result['cycle_s']:.3f}s  "
+        f"{result['alerts_per_s']:.0f} alerts/s  rss {result['peak_rss_mb']:.0f}MB"
+    )
+
+
+def compare(report: Dict[str, object], baseline: Dict[str, object]) -> List[str]:
+    """Per-size relative change of each metric against a previous report."""
+    old = {(r["subscribers"], r["store"]): r for r in baseline.get("results", [])}
+    lines = [f"compared with {baseline.get('meta', {}).get('commit') or 'baseline'}"]
+    for result in report["results"]:
+        previous = old.get((result["subscribers"], result["store"]))
+        if previous is None:
+            continue
+        for metric in _COMPARED + ("alerts_per_s",):
+            before, after = previous.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            worse = change < 0 if metric == "alerts_per_s" else change > 0
+            flag = "  <-- regression" if worse and abs(change) >= 10 else ""
+            lines.append(f"{result['subscribers']:>9} {metric:<20} {before:>10.4f} -> {after:>10.4f} ({change:+.1f}%){flag}")
+    return lines
+
+
+def _sizes(raw: str) -> List[int]:
+    sizes = []
+    for part in raw.split(","):
+        part = part.strip().lower()
+        scale = 1_000_000 if part.endswith("m") else 1000 if part.endswith("k") else 1
+        sizes.append(int(float(part.rstrip("mk")) * scale))
+    return sizes
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmark the bot against local API stand-ins.")
+    parser.add_argument("--sizes", type=_sizes, default=_sizes("1k,10k"), help="subscriber counts, e.g. 1k,100k,1m")
+    parser.add_argument("--store", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--cycles", type=int, default=3, help="dominance checks per size")
+    parser.add_argument("--batch", type=int, default=200, help="commands in the getUpdates batch")
+    parser.add_argument("--workers", type=int, default=16, help="ALERT_WORKERS")
+    parser.add_argument("--telegram-latency-ms", type=float, default=0.0)
+    parser.add_argument("--coingecko-latency-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth Telegram call with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after sent with 429s")
+    parser.add_argument("--send-rate", type=float, default=0, help="SEND_RATE_PER_SECOND (default 0: unlimited)")
+    parser.add_argument("--chat-rate", type=float, default=0, help="SEND_CHAT_RATE_PER_SECOND (default 0: unlimited)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="previous JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    options = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    report = run(options)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n".join(compare(report, baseline)), file=sys.stderr)
+    return 0
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import random
+from typing import Dict, List
+
+from src.subscribers import Subscriber
+
+_COMMANDS = ("/value", "/settings", "/upper {upper}", "/lower {lower}", "/thresholds {upper} {lower}", "/help")
+
+
+def make_subscribers(count: int, seed: int = 1, custom_fraction: float = 0.2) -> Dict[int, Subscriber]:
+    """`count` subscribers; `custom_fraction` of them have personal thresholds around the defaults."""
+    rng = random.Random(seed)
+    subscribers: Dict[int, Subscriber] = {}
+    for cid in range(1, count + 1):
+        if rng.random() < custom_fraction:
+            subscribers[cid] = Subscriber(upper=round(rng.uniform(52, 58), 2), lower=round(rng.uniform(42, 48), 2))
+        else:
+            subscribers[cid] = Subscriber()
+    return subscribers
+
+
+def make_updates(count: int, population: int, first_update_id: int = 1, seed: int = 2) -> List[dict]:
+    """A getUpdates batch of `count` command messages from random existing chats."""
+    rng = random.Random(seed)
+    updates = []
+    for offset in range(count):
+        text = rng.choice(_COMMANDS).format(upper=round(rng.uniform(52, 58), 2), lower=round(rng.uniform(42, 48), 2))
+        updates.append(
+            {
+                "update_id": first_update_id + offset,
+                "message": {"chat": {"id": rng.randint(1, max(1, population))}, "text": text},
+            }
+        )
+    return updates
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Tuple
+
+from src.subscribers import Subscriber
+
+
+def determine_zone(value: float, lower: float, upper: float) -> str:
+    if value >= upper:
+        return "above"
+    if value <= lower:
+        return "below"
+    return "neutral"
+
+
+def format_message(value: float, zone: str, lower: float, upper: float, label: str = "BTC dominance") -> str:
+    if zone == "above":
+        return f"⚠️ {label} crossed ABOVE {upper:.2f}%\nCurrent: {value:.2f}%"
+    if zone == "below":
+        return f"⚠️ {label} crossed BELOW {lower:.2f}%\nCurrent: {value:.2f}%"
+    return f"ℹ️ {label} back between thresholds ({lower:.2f}% - {upper:.2f}%)\nCurrent: {value:.2f}%"
+
+
+@dataclass
+class AlertGroup:
+    """Subscribers sharing one transition and effective thresholds, hence one message."""
+
+    previous_zone: str
+    zone: str
+    lower: float
+    upper: float
+    message: str
+    chat_ids: List[int] = field(default_factory=list)
+
+    @property
+    def kind(self) -> str:
+        return "alert" if self.zone in ("above", "below") else "neutral notice"
+
+
+@dataclass
+class AlertPlan:
+    """Messages to send for one check, rendered once per group.
+
+    `zone_updates` lists the subscribers whose stored zone changes
+    (including those that get no message, e.g. a first evaluation to
+    neutral); applying them is left to the caller, once the messages are
+    queued.
+    """
+
+    value: float
+    groups: List[AlertGroup] = field(default_factory=list)
+    zone_updates: List[Tuple[int, str]] = field(default_factory=list)
+    skipped_invalid: int = 0
+
+    def __len__(self) -> int:
+        return sum(len(g.chat_ids) for g in self.groups)
+
+    @property
+    def message_count(self) -> int:
+        return len(self.groups)
+
+
+def compile_plan(
+    value: float,
+    subscribers: Iterable[Tuple[int, Subscriber]],
+    default_upper: float,
+    default_lower: float,
+    label: str = "BTC dominance",
+) -> AlertPlan:
+    """Evaluate zone transitions and group recipients by (transition, lower, upper)."""
+    plan = AlertPlan(value=value)
+    groups: Dict[Tuple[str, str, float, float], AlertGroup] = {}
+    for cid, sub in subscribers:
+        upper = sub.upper if sub.upper is not None else default_upper
+        lower = sub.lower if sub.lower is not None else default_lower
+        if lower >= upper:
+            # Skip invalid per-user config; notify user once?
+            plan.skipped_invalid += 1
+            continue
+        zone = determine_zone(value, lower, upper)
+        previous = sub.last_zone or "neutral"
+        if zone != sub.last_zone:
+            plan.zone_updates.append((cid, zone))
+        if zone == previous:
+            continue
+        if zone == "neutral" and sub.last_zone not in ("above", "below"):
+            continue
+        key = (previous, zone, lower, upper)
+        group = groups.get(key)
+        if group is None:
+            message = format_message(value, zone, lower, upper, label)
+            group = groups[key] = AlertGroup(previous, zone, lower, upper, message)
+            plan.groups.append(group)
+        group.chat_ids.append(cid)
+    return plan
+
+
+def describe_recipient(plan: AlertPlan, group: AlertGroup, cid: int) -> str:
+    """Log line for a delivered message, built only when it is actually logged."""
+    if group.kind == "alert":
+        return f"alert to {cid} zone={group.zone} value={plan.value:.2f} upper={group.upper:.2f} lower={group.lower:.2f}"
+    return f"neutral notice to {cid} value={plan.value:.2f}"
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+import threading
+import time
+from typing import Any, Callable, List, Optional, Sequence, Set, Tuple
+
+from src.bot import (
+    BotContext,
+    add_maintenance_jobs,
+    answer_value_requests,
+    ensure_last_value,
+    fetch_check_readings,
+    handle_updates,
+    next_check_delay,
+    queue_alerts,
+    queue_replies,
+    run_checks,
+    unseen_updates,
+)
+from src.metrics import CHECK_LAG_SECONDS, STARTUP, beat
+from src.scheduler import Scheduler
+from src.updates import get_updates
+from src.webhook import WebhookReceiver
+
+log = logging.getLogger("src.main")
+
+
+def _in_daemon_thread(fn: Callable[..., Any], *args: Any) -> "asyncio.Future[Any]":
+    """Run a blocking call (upstream request, disk write) on a daemon thread.
+
+    Unlike the default executor, nothing waits for these threads at exit, so
+    shutdown never sits out a 50s getUpdates or a retrying CoinGecko fetch.
+    An abandoned poll is harmless because its offset is never confirmed.
+    """
+    loop = asyncio.get_running_loop()
+    future: asyncio.Future[Any] = loop.create_future()
+
+    def _settle(result: Any, error: Optional[BaseException]) -> None:
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _runner() -> None:
+        try:
+            result, error = fn(*args), None
+        except BaseException as e:  # noqa: BLE001 - forwarded to the awaiting task
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(_settle, result, error)
+        except RuntimeError:
+            pass  # loop already closed during shutdown
+
+    threading.Thread(target=_runner, name=getattr(fn, "__name__", "upstream"), daemon=True).start()
+    return future
+
+
+def _locked(lock: threading.Lock, fn: Callable[..., Any], *args: Any) -> Any:
+    """Run `fn` holding `lock`; the runtime's tasks touch bot state only this way, one at a time."""
+    with lock:
+        return fn(*args)
+
+
+def _apply_updates(ctx: BotContext, updates: List[dict]) -> Tuple[List[dict], Set[int]]:
+    """Handle an update batch and queue its replies; returns the new updates and the chats that asked for /value."""
+    updates = unseen_updates(ctx, updates)
+    replies: List[Tuple[int, str, str]] = []
+    value_ids = handle_updates(ctx, updates, lambda *message: replies.append(message))
+    queue_replies(ctx, updates, replies)
+    return updates, value_ids
+
+
+def _answer_values(ctx: BotContext, updates: List[dict], value_ids: Set[int]) -> None:
+    answered: List[Tuple[int, str, str]] = []
+    answer_value_requests(ctx, value_ids, lambda *message: answered.append(message))
+    queue_replies(ctx, updates, answered, part="value")
+
+
+async def _sleep_or_stop(stop: asyncio.Event, seconds: float) -> None:
+    try:
+        await asyncio.wait_for(stop.wait(), timeout=max(0.0, seconds))
+    except asyncio.TimeoutError:
+        pass
+
+
+async def updates_consumer(
+    ctx: BotContext,
+    stop: asyncio.Event,
+    lock: threading.Lock,
+    receiver: Optional[WebhookReceiver] = None,
+    loop_name: str = "updates",
+) -> None:
+    """Long-poll getUpdates (or wait on the webhook receiver) and apply commands.
+
+    Commands run on a daemon thread holding `lock`, since they write the
+    subscriber store and the outbox. Replies go to the outbox. `loop_name`
+    tells hosted bots' consumers apart in /healthz.
+    """
+    settings = ctx.settings
+    offset: Optional[int] = None
+    period = 1.0 if receiver is not None else settings.updates_long_poll_seconds + settings.request_timeout_seconds
+
+    while not stop.is_set():
+        if receiver is not None:
+            poll = _in_daemon_thread(lambda: (offset, receiver.next_batch(1.0)))
+        else:
+            poll = _in_daemon_thread(
+                get_updates, settings.telegram_bot_token, offset, settings.updates_long_poll_seconds
+            )
+        stopper = asyncio.ensure_future(stop.wait())
+        done, _ = await asyncio.wait({poll, stopper}, return_when=asyncio.FIRST_COMPLETED)
+        stopper.cancel()
+        if poll not in done:
+            break
+        try:
+            offset, updates = poll.result()
+        except Exception as e:  # noqa: BLE001
+            log.warning("updates error: %s", repr(e))
+            await _sleep_or_stop(stop, settings.updates_poll_seconds)
+            continue
+        try:
+            updates, value_ids = await _in_daemon_thread(_locked, lock, _apply_updates, ctx, updates)
+            if value_ids:
+                await _in_daemon_thread(ensure_last_value, ctx)
+                await _in_daemon_thread(_locked, lock, _answer_values, ctx, updates, value_ids)
+        except Exception as e:  # noqa: BLE001
+            log.warning("loop error: %s", repr(e))
+        STARTUP.ready()
+        beat(loop_name, period)
+
+
+async def dominance_check(bots: Sequence[BotContext], lock: threading.Lock) -> float:
+    """Fetch dominance once for every bot in `bots` and queue alerts in the outbox.
+
+    Each bot's check (subscriber and state writes, history, the outbox fsync)
+    runs on a daemon thread holding `lock`. Returns the seconds until the next
+    check; the first bot's settings set the pace.
+    """
+    ctx = bots[0]
+    settings = ctx.settings
+    check_error: Optional[Exception] = None
+    try:
+        readings = await _in_daemon_thread(fetch_check_readings, ctx)
+    except Exception as e:  # noqa: BLE001
+        check_error = e
+        log.warning("check error: %s", repr(e))
+    else:
+        for bot in bots:
+            try:
+                await _in_daemon_thread(_locked, lock, run_checks, bot, readings, queue_alerts)
+            except Exception as e:  # noqa: BLE001
+                check_error = check_error or e
+                log.warning("check error%s: %s", f" bot={bot.settings.bot_name}" if len(bots) > 1 else "", repr(e))
+    beat("checker", settings.check_interval_seconds + settings.request_timeout_seconds)
+    return next_check_delay(ctx, check_error)
+
+
+async def scheduled_jobs(bots: Sequence[BotContext], stop: asyncio.Event, lock: threading.Lock) -> None:
+    """Run the dominance check and the upkeep jobs on one deadline Scheduler.
+
+    Due jobs run one at a time on a daemon thread holding `lock`, so flushes,
+    rollups and log rotation never block the event loop. The check job only
+    flags that a check is due; the loop then awaits it and schedules the next
+    one `next_check_delay` after it started.
+    """
+    scheduler = Scheduler()
+    add_maintenance_jobs(scheduler, bots)
+    due: List[float] = []  # lag of the check that came due
+
+    def flag_check() -> None:
+        due.append(check.lag)
+
+    check = scheduler.once("check", 0.0, flag_check)
+    while not stop.is_set():
+        delay = await _in_daemon_thread(_locked, lock, scheduler.run_due)
+        if due:
+            started = time.monotonic()
+            CHECK_LAG_SECONDS.set(due.pop())
+            delay = await dominance_check(bots, lock)
+            check = scheduler.once("check", started + delay - time.monotonic(), flag_check)
+            continue
+        await _sleep_or_stop(stop, delay)
+
+
+async def run_async(ctx: BotContext, receiver: Optional[WebhookReceiver] = None) -> None:
+    """Run the updates consumer and the scheduled jobs (dominance check, upkeep) as independent tasks.
+
+    Sending is left to the outbox drainer thread started by main().
+    """
+    await run_bots([(ctx, receiver)])
+
+
+async def run_bots(bots: Sequence[Tuple[BotContext, Optional[WebhookReceiver]]]) -> None:
+    """Run one updates consumer per bot and a single scheduled-jobs task (with the check) shared by all of them."""
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # e.g. not in the main thread
+
+    hosting = len(bots) > 1
+    lock = threading.Lock()
+    producers = [
+        asyncio.ensure_future(
+            updates_consumer(ctx, stop, lock, receiver, f"updates:{ctx.settings.bot_name}" if hosting else "updates")
+        )
+        for ctx, receiver in bots
+    ]
+    producers.append(asyncio.ensure_future(scheduled_jobs([ctx for ctx, _ in bots], stop, lock)))
+    if hosting:
+        log.info("async runtime started bots=%d", len(bots))
+    elif bots[0][1] is not None:
+        log.info("async runtime started updates=webhook")
+    else:
+        log.info("async runtime started long_poll=%ss", bots[0][0].settings.updates_long_poll_seconds)
+
+    await stop.wait()
+    log.info("stopping async runtime")
+    for task in producers:
+        task.cancel()
+    await asyncio.gather(*producers, return_exceptions=True)
+    # Let a command or check already running on its thread finish, and keep any
+    # waiting one from starting while the caller closes the stores
+    await _in_daemon_thread(lock.acquire)
@@ -0,0 +1,740 @@
+from __future__ import annotations
+
+import dataclasses
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, MutableMapping, Optional, Sequence, Set, Tuple
+
+from src.alert_plan import AlertPlan, compile_plan, describe_recipient, determine_zone
+from src.commands import CommandBatch, CommandRouter
+from src.config import Settings
+from src.fetcher import BTC, HedgedFetcher, Metric, Readings, parse_metrics, parse_providers
+from src.history import HistoryStore
+from src.logging_setup import maintain_logging
+from src.metrics import ALERTS, DOMINANCE, PERSIST_SECONDS, STARTUP, SUBSCRIBERS
+from src.outbox import Message, Outbox
+from src.resilience import RetryPolicy, is_retryable
+from src.scheduler import Scheduler
+from src.snapshot import read_snapshot, write_snapshot
+from src.state import BotState, read_state, write_state
+from src.subscriber_table import SubscriberTable
+from src.subscribers import Subscriber, read_subscribers, write_subscribers
+from src.threshold_index import ThresholdIndex
+from src.value_cache import ValueCache
+from src.updates import Command
+
+log = logging.getLogger("src.main")
+
+# Upkeep intervals of add_maintenance_jobs
+FLUSH_SECONDS = 60.0
+DOWNSAMPLE_SECONDS = 60.0
+LOG_MAINTENANCE_SECONDS = 60.0
+
+# reply(chat_id, text, note): deliver `text`; `note` is logged once it has been sent
+Reply = Callable[[int, str, str], None]
+
+
+def help_text(metrics: Sequence[str] = ()) -> str:
+    text = (
+        "Commands:\n"
+        "/start — subscribe\n"
+        "/stop — unsubscribe\n"
+        "/value — current BTC dominance\n"
+        "/settings — show your thresholds\n"
+        "/upper <value> — set your upper (0–100)\n"
+        "/lower <value> — set your lower (0–100)\n"
+        "/thresholds <upper> <lower> — set both\n"
+        "/reset — use global defaults\n"
+        "/history [24h|7d|30d|1y] — dominance range over a period\n"
+        "/help — this help"
+    )
+    if len(metrics) > 1:
+        text += (
+            f"\n\nMetrics: {', '.join(metrics)} (default {metrics[0]}).\n"
+            f"Name one first to use it, e.g. /start {metrics[1]} or /upper {metrics[1]} <value>; /stop alone stops all."
+        )
+    return text
+
+
+@dataclass
+class BotContext:
+    """Mutable bot state shared by the sync loop and the asyncio runtime."""
+
+    settings: Settings
+    # A dict, or a SubscriberTable (SUBSCRIBER_BACKEND=columnar) which needs no index
+    subscribers: MutableMapping[int, Subscriber]
+    index: Optional[ThresholdIndex]
+    value_cache: ValueCache
+    last_value: Optional[float] = None
+    # Value the subscribers' stored zones were last evaluated against
+    last_checked_value: Optional[float] = None
+    # Chat ids changed/removed since the last write; SQLite stores persist only these
+    dirty: Set[int] = field(default_factory=set)
+    removed: Set[int] = field(default_factory=set)
+    history: Optional[HistoryStore] = None
+    fetcher: Optional[HedgedFetcher] = None
+    retry_policy: RetryPolicy = field(default_factory=RetryPolicy)
+    check_failures: int = 0  # consecutive failed checks
+    outbox: Optional[Outbox] = None
+    checks: int = 0  # completed checks, persisted in the state file
+    # Highest update id whose replies were queued before this start; updates up
+    # to it that Telegram redelivers in the first batch are skipped
+    update_mark: Optional[int] = None
+    # The metric this context evaluates, and every metric's context ("board") by name,
+    # primary first; boards share the primary's fetcher, value cache and outbox
+    metric: Metric = BTC
+    boards: Dict[str, "BotContext"] = field(default_factory=dict, repr=False)
+
+    def each_board(self) -> List["BotContext"]:
+        return list(self.boards.values()) or [self]
+
+    @property
+    def check_mark(self) -> str:
+        """Outbox mark and key prefix of this board's checks; the primary board's is plain 'check'."""
+        return "check" if self.each_board()[0] is self else f"check:{self.metric.name}"
+
+    def effective_thresholds(self, sub: Subscriber) -> Tuple[float, float]:
+        upper = sub.upper if sub.upper is not None else self.settings.upper_threshold_percent
+        lower = sub.lower if sub.lower is not None else self.settings.lower_threshold_percent
+        return upper, lower
+
+    def ensure_subscriber(self, cid: int) -> Subscriber:
+        sub = self.subscribers.get(cid)
+        if sub is None:
+            self.subscribers[cid] = Subscriber()
+            sub = self.subscribers[cid]
+            self.reindex(cid, sub)
+            self.dirty.add(cid)
+        return sub
+
+    def reindex(self, cid: int, sub: Subscriber) -> None:
+        if self.index is not None:
+            self.index.update(cid, sub)
+
+    def unindex(self, cid: int) -> None:
+        if self.index is not None:
+            self.index.remove(cid)
+
+    def flush_subscribers(self) -> None:
+        if not self.dirty and not self.removed:
+            return
+        write_subscribers(self.settings.subscribers_file_path, self.subscribers, self.dirty, self.removed)
+        self.dirty.clear()
+        self.removed.clear()
+
+
+@dataclass
+class CheckResult:
+    value: float
+    plan: AlertPlan
+    seq: int = 0  # check number; a check re-run after a crash gets the same one
+
+
+def named_path(file_path: str, name: str) -> str:
+    """`subscribers.db` -> `subscribers.eth.db`; used for metrics' and hosted bots' files."""
+    root, ext = os.path.splitext(file_path)
+    return f"{root}.{name}{ext}"
+
+
+def board_settings(settings: Settings) -> List[Tuple[Metric, Settings]]:
+    """Each metric with its board's settings.
+
+    The primary (first) metric keeps the configured files; the others get
+    their own subscriber store, state and history named after the metric.
+    Thresholds given in DOMINANCE_METRICS replace the global defaults.
+    """
+    boards = []
+    for i, metric in enumerate(parse_metrics(settings.dominance_metrics)):
+        own = dataclasses.replace(
+            settings,
+            upper_threshold_percent=settings.upper_threshold_percent if metric.upper is None else metric.upper,
+            lower_threshold_percent=settings.lower_threshold_percent if metric.lower is None else metric.lower,
+        )
+        if i > 0:
+            own = dataclasses.replace(
+                own,
+                subscribers_file_path=named_path(settings.subscribers_file_path, metric.name),
+                state_file_path=named_path(settings.state_file_path, metric.name),
+                history_file_path=named_path(settings.history_file_path, metric.name)
+                if settings.history_file_path
+                else "",
+            )
+        boards.append((metric, own))
+    return boards
+
+
+def load_context(
+    settings: Settings,
+    subscribers: Optional[Dict[int, Subscriber]] = None,
+    metric: Optional[Metric] = None,
+    shared: Optional[BotContext] = None,
+    feed: Optional[BotContext] = None,
+) -> BotContext:
+    """Build the context of one metric's board (the primary metric by default).
+
+    `subscribers` overrides reading them from the store. With `shared` the
+    board uses that context's fetcher, value cache and outbox; with `feed`
+    (another hosted bot) only its fetcher and value cache.
+    """
+    metric = metric or parse_metrics(settings.dominance_metrics)[0]
+    state = read_state(settings.state_file_path)
+    source = "given"
+    if subscribers is None and settings.subscriber_snapshot:
+        subscribers = read_snapshot(settings.subscribers_file_path, settings.subscriber_backend == "columnar")
+        source = "snapshot"
+    if subscribers is None:
+        subscribers = read_subscribers(settings.subscribers_file_path)
+        source = "store"
+    STARTUP.phase("subscribers")
+    index: Optional[ThresholdIndex] = None
+    if settings.subscriber_backend == "columnar":
+        if not isinstance(subscribers, SubscriberTable):
+            subscribers = SubscriberTable.from_subscribers(subscribers)
+    else:
+        index = ThresholdIndex.build(subscribers, settings.upper_threshold_percent, settings.lower_threshold_percent)
+    source_ctx = shared or feed
+    if source_ctx is None:
+        fetcher = HedgedFetcher(
+            parse_providers(settings.dominance_providers),
+            settings.request_timeout_seconds,
+            breaker_threshold=settings.breaker_failure_threshold,
+            breaker_reset_seconds=settings.breaker_reset_seconds,
+            metrics=parse_metrics(settings.dominance_metrics),
+        )
+        value_cache: ValueCache[Readings] = ValueCache(
+            fetcher.fetch,
+            ttl_seconds=settings.value_cache_ttl_seconds,
+            stale_seconds=settings.value_cache_stale_seconds,
+        )
+    else:
+        fetcher, value_cache = source_ctx.fetcher, source_ctx.value_cache
+    outbox = Outbox(settings.outbox_file_path, settings.bot_name) if shared is None else shared.outbox
+    log.info(
+        "starting bot%s metric=%s state=%s subscribers=%d (%s) outbox=%d",
+        f" {settings.bot_name}" if settings.bot_name else "",
+        metric.name,
+        state,
+        len(subscribers),
+        source,
+        len(outbox),
+    )
+    return BotContext(
+        settings=settings,
+        subscribers=subscribers,
+        index=index,
+        value_cache=value_cache,
+        last_value=state.last_value,
+        last_checked_value=state.last_value,
+        history=HistoryStore(settings.history_file_path) if settings.history_file_path else None,
+        fetcher=fetcher,
+        retry_policy=RetryPolicy(base_delay=settings.retry_base_seconds, max_delay=settings.check_interval_seconds),
+        outbox=outbox,
+        checks=state.checks,
+        update_mark=outbox.mark("updates") if shared is None else None,
+        metric=metric,
+    )
+
+
+def load_boards(
+    settings: Settings,
+    empty: bool = False,
+    derive: Optional[Callable[[Settings], Settings]] = None,
+    feed: Optional[BotContext] = None,
+) -> BotContext:
+    """Load one board per DOMINANCE_METRICS entry; returns the primary board with `boards` set.
+
+    One upstream fetch per interval serves every board, and with `feed` every
+    hosted bot. `derive` adjusts each board's settings (e.g. to a shard's
+    files); `empty` loads no subscribers.
+    """
+    boards: Dict[str, BotContext] = {}
+    primary: Optional[BotContext] = None
+    for metric, own in board_settings(settings):
+        board = load_context(derive(own) if derive else own, {} if empty else None, metric, primary, feed)
+        primary = primary or board
+        boards[metric.name] = board
+    for board in boards.values():
+        board.boards = boards
+    return primary  # type: ignore[return-value]
+
+
+def save_snapshot(ctx: BotContext) -> None:
+    """Write each board's binary subscriber snapshot for the next start; call after close_stores() on shutdown.
+
+    A board with unflushed changes is skipped, since the snapshot must match the store.
+    """
+    for board in ctx.each_board():
+        if not board.settings.subscriber_snapshot or board.dirty or board.removed:
+            continue
+        try:
+            count = write_snapshot(board.settings.subscribers_file_path, board.subscribers)
+            log.info("wrote %s subscriber snapshot of %d chats", board.metric.name, count)
+        except Exception as e:  # noqa: BLE001
+            log.warning("snapshot write error: %s", repr(e))
+
+
+router = CommandRouter()
+
+# Commands whose first argument can only be a metric name
+_METRIC_COMMANDS = ("stop", "settings", "reset")
+
+
+def _board_arg(ctx: BotContext, cmd: Command) -> Tuple[Optional[BotContext], List[str]]:
+    """Split an optional leading metric name off the arguments.
+
+    Returns the named board (the primary one when none is named), or None
+    for a name that looks like a metric but is not configured.
+    """
+    args = list(cmd.args)
+    if args and args[0].lower() in ctx.boards:
+        return ctx.boards[args[0].lower()], args[1:]
+    if args and re.fullmatch(r"[a-z_][a-z0-9_]*", args[0].lower()) and cmd.name in _METRIC_COMMANDS:
+        return None, args
+    return ctx, args
+
+
+def _unknown_metric(ctx: BotContext, cmd: Command, batch: CommandBatch) -> None:
+    names = ", ".join(board.metric.name for board in ctx.each_board())
+    batch.reply(cmd.chat_id, f"Unknown metric {cmd.args[0]!r}. Available: {names}")
+
+
+def _thresholds_title(ctx: BotContext) -> str:
+    # Replies keep their single-metric wording unless several metrics are served
+    return f"{ctx.metric.label} thresholds" if len(ctx.boards) > 1 else "thresholds"
+
+
+@router.command("start")
+def _cmd_start(ctx: BotContext, cmd: Command, batch: CommandBatch) -> None:
+    # Anything but a metric name (e.g. a deep-link payload) subscribes to the primary metric
+    board = _board_arg(ctx, cmd)[0] or ctx
+    log.info("/start %s from %s", board.metric.name, cmd.chat_id)
+    if cmd.chat_id not in board.subscribers:
+        board.ensure_subscriber(cmd.chat_id)
+        batch.membership_changed = True
+
+
+@router.command("stop")
+def _cmd_stop(ctx: BotContext, cmd: Command, batch: CommandBatch) -> None:
+    board, _ = _board_arg(ctx, cmd)
+    if board is None:
+        _unknown_metric(ctx, cmd, batch)
+        return
+    log.info("/stop %s from %s", board.metric.name if cmd.args else "all", cmd.chat_id)
+    for target in [board] if cmd.args else ctx.each_board():
+        if target.subscribers.pop(cmd.chat_id, None) is not None:
+            target.unindex(cmd.chat_id)
+            target.removed.add(cmd.chat_id)
+            batch.membership_changed = True
+
+
+@router.command("value")
+def _cmd_value(ctx: BotContext, cmd: Command, batch: CommandBatch) -> None:
+    # Answered by the runtime once a value is available
+    batch.value_ids.add(cmd.chat_id)
+
+
+def _subscriber_for(ctx: BotContext, cid: int, batch: CommandBatch) -> Subscriber:
+    # Threshold and help commands implicitly subscribe the chat
+    if cid not in ctx.subscribers:
+        batch.membership_changed = True
+    return ctx.ensure_subscriber(cid)
+
+
+@router.command("settings")
+def _cmd_settings(ctx: BotContext, cmd: Command, batch: CommandBatch) -> None:
+    board, _ = _board_arg(ctx, cmd)
+    if board is None:
+        _unknown_metric(ctx, cmd, batch)
+        return
+    if cmd.args:
+        boards = [board]
+    else:
+        # The primary metric (subscribing the chat to it) plus every other metric it follows
+        boards = [b for b in ctx.each_board() if b is ctx or cmd.chat_id in b.subscribers]
+    lines = []
+    for target in boards:
+        sub = _subscriber_for(target, cmd.chat_id, batch)
+        eff_upper, eff_lower = target.effective_thresholds(sub)
+        lines.append(
+            f"Your {_thresholds_title(target)}: upper={eff_upper:.2f}%, lower={eff_lower:.2f}%\n"
+            f"Using {'custom' if sub.upper or sub.lower else 'global defaults'}."
+        )
+    batch.reply(cmd.chat_id, "\n".join(lines), f"/settings replied to {cmd.chat_id}")
+
+
+def _parse_percent(raw: str, label: str) -> float:
+    val = float(raw)
+    if not (0 <= val <= 100):
+        raise ValueError(f"{label} must be between 0 and 100")
+    return val
+
+
+@router.command("upper", "lower", "thresholds")
+def _cmd_thresholds(ctx: BotContext, cmd: Command, batch: CommandBatch) -> None:
+    board, args = _board_arg(ctx, cmd)
+    cid = cmd.chat_id
+    board = board or ctx
+    sub = _subscriber_for(board, cid, batch)
+    try:
+        upper, lower = sub.upper, sub.lower
+        if cmd.name == "upper":
+            if not args:
+                raise ValueError("Usage: /upper <value>")
+            upper = _parse_percent(args[0], "Upper")
+        elif cmd.name == "lower":
+            if not args:
+                raise ValueError("Usage: /lower <value>")
+            lower = _parse_percent(args[0], "Lower")
+        else:
+            if len(args) < 2:
+                raise ValueError("Usage: /thresholds <upper> <lower>")
+            upper = float(args[0])
+            lower = float(args[1])
+            if not (0 <= upper <= 100 and 0 <= lower <= 100):
+                raise ValueError("Values must be between 0 and 100")
+        eff_upper, eff_lower = board.effective_thresholds(Subscriber(upper=upper, lower=lower))
+        if eff_lower >= eff_upper:
+            raise ValueError("Lower must be less than upper")
+    except Exception as e:  # noqa: BLE001
+        batch.reply(cid, f"Threshold error: {e}")
+        log.warning("threshold cmd error cid=%s cmd=%s args=%s err=%s", cid, cmd.name, list(cmd.args), repr(e))
+        return
+    sub.upper, sub.lower = upper, lower
+    board.reindex(cid, sub)
+    board.dirty.add(cid)
+    log.info("saved %s thresholds for %s -> upper=%s lower=%s", board.metric.name, cid, eff_upper, eff_lower)
+    batch.reply(cid, f"Saved {_thresholds_title(board)}. upper={eff_upper:.2f}%, lower={eff_lower:.2f}%")
+
+
+@router.command("reset")
+def _cmd_reset(ctx: BotContext, cmd: Command, batch: CommandBatch) -> None:
+    board, _ = _board_arg(ctx, cmd)
+    if board is None:
+        _unknown_metric(ctx, cmd, batch)
+        return
+    sub = _subscriber_for(board, cmd.chat_id, batch)
+    sub.upper = None
+    sub.lower = None
+    board.reindex(cmd.chat_id, sub)
+    board.dirty.add(cmd.chat_id)
+    batch.reply(
+        cmd.chat_id,
+        f"Your {_thresholds_title(board)} have been reset to global defaults.",
+        f"reset {board.metric.name} thresholds for {cmd.chat_id}",
+    )
+
+
+@router.command("help")
+def _cmd_help(ctx: BotContext, cmd: Command, batch: CommandBatch) -> None:
+    _subscriber_for(ctx, cmd.chat_id, batch)
+    metrics = [board.metric.name for board in ctx.each_board()]
+    batch.reply(cmd.chat_id, help_text(metrics), f"/help replied to {cmd.chat_id}")
+
+
+_PERIOD_RE = re.compile(r"^(\d+)([hdwy])$")
+_PERIOD_SECONDS = {"h": 3600, "d": 86400, "w": 7 * 86400, "y": 365 * 86400}
+
+
+@router.command("history")
+def _cmd_history(ctx: BotContext, cmd: Command, batch: CommandBatch) -> None:
+    board, args = _board_arg(ctx, cmd)
+    board = board or ctx
+    period = (args[0] if args else "24h").lower()
+    match = _PERIOD_RE.match(period)
+    if not match or int(match.group(1)) <= 0:
+        batch.reply(cmd.chat_id, "Usage: /history [24h|7d|30d|1y]")
+        return
+    if board.history is None:
+        batch.reply(cmd.chat_id, "History is not enabled on this bot.")
+        return
+    end = time.time()
+    points = board.history.query_buckets(end - int(match.group(1)) * _PERIOD_SECONDS[match.group(2)], end)
+    if not points:
+        batch.reply(cmd.chat_id, f"No history recorded for the last {period} yet.")
+        return
+    first, last = points[0].mean, points[-1].mean
+    # Rollup means flatten spikes; the extremes come from the buckets' min and max
+    low, high = min(b.min for b in points), max(b.max for b in points)
+    msg = (
+        f"{board.metric.label} over {period}: {first:.2f}% → {last:.2f}% ({last - first:+.2f})\n"
+        f"Low {low:.2f}%, high {high:.2f}% ({len(points)} points)"
+    )
+    batch.reply(cmd.chat_id, msg, f"/history replied to {cmd.chat_id}")
+
+
+def handle_updates(ctx: BotContext, updates: List[dict], reply: Reply) -> Set[int]:
+    """Dispatch an update batch through the router; return chat ids that asked for /value."""
+    if not updates:
+        return set()
+    return router.dispatch(ctx, updates, reply).value_ids
+
+
+def plan_check(ctx: BotContext, current_value: float) -> AlertPlan:
+    """Build the alert plan for `current_value` over the subscribers whose zone may have flipped.
+
+    A columnar table is evaluated in full instead.
+    """
+    if isinstance(ctx.subscribers, SubscriberTable):
+        return ctx.subscribers.compile_plan(
+            current_value, ctx.settings.upper_threshold_percent, ctx.settings.lower_threshold_percent, ctx.metric.label
+        )
+    candidates = ctx.index.candidates(ctx.last_checked_value, current_value)
+    subscribers = ctx.subscribers
+    return compile_plan(
+        current_value,
+        ((cid, subscribers[cid]) for cid in candidates if cid in subscribers),
+        ctx.settings.upper_threshold_percent,
+        ctx.settings.lower_threshold_percent,
+        ctx.metric.label,
+    )
+
+
+def run_check(
+    ctx: BotContext, current_value: float, deliver: Callable[[CheckResult], None]
+) -> CheckResult:
+    """Evaluate zone transitions for `current_value`, hand alerts to `deliver`, then persist.
+
+    New zones are applied only once `deliver` returns: if it raises, the
+    chats keep their old zones and are marked pending in the index, so the
+    next check finds the same transitions even if the value has not moved.
+    """
+    seq = ctx.checks + 1
+    plan = plan_check(ctx, current_value)
+    result = CheckResult(value=current_value, plan=plan, seq=seq)
+    DOMINANCE.set(current_value, metric=ctx.metric.name)
+    SUBSCRIBERS.set(len(ctx.subscribers), bot=ctx.settings.bot_name, metric=ctx.metric.name)
+    if plan.groups:
+        log.info("alert plan: %d distinct messages to %d chats", plan.message_count, len(plan))
+        try:
+            deliver(result)
+        except Exception:
+            # plan_check consumed the index's pending set; chats that only it
+            # pointed at (e.g. changed thresholds) would otherwise be missed
+            if ctx.index is not None:
+                ctx.index.mark_pending(cid for cid, _ in plan.zone_updates)
+            raise
+    ALERTS.inc(len(plan))
+    apply_zone_updates(ctx, plan)
+
+    # Persist per-user states
+    ctx.flush_subscribers()
+    ctx.last_checked_value = current_value
+    ctx.checks = seq
+    record_value(ctx, current_value)
+
+    log.info("checked %s value %.2f for %d subscribers", ctx.metric.name, current_value, len(ctx.subscribers))
+    return result
+
+
+def apply_zone_updates(ctx: BotContext, plan: AlertPlan) -> None:
+    """Store the plan's new zones (and the value they were evaluated at) and mark the chats dirty."""
+    if isinstance(ctx.subscribers, SubscriberTable):
+        ctx.subscribers.apply_zone_updates(plan.zone_updates, plan.value)
+        ctx.dirty.update(cid for cid, _ in plan.zone_updates)
+        return
+    for cid, zone in plan.zone_updates:
+        sub = ctx.subscribers.get(cid)
+        if sub is not None:
+            sub.last_zone = zone
+            sub.last_value = plan.value
+            ctx.dirty.add(cid)
+
+
+def run_checks(
+    ctx: BotContext, readings: Readings, deliver: Callable[[BotContext, CheckResult], None]
+) -> List[CheckResult]:
+    """Run every board's check against one shared set of readings.
+
+    A failing board does not stop the others; the first error is re-raised
+    afterwards so the caller backs off as for a single check.
+    """
+    results: List[CheckResult] = []
+    first_error: Optional[Exception] = None
+    for board in ctx.each_board():
+        try:
+            results.append(run_check(board, readings[board.metric.name], lambda result: deliver(board, result)))
+        except Exception as e:  # noqa: BLE001
+            log.warning("%s check error: %s", board.metric.name, repr(e))
+            first_error = first_error or e
+    if first_error is not None:
+        raise first_error
+    return results
+
+
+def record_value(ctx: BotContext, value: float) -> None:
+    """Append a checked value to history and persist it as the last known value."""
+    if ctx.history is not None:
+        try:
+            with PERSIST_SECONDS.time(operation="history_append"):
+                ctx.history.append(time.time(), value)
+        except Exception as e:  # noqa: BLE001
+            log.warning("history write error: %s", repr(e))
+
+    # Persist global last value/zone for convenience
+    ctx.last_value = value
+    write_state(ctx.settings.state_file_path, BotState(last_zone=None, last_value=value, checks=ctx.checks))
+
+
+def flush_boards(boards: Sequence[BotContext]) -> None:
+    """Write subscriber changes still pending, e.g. after a failed write."""
+    for board in boards:
+        try:
+            board.flush_subscribers()
+        except Exception as e:  # noqa: BLE001
+            log.warning("subscriber write error: %s", repr(e))
+
+
+def downsample_history(boards: Sequence[BotContext]) -> None:
+    """Fold new history samples into the 1m/1h/1d rollups."""
+    for board in boards:
+        if board.history is None:
+            continue
+        try:
+            with PERSIST_SECONDS.time(operation="history_downsample"):
+                board.history.downsample()
+        except Exception as e:  # noqa: BLE001
+            log.warning("history downsample error: %s", repr(e))
+
+
+def add_maintenance_jobs(scheduler: Scheduler, bots: Sequence[BotContext]) -> None:
+    """Register the upkeep every runtime runs next to its checks: subscriber flushes, rollups and log rotation."""
+    boards = [board for bot in bots for board in bot.each_board()]
+    scheduler.every("flush", FLUSH_SECONDS, lambda: flush_boards(boards), delay=FLUSH_SECONDS, jitter=5.0)
+    if any(board.history is not None for board in boards):
+        scheduler.every("downsample", DOWNSAMPLE_SECONDS, lambda: downsample_history(boards))
+    scheduler.every("logs", LOG_MAINTENANCE_SECONDS, maintain_logging, delay=LOG_MAINTENANCE_SECONDS, jitter=5.0)
+
+
+def queue_alerts(ctx: BotContext, result: CheckResult) -> None:
+    """Durably queue a check's alerts for the outbox drainer.
+
+    Keys are `check:<seq>:<chat id>` (`check:<metric>:<seq>:<chat id>` for
+    boards other than the primary). If the process dies before the check is
+    recorded, the re-run check has the same number and its alerts are not
+    queued twice.
+    """
+    plan = result.plan
+    mark = ctx.check_mark
+    messages: List[Message] = [
+        (f"{mark}:{result.seq}:{cid}", cid, group.message, describe_recipient(plan, group, cid))
+        for group in plan.groups
+        for cid in group.chat_ids
+    ]
+    added = ctx.outbox.put(messages, marks={mark: result.seq})
+    if added < len(messages):
+        log.info("check %d: %d alerts were already queued", result.seq, len(messages) - added)
+
+
+def unseen_updates(ctx: BotContext, updates: List[dict]) -> List[dict]:
+    """Drop updates handled before a restart that Telegram delivered again (first batch only)."""
+    mark = ctx.update_mark
+    if mark is None or not updates:
+        return updates
+    ctx.update_mark = None
+    fresh = [u for u in updates if not (isinstance(u, dict) and isinstance(u.get("update_id"), int))
+             or u["update_id"] > mark]
+    if len(fresh) < len(updates):
+        log.info("skipped %d updates already handled before restart", len(updates) - len(fresh))
+    return fresh
+
+
+def queue_replies(
+    ctx: BotContext, updates: List[dict], replies: List[Tuple[int, str, str]], part: str = "commands"
+) -> None:
+    """Durably queue the replies to `updates` together with the highest update id handled.
+
+    Keys are `update:<last id>:<part>:<n>`; call once per `part` of a batch.
+    """
+    ids = [u["update_id"] for u in updates if isinstance(u, dict) and isinstance(u.get("update_id"), int)]
+    last = max(ids) if ids else time.time_ns()
+    ctx.outbox.put(
+        [(f"update:{last}:{part}:{i}", cid, text, note) for i, (cid, text, note) in enumerate(replies)],
+        marks={"updates": last} if ids else None,
+    )
+
+
+def loop_period_seconds(settings: Settings) -> float:
+    """Nominal length of one sync (or coordinator) loop iteration, used for health checks."""
+    wait = 1.0 if settings.updates_mode == "webhook" else 2 * settings.updates_poll_seconds
+    return wait + settings.request_timeout_seconds
+
+
+def fetch_check_readings(ctx: BotContext) -> Readings:
+    """Every metric's value for a check: reused if fetched within the cache TTL, otherwise fetched."""
+    return ctx.value_cache.get(allow_stale=False)
+
+
+def fetch_check_value(ctx: BotContext) -> float:
+    """This board's value for a dominance check (see fetch_check_readings)."""
+    return fetch_check_readings(ctx)[ctx.metric.name]
+
+
+def record_readings(ctx: BotContext, readings: Readings) -> None:
+    """record_value for every board."""
+    for board in ctx.each_board():
+        record_value(board, readings[board.metric.name])
+
+
+def apply_readings(ctx: BotContext, readings: Dict[str, Optional[float]]) -> None:
+    """Set each board's last known value (used by /value) from `readings`."""
+    for board in ctx.each_board():
+        value = readings.get(board.metric.name)
+        if value is not None:
+            board.last_value = value
+
+
+def last_readings(ctx: BotContext) -> Dict[str, Optional[float]]:
+    return {board.metric.name: board.last_value for board in ctx.each_board()}
+
+
+def next_check_delay(ctx: BotContext, error: Optional[BaseException] = None) -> float:
+    """Seconds until the next check.
+
+    A failed check is retried early with jittered backoff (honouring
+    Retry-After and open circuits) instead of sleeping inside the loop;
+    non-retryable errors wait for the regular interval.
+    """
+    interval = ctx.settings.check_interval_seconds
+    if error is None:
+        ctx.check_failures = 0
+        return interval
+    ctx.check_failures += 1
+    if not is_retryable(error):
+        return interval
+    return min(interval, ctx.retry_policy.delay(ctx.check_failures, error))
+
+
+def ensure_last_value(ctx: BotContext) -> Optional[float]:
+    """Refresh the value used by /value replies; stale cache entries are served while revalidating."""
+    try:
+        apply_readings(ctx, ctx.value_cache.get())
+    except Exception as e:  # noqa: BLE001
+        log.warning("quick fetch error for /value: %s", repr(e))
+    return ctx.last_value
+
+
+def value_reply_text(ctx: BotContext, cid: int) -> str:
+    """The primary metric, plus every other metric the chat follows."""
+    parts = []
+    for board in ctx.each_board():
+        if board is not ctx and cid not in board.subscribers:
+            continue
+        label, last_value = board.metric.label, board.last_value
+        sub = board.subscribers.get(cid) or Subscriber()
+        upper, lower = board.effective_thresholds(sub)
+        if last_value is None:
+            parts.append(f"{label} value not available. Try again shortly.")
+            continue
+        z = determine_zone(last_value, lower, upper)
+        parts.append(
+            f"{label} is {last_value:.2f}% (zone: {z})\nYour thresholds: upper={upper:.2f}%, lower={lower:.2f}%"
+        )
+    return "\n\n".join(parts)
+
+
+def answer_value_requests(ctx: BotContext, value_ids: Iterable[int], reply: Reply) -> None:
+    for cid in value_ids:
+        reply(cid, value_reply_text(ctx, cid), f"/value replied to {cid}")
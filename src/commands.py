@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Set, Tuple
+
+from src.updates import Command, parse_updates
+
+if TYPE_CHECKING:
+    from src.bot import BotContext, Reply
+
+log = logging.getLogger("src.main")
+
+UNSAVED_REPLY = "Sorry, your change could not be saved yet. It will be retried shortly; check /settings in a minute."
+
+
+@dataclass
+class CommandBatch:
+    """Per-dispatch scratch space shared by the handlers of one update batch.
+
+    Handlers mark subscribers dirty on the context instead of writing, and
+    queue replies here; the router persists once and then sends the replies,
+    so a confirmation is never sent for a change that was not stored. If the
+    write fails, chats with unsaved changes get UNSAVED_REPLY instead.
+    """
+
+    value_ids: Set[int] = field(default_factory=set)
+    replies: List[Tuple[int, str, str]] = field(default_factory=list)
+    membership_changed: bool = False
+
+    def reply(self, cid: int, text: str, note: str = "") -> None:
+        self.replies.append((cid, text, note))
+
+
+Handler = Callable[["BotContext", Command, CommandBatch], None]
+
+
+class CommandRouter:
+    """Table-driven dispatch of parsed commands to registered handlers."""
+
+    def __init__(self) -> None:
+        self._handlers: Dict[str, Handler] = {}
+
+    def command(self, *names: str) -> Callable[[Handler], Handler]:
+        def register(handler: Handler) -> Handler:
+            for name in names:
+                self._handlers[name] = handler
+            return handler
+
+        return register
+
+    @property
+    def commands(self) -> Tuple[str, ...]:
+        return tuple(self._handlers)
+
+    def dispatch(self, ctx: "BotContext", updates: Iterable[dict], reply: "Reply") -> CommandBatch:
+        """Parse `updates` once, run handlers, persist once, then send replies."""
+        batch = CommandBatch()
+        for cmd in parse_updates(updates):
+            handler = self._handlers.get(cmd.name)
+            if handler is None:
+                continue
+            try:
+                handler(ctx, cmd, batch)
+            except Exception as e:  # noqa: BLE001
+                log.warning("command error cid=%s cmd=%s args=%s err=%s", cmd.chat_id, cmd.name, cmd.args, repr(e))
+
+        unsaved: Set[int] = set()
+        for board in ctx.each_board():
+            try:
+                board.flush_subscribers()
+            except Exception as e:  # noqa: BLE001
+                # Dirty ids are kept, so the next flush retries the write
+                log.warning("subscriber write error: %s", repr(e))
+                unsaved |= board.dirty | board.removed
+        if batch.membership_changed:
+            counts = ", ".join(f"{board.metric.name}={len(board.subscribers)}" for board in ctx.each_board())
+            log.info("subscribers updated -> %s", counts)
+
+        for cid, text, note in batch.replies:
+            if cid not in unsaved:
+                reply(cid, text, note)
+        for cid in sorted(unsaved & {cid for cid, _, _ in batch.replies}):
+            reply(cid, UNSAVED_REPLY, f"unsaved change reported to {cid}")
+        return batch
@@ -1,13 +1,16 @@
 from __future__ import annotations
 import os
 from dataclasses import dataclass
-from typing import Optional
+from typing import Mapping, Optional
 
 
 @dataclass
 class Settings:
-    telegram_bot_token: str
+    telegram_bot_token: str  # empty in the hosting process when BOTS_FILE is set
+    bot_name: str  # set per bot when hosting several; empty otherwise
+    bots_file: str  # JSON list of bots to host in this process; empty = a single bot
     telegram_chat_id: Optional[str]
+    telegram_api_base: str
     upper_threshold_percent: float
     lower_threshold_percent: float
     check_interval_seconds: int
@@ -17,45 +20,137 @@ class Settings:
     subscribers_file_path: str
     log_file_path: str
     log_backup_days: int
+    log_mode: str  # 'sync' | 'queue'
+    log_format: str  # 'text' | 'json'
+    log_queue_size: int
+    log_max_bytes: int  # budget for the log file and its rotated copies; 0 = no limit
+    log_compress: bool  # gzip rotated log files
+    log_flush_seconds: float  # buffer log writes for up to this long; 0 = write every record
+    alert_workers: int
+    send_rate_per_second: float  # global Bot API send rate, split across shards; 0 = unlimited
+    send_chat_rate_per_second: float  # per-chat send rate; 0 = unlimited
+    http_pool_connections: int
+    http_pool_maxsize: int
+    runtime_mode: str  # 'sync' | 'async'
+    updates_long_poll_seconds: int
+    value_cache_ttl_seconds: float
+    value_cache_stale_seconds: float
+    history_file_path: str  # empty disables history
+    dominance_providers: str  # 'name=url#json.path;...'; empty = CoinGecko only
+    dominance_metrics: str  # 'name[=coin+coin][@upper/lower],...'; the first is the primary metric
+    retry_base_seconds: float
+    breaker_failure_threshold: int
+    breaker_reset_seconds: float
+    updates_mode: str  # 'poll' | 'webhook'
+    webhook_url: Optional[str]  # public URL passed to setWebhook; unset = register it yourself
+    webhook_listen_host: str
+    webhook_port: int
+    webhook_path: str
+    webhook_secret: Optional[str]
+    shard_count: int  # >1 runs a coordinator plus one worker process per shard
+    metrics_host: str
+    metrics_port: int  # 0 disables the /metrics and /healthz endpoint
+    health_intervals: float  # loop periods without an iteration before /healthz fails
+    subscriber_backend: str  # 'dict' | 'columnar'
+    subscriber_snapshot: bool  # binary snapshot next to the store for fast restarts
+    outbox_file_path: str
 
 
-def _get_env(name: str, default: Optional[str] = None) -> str:
-    value = os.getenv(name, default)
+def _get_env(env: Mapping[str, str], name: str, default: Optional[str] = None) -> str:
+    value = env.get(name, default)
     if value is None:
         raise RuntimeError(f"Missing required environment variable: {name}")
     return value
 
 
-def _get_env_optional(name: str, default: Optional[str] = None) -> Optional[str]:
-    return os.getenv(name, default)
+def _get_env_optional(env: Mapping[str, str], name: str, default: Optional[str] = None) -> Optional[str]:
+    return env.get(name, default)
 
 
-def load_settings() -> Settings:
-    # Optional: load from .env if present, without requiring python-dotenv at runtime
-    try:
-        from dotenv import load_dotenv  # type: ignore
+def load_settings(env: Optional[Mapping[str, str]] = None) -> Settings:
+    """Settings from `env` (default: the process environment, plus `.env` if present)."""
+    if env is None:
+        # Optional: load from .env if present, without requiring python-dotenv at runtime
+        try:
+            from dotenv import load_dotenv  # type: ignore
 
-        load_dotenv()
-    except Exception:
-        # If python-dotenv is not installed in some environments, continue
-        pass
+            load_dotenv()
+        except Exception:
+            # If python-dotenv is not installed in some environments, continue
+            pass
+        env = os.environ
 
-    telegram_bot_token = _get_env("TELEGRAM_BOT_TOKEN")
-    telegram_chat_id = _get_env_optional("TELEGRAM_CHAT_ID")
+    bots_file = _get_env(env, "BOTS_FILE", "")
+    telegram_bot_token = _get_env(env, "TELEGRAM_BOT_TOKEN", "" if bots_file else None)
+    bot_name = _get_env(env, "BOT_NAME", "")
+    telegram_chat_id = _get_env_optional(env, "TELEGRAM_CHAT_ID")
+    telegram_api_base = _get_env(env, "TELEGRAM_API_BASE", "https://api.telegram.org")
 
-    upper_threshold_percent = float(_get_env("UPPER_THRESHOLD_PERCENT", "55"))
-    lower_threshold_percent = float(_get_env("LOWER_THRESHOLD_PERCENT", "45"))
-    check_interval_seconds = int(_get_env("CHECK_INTERVAL_SECONDS", "300"))
-    request_timeout_seconds = int(_get_env("REQUEST_TIMEOUT_SECONDS", "15"))
-    updates_poll_seconds = int(_get_env("UPDATES_POLL_SECONDS", "2"))
-    state_file_path = _get_env("STATE_FILE_PATH", "/app/data/state.json")
-    subscribers_file_path = _get_env("SUBSCRIBERS_FILE_PATH", "/app/data/subscribers.json")
-    log_file_path = _get_env("LOG_FILE_PATH", "/app/data/bot.log")
-    log_backup_days = int(_get_env("LOG_BACKUP_DAYS", "365"))
+    upper_threshold_percent = float(_get_env(env, "UPPER_THRESHOLD_PERCENT", "55"))
+    lower_threshold_percent = float(_get_env(env, "LOWER_THRESHOLD_PERCENT", "45"))
+    check_interval_seconds = int(_get_env(env, "CHECK_INTERVAL_SECONDS", "300"))
+    request_timeout_seconds = int(_get_env(env, "REQUEST_TIMEOUT_SECONDS", "15"))
+    updates_poll_seconds = int(_get_env(env, "UPDATES_POLL_SECONDS", "2"))
+    state_file_path = _get_env(env, "STATE_FILE_PATH", "/app/data/state.json")
+    subscribers_file_path = _get_env(env, "SUBSCRIBERS_FILE_PATH", "/app/data/subscribers.db")
+    log_file_path = _get_env(env, "LOG_FILE_PATH", "/app/data/bot.log")
+    log_backup_days = int(_get_env(env, "LOG_BACKUP_DAYS", "365"))
+    log_mode = _get_env(env, "LOG_MODE", "sync").strip().lower()
+    if log_mode not in ("sync", "queue"):
+        raise RuntimeError(f"Invalid LOG_MODE: {log_mode} (expected 'sync' or 'queue')")
+    log_format = _get_env(env, "LOG_FORMAT", "text").strip().lower()
+    if log_format not in ("text", "json"):
+        raise RuntimeError(f"Invalid LOG_FORMAT: {log_format} (expected 'text' or 'json')")
+    log_queue_size = int(_get_env(env, "LOG_QUEUE_SIZE", "10000"))
+    log_max_bytes = int(float(_get_env(env, "LOG_MAX_MB", "0")) * 1024 * 1024)
+    log_compress = _get_env(env, "LOG_COMPRESS", "0").strip().lower() not in ("0", "false", "no", "off")
+    log_flush_seconds = float(_get_env(env, "LOG_FLUSH_SECONDS", "0"))
+    alert_workers = int(_get_env(env, "ALERT_WORKERS", "16"))
+    send_rate_per_second = float(_get_env(env, "SEND_RATE_PER_SECOND", "30"))
+    send_chat_rate_per_second = float(_get_env(env, "SEND_CHAT_RATE_PER_SECOND", "1"))
+    http_pool_connections = int(_get_env(env, "HTTP_POOL_CONNECTIONS", "4"))
+    # Senders plus the update poll and the dominance fetch, which run alongside them
+    http_pool_maxsize = int(_get_env(env, "HTTP_POOL_MAXSIZE", str(max(alert_workers + 2, 4))))
+    runtime_mode = _get_env(env, "RUNTIME_MODE", "sync").strip().lower()
+    if runtime_mode not in ("sync", "async"):
+        raise RuntimeError(f"Invalid RUNTIME_MODE: {runtime_mode} (expected 'sync' or 'async')")
+    updates_long_poll_seconds = int(_get_env(env, "UPDATES_LONG_POLL_SECONDS", "50"))
+    value_cache_ttl_seconds = float(_get_env(env, "VALUE_CACHE_TTL_SECONDS", "30"))
+    value_cache_stale_seconds = float(_get_env(env, "VALUE_CACHE_STALE_SECONDS", "60"))
+    history_file_path = _get_env(env, "HISTORY_FILE_PATH", "/app/data/history.bin")
+    dominance_providers = _get_env(env, "DOMINANCE_PROVIDERS", "")
+    dominance_metrics = _get_env(env, "DOMINANCE_METRICS", "btc")
+    retry_base_seconds = float(_get_env(env, "RETRY_BASE_SECONDS", "5"))
+    breaker_failure_threshold = int(_get_env(env, "BREAKER_FAILURE_THRESHOLD", "3"))
+    breaker_reset_seconds = float(_get_env(env, "BREAKER_RESET_SECONDS", "60"))
+    updates_mode = _get_env(env, "UPDATES_MODE", "poll").strip().lower()
+    if updates_mode not in ("poll", "webhook"):
+        raise RuntimeError(f"Invalid UPDATES_MODE: {updates_mode} (expected 'poll' or 'webhook')")
+    webhook_url = _get_env_optional(env, "WEBHOOK_URL") or None
+    webhook_listen_host = _get_env(env, "WEBHOOK_LISTEN_HOST", "0.0.0.0")
+    webhook_port = int(_get_env(env, "WEBHOOK_PORT", "8443"))
+    webhook_path = _get_env(env, "WEBHOOK_PATH", "/telegram")
+    webhook_secret = _get_env_optional(env, "WEBHOOK_SECRET") or None
+    if updates_mode == "webhook" and not webhook_secret:
+        raise RuntimeError("WEBHOOK_SECRET is required when UPDATES_MODE=webhook")
+    shard_count = max(1, int(_get_env(env, "SHARD_COUNT", "1")))
+    if bots_file and shard_count > 1:
+        raise RuntimeError("SHARD_COUNT > 1 is not supported together with BOTS_FILE")
+    metrics_host = _get_env(env, "METRICS_HOST", "127.0.0.1")
+    metrics_port = int(_get_env(env, "METRICS_PORT", "0") or 0)
+    health_intervals = float(_get_env(env, "HEALTH_INTERVALS", "3"))
+    subscriber_backend = _get_env(env, "SUBSCRIBER_BACKEND", "dict").strip().lower()
+    if subscriber_backend not in ("dict", "columnar"):
+        raise RuntimeError(f"Invalid SUBSCRIBER_BACKEND: {subscriber_backend} (expected 'dict' or 'columnar')")
+    subscriber_snapshot = _get_env(env, "SUBSCRIBER_SNAPSHOT", "1").strip().lower() not in ("0", "false", "no", "off")
+    outbox_file_path = _get_env(env, "OUTBOX_FILE_PATH", "/app/data/outbox.jsonl")
 
     return Settings(
         telegram_bot_token=telegram_bot_token,
+        bot_name=bot_name,
+        bots_file=bots_file,
         telegram_chat_id=telegram_chat_id,
+        telegram_api_base=telegram_api_base,
         upper_threshold_percent=upper_threshold_percent,
         lower_threshold_percent=lower_threshold_percent,
         check_interval_seconds=check_interval_seconds,
@@ -65,6 +160,40 @@ def load_settings() -> Settings:
         subscribers_file_path=subscribers_file_path,
         log_file_path=log_file_path,
         log_backup_days=log_backup_days,
+        log_mode=log_mode,
+        log_format=log_format,
+        log_queue_size=log_queue_size,
+        log_max_bytes=log_max_bytes,
+        log_compress=log_compress,
+        log_flush_seconds=log_flush_seconds,
+        alert_workers=alert_workers,
+        send_rate_per_second=send_rate_per_second,
+        send_chat_rate_per_second=send_chat_rate_per_second,
+        http_pool_connections=http_pool_connections,
+        http_pool_maxsize=http_pool_maxsize,
+        runtime_mode=runtime_mode,
+        updates_long_poll_seconds=updates_long_poll_seconds,
+        value_cache_ttl_seconds=value_cache_ttl_seconds,
+        value_cache_stale_seconds=value_cache_stale_seconds,
+        history_file_path=history_file_path,
+        dominance_providers=dominance_providers,
+        dominance_metrics=dominance_metrics,
+        retry_base_seconds=retry_base_seconds,
+        breaker_failure_threshold=breaker_failure_threshold,
+        breaker_reset_seconds=breaker_reset_seconds,
+        updates_mode=updates_mode,
+        webhook_url=webhook_url,
+        webhook_listen_host=webhook_listen_host,
+        webhook_port=webhook_port,
+        webhook_path=webhook_path,
+        webhook_secret=webhook_secret,
+        shard_count=shard_count,
+        metrics_host=metrics_host,
+        metrics_port=metrics_port,
+        health_intervals=health_intervals,
+        subscriber_backend=subscriber_backend,
+        subscriber_snapshot=subscriber_snapshot,
+        outbox_file_path=outbox_file_path,
     )
 
 
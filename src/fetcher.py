@@ -1,51 +1,338 @@
 from __future__ import annotations
 
+import re
+import threading
 import time
-from typing import Callable, TypeVar
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple, TypeVar
 
 import requests
 
+from src.http_session import get_session
+from src.metrics import FETCH_SECONDS
+from src.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+
 T = TypeVar("T")
 
+# Metric name -> value, all read from one provider response
+Readings = Dict[str, float]
+
 
 class FetchError(Exception):
     pass
 
 
 def with_retries(operation: Callable[[], T], attempts: int = 3, backoff_seconds: float = 1.5) -> T:
-    last_error: Exception | None = None
-    for attempt in range(1, attempts + 1):
-        try:
-            return operation()
-        except Exception as error:  # noqa: BLE001 - propagate as FetchError after retries
-            last_error = error
-            if attempt < attempts:
-                time.sleep(backoff_seconds * attempt)
-    raise FetchError(str(last_error) if last_error else "Unknown fetch error")
+    """Blocking retry helper for standalone use; the bot loop reschedules instead of sleeping.
+
+    Only retryable errors are retried (see resilience.is_retryable), with
+    jittered exponential backoff that honours Retry-After.
+    """
+    policy = RetryPolicy(attempts=attempts, base_delay=backoff_seconds)
+    try:
+        return policy.call(operation)
+    except FetchError:
+        raise
+    except Exception as error:  # noqa: BLE001 - surfaced as FetchError
+        raise FetchError(str(error)) from error
 
 
-def fetch_btc_dominance_percent(timeout_seconds: int) -> float:
-    """Fetch Bitcoin dominance percentage using CoinGecko global endpoint.
+@dataclass(frozen=True)
+class Provider:
+    """A dominance source: GET `url` and read a number at dotted JSON `path`.
 
-    API: https://api.coingecko.com/api/v3/global
-    Response contains: data.market_cap_percentage.bitcoin (e.g., 52.34)
+    `path` may list alternatives separated by '|'; the first present one wins.
+    A `{coin}` placeholder is replaced by each coin a metric needs, so one
+    response serves every metric; a path without it serves a single metric.
+    `{long_name}` is the coin's full name (`bitcoin` for `btc`), for
+    responses keyed that way.
+    """
+
+    name: str
+    url: str
+    path: str
+
+
+COINGECKO = Provider(
+    name="coingecko",
+    url="https://api.coingecko.com/api/v3/global",
+    path="data.market_cap_percentage.{coin}|data.market_cap_percentage.{long_name}",
+)
+
+# Full names of common coins, for `{long_name}`; other coins use their symbol
+COIN_NAMES = {"btc": "bitcoin", "eth": "ethereum", "usdt": "tether", "usdc": "usd-coin", "bnb": "binancecoin"}
+
+
+@dataclass(frozen=True)
+class Metric:
+    """A dominance metric: the summed market-cap share of `coins`.
+
+    `upper`/`lower` are its default thresholds (None = the global ones).
     """
 
-    def _request() -> float:
-        response = requests.get(
-            "https://api.coingecko.com/api/v3/global",
-            timeout=timeout_seconds,
-            headers={"Accept": "application/json", "User-Agent": "btc-dominance-bot/1.0"},
+    name: str
+    coins: Tuple[str, ...]
+    upper: Optional[float] = None
+    lower: Optional[float] = None
+
+    @property
+    def label(self) -> str:
+        return f"{self.name.upper()} dominance"
+
+
+BTC = Metric("btc", ("btc",))
+
+_METRIC_RE = re.compile(r"^([a-z0-9_]+)(?:=([a-z0-9_]+(?:\+[a-z0-9_]+)*))?(?:@([\d.]+)/([\d.]+))?$")
+
+
+def parse_metrics(spec: str) -> List[Metric]:
+    """Parse `name[=coin+coin][@upper/lower],...`; the first metric is the primary one.
+
+    e.g. `btc,eth@20/10,stables=usdt+usdc@9/6`. An empty spec means BTC only.
+    """
+    metrics: List[Metric] = []
+    for entry in filter(None, (part.strip().lower() for part in spec.split(","))):
+        match = _METRIC_RE.match(entry)
+        if not match:
+            raise ValueError(f"Invalid metric spec {entry!r}, expected name[=coin+coin][@upper/lower]")
+        name, coins, upper, lower = match.groups()
+        metric = Metric(
+            name,
+            tuple((coins or name).split("+")),
+            float(upper) if upper else None,
+            float(lower) if lower else None,
+        )
+        if metric.upper is not None and metric.lower is not None and metric.lower >= metric.upper:
+            raise ValueError(f"Metric {name!r}: lower must be less than upper")
+        if any(m.name == name for m in metrics):
+            raise ValueError(f"Metric {name!r} is listed twice")
+        metrics.append(metric)
+    return metrics or [BTC]
+
+
+def parse_providers(spec: str) -> List[Provider]:
+    """Parse `name=url#path;name=url#path`; an empty spec means CoinGecko only."""
+    providers: List[Provider] = []
+    for entry in filter(None, (part.strip() for part in spec.split(";"))):
+        name, sep, rest = entry.partition("=")
+        url, sep2, path = rest.rpartition("#")
+        if not (sep and sep2 and name.strip() and url.strip() and path.strip()):
+            raise ValueError(f"Invalid provider spec {entry!r}, expected name=url#json.path")
+        providers.append(Provider(name.strip(), url.strip(), path.strip()))
+    return providers or [COINGECKO]
+
+
+def extract_json_path(payload: object, path: str) -> float:
+    for alternative in path.split("|"):
+        node = payload
+        for key in alternative.split("."):
+            if isinstance(node, dict):
+                node = node.get(key)
+            elif isinstance(node, list) and key.isdigit() and int(key) < len(node):
+                node = node[int(key)]
+            else:
+                node = None
+            if node is None:
+                break
+        if node is not None:
+            return float(node)
+    raise FetchError(f"Value not found at {path!r} in response")
+
+
+def read_metrics(payload: object, provider: Provider, metrics: List[Metric]) -> Readings:
+    """Every metric's value from one response; missing or out-of-range values fail the whole reading."""
+    readings: Readings = {}
+    for metric in metrics:
+        if "{coin}" in provider.path:
+            value = sum(
+                extract_json_path(payload, provider.path.format(coin=coin, long_name=COIN_NAMES.get(coin, coin)))
+                for coin in metric.coins
+            )
+        elif len(metrics) == 1:
+            value = extract_json_path(payload, provider.path)
+        else:
+            raise FetchError(f"{provider.name} path has no {{coin}} placeholder and serves a single metric")
+        if not (0 < value <= 100):
+            raise FetchError(f"{provider.name} returned out-of-range {metric.name} dominance {value}")
+        readings[metric.name] = value
+    return readings
+
+
+def fetch_readings(
+    provider: Provider,
+    metrics: List[Metric],
+    timeout_seconds: float,
+    session: Optional[requests.Session] = None,
+) -> Readings:
+    with FETCH_SECONDS.time(provider=provider.name):
+        response = (session or get_session()).get(
+            provider.url, timeout=timeout_seconds, headers={"Accept": "application/json"}
         )
         response.raise_for_status()
-        payload = response.json()
-        data = payload.get("data") or {}
-        market_caps = data.get("market_cap_percentage") or {}
-        btc = market_caps.get("btc") or market_caps.get("bitcoin")
-        if btc is None:
-            raise FetchError("BTC dominance not found in response")
-        return float(btc)
+        return read_metrics(response.json(), provider, metrics)
+
+
+def fetch_from_provider(provider: Provider, timeout_seconds: float, session: Optional[requests.Session] = None) -> float:
+    return fetch_readings(provider, [BTC], timeout_seconds, session)[BTC.name]
+
+
+def fetch_btc_dominance_percent(timeout_seconds: int, session: Optional[requests.Session] = None) -> float:
+    """Fetch Bitcoin dominance percentage using CoinGecko global endpoint.
+
+    API: https://api.coingecko.com/api/v3/global
+    Response contains: data.market_cap_percentage.btc (e.g., 52.34), or .bitcoin
+    Uses the shared keep-alive session unless `session` is given.
+    """
+    return with_retries(lambda: fetch_from_provider(COINGECKO, timeout_seconds, session))
+
+
+class ProviderStats:
+    """Rolling latency and error history for one provider."""
+
+    def __init__(self, window: int = 50) -> None:
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self._latencies.append(latency)
+            self._outcomes.append(ok)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < 5:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return self._outcomes.count(False) / len(self._outcomes)
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            samples = len(self._outcomes)
+        return {"samples": samples, "p95": self.p95(), "error_rate": self.error_rate()}
+
+
+class HedgedFetcher:
+    """Fetch every metric from the best provider, hedging to the next one when slow.
+
+    Providers are ordered by observed p95 latency weighted by recent error
+    rate (configured order breaks ties). The first request goes to the best
+    provider; if it has not answered within that provider's p95 (or
+    `default_hedge_seconds` until enough samples exist), the next provider is
+    asked too, and so on. A failure hedges immediately. The first valid
+    answer wins; slower requests finish in the background and still feed the
+    stats. Each provider has a circuit breaker; open providers are skipped,
+    and when all are open the fetch fails fast with CircuitOpenError.
+    """
+
+    def __init__(
+        self,
+        providers: List[Provider],
+        timeout_seconds: float,
+        session: Optional[requests.Session] = None,
+        default_hedge_seconds: float = 1.5,
+        min_hedge_seconds: float = 0.1,
+        breaker_threshold: int = 5,
+        breaker_reset_seconds: float = 60.0,
+        metrics: Optional[List[Metric]] = None,
+    ) -> None:
+        if not providers:
+            raise ValueError("At least one provider is required")
+        self.metrics = list(metrics or [BTC])
+        if len(self.metrics) > 1:
+            single = [p.name for p in providers if "{coin}" not in p.path]
+            if single:
+                raise ValueError(f"Providers {single} need a {{coin}} placeholder in their path for several metrics")
+        self.providers = list(providers)
+        self.timeout_seconds = timeout_seconds
+        self.default_hedge_seconds = default_hedge_seconds
+        self.min_hedge_seconds = min_hedge_seconds
+        self._session = session
+        self.stats: Dict[str, ProviderStats] = {p.name: ProviderStats() for p in self.providers}
+        self.breakers: Dict[str, CircuitBreaker] = {
+            p.name: CircuitBreaker(p.name, breaker_threshold, breaker_reset_seconds) for p in self.providers
+        }
+        self._pool = ThreadPoolExecutor(max_workers=2 * len(self.providers), thread_name_prefix="provider")
+
+    def _hedge_delay(self, provider: Provider) -> float:
+        p95 = self.stats[provider.name].p95()
+        if p95 is None:
+            return self.default_hedge_seconds
+        return min(max(p95, self.min_hedge_seconds), self.timeout_seconds)
+
+    def ordered(self) -> List[Provider]:
+        def score(item: Tuple[int, Provider]) -> Tuple[float, int]:
+            position, provider = item
+            stats = self.stats[provider.name]
+            latency = stats.p95()
+            if latency is None:
+                latency = self.default_hedge_seconds
+            return latency * (1.0 + 4.0 * stats.error_rate()), position
+
+        return [p for _, p in sorted(enumerate(self.providers), key=score)]
+
+    def _timed(self, provider: Provider) -> Readings:
+        started = time.monotonic()
+        try:
+            value = fetch_readings(provider, self.metrics, self.timeout_seconds, self._session)
+        except Exception as error:
+            self.stats[provider.name].record(time.monotonic() - started, False)
+            self.breakers[provider.name].record_failure(error)
+            raise
+        self.stats[provider.name].record(time.monotonic() - started, True)
+        self.breakers[provider.name].record_success()
+        return value
+
+    def fetch(self) -> Readings:
+        queue = self.ordered()
+        pending: Dict[Future, Provider] = {}
+        errors: List[str] = []
+        last_error: Optional[BaseException] = None
+        deadline = time.monotonic() + self.timeout_seconds
 
-    return with_retries(_request)
+        skipped: List[CircuitOpenError] = []
 
+        def launch() -> Optional[Provider]:
+            while queue:
+                provider = queue.pop(0)
+                try:
+                    self.breakers[provider.name].before_call()
+                except CircuitOpenError as open_error:
+                    skipped.append(open_error)
+                    continue
+                pending[self._pool.submit(self._timed, provider)] = provider
+                return provider
+            return None
 
+        last = launch()
+        if last is None:
+            soonest = min(skipped, key=lambda e: e.retry_in)
+            raise CircuitOpenError("all providers", soonest.retry_in)
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait_for = min(self._hedge_delay(last), remaining) if queue and last else remaining
+            done, _ = wait(list(pending), timeout=wait_for, return_when=FIRST_COMPLETED)
+            if not done:
+                last = launch() or last  # hedge: the current best is slower than usual
+                continue
+            for future in done:
+                provider = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    return future.result()
+                errors.append(f"{provider.name}: {error}")
+                last_error = error
+            if queue:
+                last = launch()
+        raise FetchError("All providers failed: " + ("; ".join(errors) or "timed out")) from last_error
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Raw samples: (unix timestamp, value) as little-endian doubles
+SAMPLE = struct.Struct("<dd")
+# Downsampled buckets: (bucket start, min, max, sum, count)
+BUCKET = struct.Struct("<ddddq")
+
+TIERS: Dict[str, int] = {"1m": 60, "1h": 3600, "1d": 86400}
+
+
+class Bucket(NamedTuple):
+    ts: float
+    min: float
+    max: float
+    mean: float
+    count: int
+
+
+class _RecordFile:
+    """Append-only file of fixed-size records, read through mmap."""
+
+    def __init__(self, path: str, record: struct.Struct) -> None:
+        self.path = path
+        self.record = record
+
+    def __len__(self) -> int:
+        try:
+            return os.path.getsize(self.path) // self.record.size
+        except FileNotFoundError:
+            return 0
+
+    def append(self, *fields: float) -> None:
+        with open(self.path, "ab") as f:
+            # Drop a torn trailing record left by a crash so records stay aligned
+            extra = f.tell() % self.record.size
+            if extra:
+                f.truncate(f.tell() - extra)
+            f.write(self.record.pack(*fields))
+
+    def write_from(self, index: int, rows: List[Tuple[float, ...]]) -> None:
+        """Replace records from `index` onwards with `rows`."""
+        mode = "r+b" if os.path.exists(self.path) else "w+b"
+        with open(self.path, mode) as f:
+            f.truncate(index * self.record.size)
+            f.seek(index * self.record.size)
+            f.write(b"".join(self.record.pack(*row) for row in rows))
+
+    def map(self) -> Optional[mmap.mmap]:
+        size = len(self) * self.record.size
+        if size == 0:
+            return None
+        with open(self.path, "rb") as f:
+            return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+
+def _lower_bound(buf: mmap.mmap, record: struct.Struct, count: int, ts: float) -> int:
+    """Index of the first record whose leading timestamp is >= ts."""
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if record.unpack_from(buf, mid * record.size)[0] < ts:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _read_range(buf: mmap.mmap, record: struct.Struct, count: int, start: float, end: float) -> List[tuple]:
+    first = _lower_bound(buf, record, count, start)
+    last = _lower_bound(buf, record, count, end)
+    return [record.unpack_from(buf, i * record.size) for i in range(first, last)]
+
+
+class HistoryStore:
+    """Dominance history in a fixed-record binary file plus 1m/1h/1d rollups.
+
+    `append` is O(1). Range queries binary-search the memory-mapped file by
+    timestamp. `downsample` folds new raw samples into the rollup files
+    incrementally, re-aggregating only the last open bucket of each tier.
+    Samples must be appended in time order.
+    """
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._raw = _RecordFile(path, SAMPLE)
+        self._tiers = {name: _RecordFile(f"{path}.{name}", BUCKET) for name in TIERS}
+
+    def __len__(self) -> int:
+        return len(self._raw)
+
+    def append(self, ts: float, value: float) -> None:
+        with self._lock:
+            self._raw.append(ts, value)
+
+    def samples(self, start: float, end: float) -> List[Tuple[float, float]]:
+        """Raw (ts, value) samples with start <= ts < end."""
+        with self._lock:
+            buf = self._raw.map()
+            if buf is None:
+                return []
+            with buf:
+                return _read_range(buf, SAMPLE, len(buf) // SAMPLE.size, start, end)
+
+    def buckets(self, tier: str, start: float, end: float) -> List[Bucket]:
+        """Rollup buckets of `tier` whose start lies in [start, end)."""
+        with self._lock:
+            buf = self._tiers[tier].map()
+            if buf is None:
+                return []
+            with buf:
+                rows = _read_range(buf, BUCKET, len(buf) // BUCKET.size, start, end)
+        return [Bucket(ts, lo, hi, total / count, int(count)) for ts, lo, hi, total, count in rows]
+
+    def query(self, start: float, end: float, max_points: int = 500) -> List[Tuple[float, float]]:
+        """(ts, value) points for [start, end) from the finest tier that fits in `max_points`."""
+        return [(b.ts, b.mean) for b in self.query_buckets(start, end, max_points)]
+
+    def query_buckets(self, start: float, end: float, max_points: int = 500) -> List[Bucket]:
+        """Like `query`, but whole buckets, so a range's extremes come from their min/max.
+
+        Raw samples are returned as single-sample buckets.
+        """
+        span = max(0.0, end - start)
+        if span <= 0:
+            return []
+        with self._lock:
+            buf = self._raw.map()
+            if buf is None:
+                return []
+            with buf:
+                count = len(buf) // SAMPLE.size
+                first = _lower_bound(buf, SAMPLE, count, start)
+                last = _lower_bound(buf, SAMPLE, count, end)
+                if last - first <= max_points:
+                    samples = [SAMPLE.unpack_from(buf, i * SAMPLE.size) for i in range(first, last)]
+                    return [Bucket(ts, value, value, value, 1) for ts, value in samples]
+        for tier, width in TIERS.items():
+            if span / width <= max_points:
+                return self.buckets(tier, start, end)
+        return self.buckets("1d", start, end)
+
+    def latest(self) -> Optional[Tuple[float, float]]:
+        with self._lock:
+            buf = self._raw.map()
+            if buf is None:
+                return None
+            with buf:
+                count = len(buf) // SAMPLE.size
+                return SAMPLE.unpack_from(buf, (count - 1) * SAMPLE.size)
+
+    def downsample(self) -> None:
+        """Bring every rollup tier up to date with the raw samples."""
+        with self._lock:
+            raw = self._raw.map()
+            if raw is None:
+                return
+            with raw:
+                count = len(raw) // SAMPLE.size
+                for name, width in TIERS.items():
+                    self._downsample_tier(raw, count, self._tiers[name], width)
+
+    def _downsample_tier(self, raw: mmap.mmap, count: int, tier: _RecordFile, width: int) -> None:
+        existing = len(tier)
+        if existing:
+            with open(tier.path, "rb") as f:
+                f.seek((existing - 1) * BUCKET.size)
+                last_bucket_ts = BUCKET.unpack(f.read(BUCKET.size))[0]
+            # Re-aggregate the last (possibly still open) bucket
+            first = _lower_bound(raw, SAMPLE, count, last_bucket_ts)
+            keep = existing - 1
+        else:
+            first, keep = 0, 0
+        if first >= count:
+            return
+
+        rows: List[Tuple[float, ...]] = []
+        bucket_ts: Optional[float] = None
+        lo = hi = total = 0.0
+        n = 0
+        for i in range(first, count):
+            ts, value = SAMPLE.unpack_from(raw, i * SAMPLE.size)
+            b = ts - (ts % width)
+            if b != bucket_ts:
+                if bucket_ts is not None:
+                    rows.append((bucket_ts, lo, hi, total, n))
+                bucket_ts, lo, hi, total, n = b, value, value, 0.0, 0
+            lo = min(lo, value)
+            hi = max(hi, value)
+            total += value
+            n += 1
+        rows.append((bucket_ts, lo, hi, total, n))
+        tier.write_from(keep, rows)
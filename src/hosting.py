@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, List, Mapping, Optional
+
+from src.bot import BotContext, board_settings, load_boards, named_path, save_snapshot
+from src.config import Settings, load_settings
+from src.http_session import close_session, configure_session
+from src.metrics import STARTUP
+from src.sharding import prepare_shards
+from src.subscribers import close_stores
+from src.webhook import WebhookReceiver
+
+log = logging.getLogger("src.main")
+
+_NAME_RE = re.compile(r"^[a-z0-9_-]+$")
+_DRAIN_SECONDS = 5.0
+
+# Variables a bot entry may set for itself. Everything else (providers, metrics,
+# check interval, runtime, logging, HTTP pools, /metrics) is shared by the process.
+BOT_KEYS = frozenset(
+    {
+        "TELEGRAM_CHAT_ID",
+        "UPPER_THRESHOLD_PERCENT",
+        "LOWER_THRESHOLD_PERCENT",
+        "SUBSCRIBERS_FILE_PATH",
+        "STATE_FILE_PATH",
+        "OUTBOX_FILE_PATH",
+        "HISTORY_FILE_PATH",
+        "SUBSCRIBER_BACKEND",
+        "SUBSCRIBER_SNAPSHOT",
+        "ALERT_WORKERS",
+        "SEND_RATE_PER_SECOND",
+        "SEND_CHAT_RATE_PER_SECOND",
+        "UPDATES_MODE",
+        "UPDATES_LONG_POLL_SECONDS",
+        "WEBHOOK_URL",
+        "WEBHOOK_LISTEN_HOST",
+        "WEBHOOK_PORT",
+        "WEBHOOK_PATH",
+        "WEBHOOK_SECRET",
+    }
+)
+
+
+def read_bots_file(path: str) -> List[Dict[str, str]]:
+    """Parse BOTS_FILE: a JSON list of `{"name": ..., "token": ..., "<VARIABLE>": <value>, ...}`."""
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    if not isinstance(entries, list) or not entries:
+        raise RuntimeError(f"{path}: expected a non-empty JSON list of bots")
+    bots: List[Dict[str, str]] = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise RuntimeError(f"{path}: each bot must be a JSON object")
+        name = str(entry.get("name", "")).strip().lower()
+        if not _NAME_RE.match(name) or not str(entry.get("token", "")).strip():
+            raise RuntimeError(f"{path}: each bot needs a name (a-z, 0-9, '_', '-') and a token")
+        if any(bot["name"] == name for bot in bots):
+            raise RuntimeError(f"{path}: bot {name!r} is listed twice")
+        unknown = sorted(set(entry) - {"name", "token"} - BOT_KEYS)
+        if unknown:
+            raise RuntimeError(f"{path}: bot {name!r} cannot set {unknown}; they are shared by all bots")
+        bot = {key: str(value).strip() for key, value in entry.items()}
+        bot["name"] = name
+        bots.append(bot)
+    return bots
+
+
+def bot_settings(settings: Settings, entry: Mapping[str, str]) -> Settings:
+    """A hosted bot's settings: the process settings with its token, files named after it and its own variables.
+
+    e.g. bot `alts` keeps subscribers in `subscribers.alts.db` next to SUBSCRIBERS_FILE_PATH.
+    """
+    name = entry["name"]
+    env = dict(os.environ)
+    env.update(
+        TELEGRAM_BOT_TOKEN=entry["token"],
+        BOT_NAME=name,
+        BOTS_FILE="",
+        SUBSCRIBERS_FILE_PATH=named_path(settings.subscribers_file_path, name),
+        STATE_FILE_PATH=named_path(settings.state_file_path, name),
+        OUTBOX_FILE_PATH=named_path(settings.outbox_file_path, name),
+        HISTORY_FILE_PATH=named_path(settings.history_file_path, name) if settings.history_file_path else "",
+    )
+    env.update({key: value for key, value in entry.items() if key not in ("name", "token")})
+    return load_settings(env)
+
+
+def load_bots(settings: Settings) -> List[BotContext]:
+    """Load every bot of BOTS_FILE; all of them share the first one's fetcher and value cache."""
+    bots: List[BotContext] = []
+    for entry in read_bots_file(settings.bots_file):
+        own = bot_settings(settings, entry)
+        for _, board in board_settings(own):
+            prepare_shards(board.subscribers_file_path, 1)
+        bots.append(load_boards(own, feed=bots[0] if bots else None))
+    return bots
+
+
+def run_hosting(settings: Settings) -> None:
+    """Host every bot of BOTS_FILE in this process until SIGINT/SIGTERM.
+
+    Each bot has its own update consumer, outbox and sender pool; the
+    dominance fetch (once per interval) and the HTTP connection pool are shared.
+    """
+    import asyncio
+
+    from src.async_runtime import run_bots
+    from src.main import clear_webhook, start_drainer, start_metrics_server, start_webhook
+
+    bots = load_bots(settings)
+    # Room for every bot's senders plus one update poll each and the dominance fetch
+    needed = sum(bot.settings.alert_workers for bot in bots) + len(bots) + 1
+    configure_session(settings.http_pool_connections, max(settings.http_pool_maxsize, needed))
+    STARTUP.phase("context")
+
+    metrics_server = start_metrics_server(settings)
+    drainers = [start_drainer(bot.settings, bot.outbox) for bot in bots]
+    receivers: List[Optional[WebhookReceiver]] = [
+        start_webhook(bot.settings) if bot.settings.updates_mode == "webhook" else None for bot in bots
+    ]
+    for bot, receiver in zip(bots, receivers):
+        if receiver is None:
+            clear_webhook(bot.settings)
+    STARTUP.phase("services")
+    log.info("hosting %d bots: %s", len(bots), ", ".join(bot.settings.bot_name for bot in bots))
+
+    asyncio.run(run_bots(list(zip(bots, receivers))))
+
+    log.info("shutting down")
+    for receiver in receivers:
+        if receiver is not None:
+            receiver.stop()
+    # The drainers keep sending while earlier ones are stopped, so they share one deadline
+    deadline = time.monotonic() + _DRAIN_SECONDS
+    for drainer in drainers:
+        drainer.stop(max(0.0, deadline - time.monotonic()))
+    for bot in bots:
+        bot.outbox.close()
+    if metrics_server is not None:
+        metrics_server.stop()
+    close_session()
+    close_stores()
+    for bot in bots:
+        save_snapshot(bot)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = "btc-dominance-bot/1.0"
+TELEGRAM_API_BASE = "https://api.telegram.org"
+
+_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_pool_connections = 4
+_pool_maxsize = 16
+_telegram_api_base = TELEGRAM_API_BASE
+
+
+def build_session(pool_connections: int = 4, pool_maxsize: int = 16) -> requests.Session:
+    """Create a keep-alive session with per-host connection pools.
+
+    `pool_connections` is how many hosts keep a pool; `pool_maxsize` is how many
+    idle connections each host pool retains (should cover ALERT_WORKERS).
+    Retries are handled by callers, so the adapter never retries on its own.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"User-Agent": USER_AGENT, "Connection": "keep-alive"})
+    return session
+
+
+def configure_session(pool_connections: int, pool_maxsize: int) -> None:
+    """Set pool sizes for the shared session, replacing any existing one."""
+    global _pool_connections, _pool_maxsize
+    with _lock:
+        _pool_connections = pool_connections
+        _pool_maxsize = pool_maxsize
+        _replace(None)
+
+
+def set_telegram_api_base(base: str) -> None:
+    """Point Bot API calls at another server, e.g. a local stand-in for benchmarks."""
+    global _telegram_api_base
+    _telegram_api_base = (base or TELEGRAM_API_BASE).rstrip("/")
+
+
+def telegram_url(bot_token: str, method: str) -> str:
+    return f"{_telegram_api_base}/bot{bot_token}/{method}"
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide session, creating it on first use."""
+    global _session
+    session = _session
+    if session is not None:
+        return session
+    with _lock:
+        if _session is None:
+            _session = build_session(_pool_connections, _pool_maxsize)
+        return _session
+
+
+def set_session(session: Optional[requests.Session]) -> None:
+    """Inject a session (e.g. a stub in tests); None resets to the default."""
+    with _lock:
+        _replace(session)
+
+
+def close_session() -> None:
+    with _lock:
+        _replace(None)
+
+
+def _replace(session: Optional[requests.Session]) -> None:
+    global _session
+    old = _session
+    _session = session
+    if old is not None and old is not session:
+        try:
+            old.close()
+        except Exception:
+            pass
@@ -1,11 +1,304 @@
 from __future__ import annotations
 
+import contextlib
+import copy
+import gzip
+import json
 import logging
 import os
-from logging.handlers import TimedRotatingFileHandler
+import queue
+import re
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from typing import Dict, List, Optional, Tuple
 
+from src.metrics import LOG_RECORDS_DROPPED
 
-def setup_logging(log_file_path: str, backup_days: int) -> None:
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(message)s"
+
+# Attributes every LogRecord has; anything else was passed with `extra=` and goes into JSON output
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_EXC_FORMATTER = logging.Formatter()
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, any `extra=` fields and exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler that never stalls the logging thread for long.
+
+    When the queue is full, records below WARNING are dropped and counted;
+    warnings and errors wait up to `block_seconds` for room. Drops are
+    reported by a single summary record once the queue has room again.
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]", block_seconds: float = 0.5) -> None:
+        super().__init__(log_queue)
+        self.block_seconds = block_seconds
+        self._dropped: Dict[str, int] = {}
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike QueueHandler.prepare, keep the traceback out of msg so the writer's formatter places it
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _EXC_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self._dropped:
+            self._report_drops()
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if record.levelno >= logging.WARNING:
+            try:
+                self.queue.put(record, timeout=self.block_seconds)
+                return
+            except queue.Full:
+                pass
+        with self._dropped_lock:
+            self._dropped[record.levelname] = self._dropped.get(record.levelname, 0) + 1
+        LOG_RECORDS_DROPPED.inc(level=record.levelname)
+
+    def _report_drops(self) -> None:
+        with self._dropped_lock:
+            dropped, self._dropped = self._dropped, {}
+        counts = ", ".join(f"{level}={count}" for level, count in sorted(dropped.items()))
+        summary = logging.LogRecord(
+            "src.logging_setup", logging.WARNING, __file__, 0, "log queue full, dropped records: %s", (counts,), None
+        )
+        try:
+            self.queue.put_nowait(summary)
+        except queue.Full:
+            with self._dropped_lock:
+                for level, count in dropped.items():
+                    self._dropped[level] = self._dropped.get(level, 0) + count
+
+
+class CompressingFileHandler(TimedRotatingFileHandler):
+    """Daily rotating log file with gzip, an age and a size budget, and batched writes.
+
+    Rotated files are gzipped by a background thread, which then deletes
+    those older than `backup_days` and, oldest first, as many as needed to
+    keep the log and its backups within `max_bytes` (0: no size limit). The
+    active file is also rotated early once it holds a quarter of that budget.
+
+    With `flush_seconds` > 0 records are buffered and written at most that
+    often (by the same thread when logging goes quiet); errors are written at once.
+    """
+
+    _BUFFER_BYTES = 256 * 1024
+    _ROTATED_RE = re.compile(r"^\d{4}-\d{2}-\d{2}(_\d{2}-\d{2}-\d{2})?(\.gz)?$")
+
+    def __init__(
+        self,
+        filename: str,
+        backup_days: int,
+        max_bytes: int = 0,
+        compress: bool = False,
+        flush_seconds: float = 0.0,
+    ) -> None:
+        self.backup_days = backup_days
+        self.max_bytes = max(0, max_bytes)
+        self.compress = compress
+        self.flush_seconds = max(0.0, flush_seconds)
+        self._flushed = time.monotonic()
+        self._unflushed = False
+        # Retention is enforced here by age and size rather than by TimedRotatingFileHandler's file count
+        super().__init__(filename, when="D", interval=1, backupCount=0, encoding="utf-8", delay=True)
+        self._size = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+        self._jobs: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._work, name="log-rotation", daemon=True)
+        self._worker.start()
+        # Compress what an earlier run (or plain daily rotation) left uncompressed, then apply the budgets
+        for path in self._rotated():
+            if not path.endswith(".gz"):
+                self._jobs.put(path)
+        self._jobs.put("")
+
+    def _open(self):  # noqa: ANN202 - file object, as in logging.FileHandler
+        if self.flush_seconds <= 0:
+            return super()._open()
+        return open(self.baseFilename, self.mode, buffering=self._BUFFER_BYTES, encoding=self.encoding)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            msg = self.format(record) + self.terminator
+            size = len(msg.encode(self.encoding, "replace")) if self.max_bytes else 0
+            if self.max_bytes and self._size and self._size + size > self.max_bytes // 4:
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(msg)
+            self._size += size
+            self._unflushed = True
+            if (
+                self.flush_seconds <= 0
+                or record.levelno >= logging.ERROR
+                or time.monotonic() - self._flushed >= self.flush_seconds
+            ):
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:  # noqa: BLE001 - logging must never raise
+            self.handleError(record)
+
+    def flush(self) -> None:
+        self.acquire()
+        try:
+            if self.stream is not None and hasattr(self.stream, "flush"):
+                self.stream.flush()
+            self._flushed = time.monotonic()
+            self._unflushed = False
+        finally:
+            self.release()
+
+    def doRollover(self) -> None:
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        now = time.time()
+        timed = now >= self.rolloverAt
+        # A daily rotation is named after the day it covers. An early (size) rotation, or one whose
+        # name is taken, gets the time of day instead, moving a second on while that name is in use.
+        target = ""
+        if timed:
+            day = time.strftime(self.suffix, time.localtime(self.rolloverAt - self.interval))
+            target = self.rotation_filename(f"{self.baseFilename}.{day}")
+        stamp = now
+        while not target or self._taken(target):
+            target = f"{self.baseFilename}.{time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime(stamp))}"
+            stamp += 1
+        if os.path.exists(self.baseFilename):
+            os.replace(self.baseFilename, target)
+            self._jobs.put(target if self.compress else "")
+        self._size = 0
+        if timed:
+            self.rolloverAt = self.computeRollover(int(now))
+
+    def _taken(self, path: str) -> bool:
+        return os.path.exists(path) or os.path.exists(path + ".gz") or os.path.exists(path + ".gz.part")
+
+    def close(self) -> None:
+        self._jobs.put(None)
+        self._worker.join(timeout=10)
+        super().close()
+
+    def _rotated(self) -> List[str]:
+        """Rotated files of this log, oldest first."""
+        directory, base = os.path.split(self.baseFilename)
+        prefix = base + "."
+        try:
+            names = os.listdir(directory or ".")
+        except OSError:
+            return []
+        rotated = [
+            name for name in names if name.startswith(prefix) and self._ROTATED_RE.match(name[len(prefix):])
+        ]
+        return [os.path.join(directory, name) for name in sorted(rotated)]
+
+    def _work(self) -> None:
+        # A job is a rotated file to compress ("" for none), then the budgets are applied; None stops the thread
+        while True:
+            try:
+                path = self._jobs.get(timeout=self.flush_seconds or None)
+            except queue.Empty:
+                if self._unflushed:
+                    self.flush()
+                continue
+            if path is None:
+                return
+            if path and self.compress:
+                self._gzip(path)
+            self._enforce_budgets()
+
+    def _gzip(self, path: str) -> None:
+        partial = path + ".gz.part"
+        try:
+            stat = os.stat(path)
+            with open(path, "rb") as source, gzip.open(partial, "wb", compresslevel=6) as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            # Keep the rotation time, which the age budget goes by
+            os.utime(partial, (stat.st_atime, stat.st_mtime))
+            os.replace(partial, path + ".gz")
+            os.remove(path)
+        except OSError as e:
+            sys.stderr.write(f"log compression failed for {path}: {e!r}\n")
+            with contextlib.suppress(OSError):
+                os.remove(partial)
+
+    def _enforce_budgets(self) -> None:
+        cutoff = time.time() - self.backup_days * 86400
+        kept: List[Tuple[str, int]] = []
+        for path in self._rotated():
+            try:
+                stat = os.stat(path)
+                if self.backup_days > 0 and stat.st_mtime < cutoff:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue
+            kept.append((path, stat.st_size))
+        if not self.max_bytes:
+            return
+        total = self._size + sum(size for _, size in kept)
+        for path, size in kept:
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+                total -= size
+
+
+def setup_logging(
+    log_file_path: str,
+    backup_days: int,
+    mode: str = "sync",
+    fmt: str = "text",
+    queue_size: int = 10000,
+    max_bytes: int = 0,
+    compress: bool = False,
+    flush_seconds: float = 0.0,
+) -> None:
+    """Log to the console and a daily rotating file (see CompressingFileHandler).
+
+    With `mode` 'queue' the calling thread only enqueues records; a background
+    listener does the console and file I/O (see BoundedQueueHandler). `fmt`
+    'json' writes one JSON object per line.
+    """
+    global _listener
     # Determine target path; if making the directory fails (e.g., permission), fall back to ./data
     target_path = log_file_path
     directory = os.path.dirname(target_path)
@@ -25,16 +318,67 @@ def setup_logging(log_file_path: str, backup_days: int) -> None:
     if logger.handlers:
         return
 
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+
     # Console handler
     ch = logging.StreamHandler()
     ch.setLevel(logging.INFO)
-    ch.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
-    logger.addHandler(ch)
+    ch.setFormatter(formatter)
 
-    # Daily rotating file handler with retention in days
-    fh = TimedRotatingFileHandler(target_path, when="D", interval=1, backupCount=backup_days)
+    # Daily rotating file handler with retention in days and bytes
+    fh = CompressingFileHandler(target_path, backup_days, max_bytes, compress, flush_seconds)
     fh.setLevel(logging.INFO)
-    fh.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
-    logger.addHandler(fh)
+    fh.setFormatter(formatter)
+
+    if mode == "queue":
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=max(1, queue_size))
+        logger.addHandler(BoundedQueueHandler(log_queue))
+        _listener = QueueListener(log_queue, ch, fh, respect_handler_level=True)
+        _listener.start()
+    else:
+        logger.addHandler(ch)
+        logger.addHandler(fh)
+
+
+def stop_logging() -> None:
+    """Flush records still queued in 'queue' mode; a no-op otherwise."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def maintain_logging() -> None:
+    """Rotate a log file that is due even if nothing was logged since midnight, and flush the handlers.
+
+    TimedRotatingFileHandler only checks for rollover when it writes a record,
+    so a quiet bot would otherwise keep yesterday's file open. Run periodically.
+    """
+    handlers = list(logging.getLogger().handlers)
+    if _listener is not None:
+        handlers.extend(_listener.handlers)
+    for handler in handlers:
+        handler.acquire()
+        try:
+            if isinstance(handler, TimedRotatingFileHandler) and time.time() >= handler.rolloverAt:
+                handler.doRollover()
+            handler.flush()
+        finally:
+            handler.release()
+
+
+def setup_queue_logging(log_queue, *filters: logging.Filter) -> None:  # noqa: ANN001 - any queue type
+    """Route this process's records to `log_queue`; used by worker processes."""
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+    handler = QueueHandler(log_queue)
+    for item in filters:
+        handler.addFilter(item)
+    logger.handlers[:] = [handler]
 
 
+def listen_for_queue_logging(log_queue) -> QueueListener:  # noqa: ANN001 - any queue type
+    """Write records arriving on `log_queue` through this process's handlers."""
+    listener = QueueListener(log_queue, *logging.getLogger().handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -3,294 +3,249 @@ from __future__ import annotations
 import logging
 import signal
 import sys
-import time
-from typing import Dict, Optional
-
-from src.config import load_settings
-from src.fetcher import fetch_btc_dominance_percent
-from src.logging_setup import setup_logging
-from src.notifier import send_telegram_message
-from src.state import BotState, read_state, write_state
-from src.subscribers import Subscriber, read_subscribers, write_subscribers
-from src.updates import (
-    extract_chat_ids_from_updates,
-    extract_value_requests,
-    get_updates,
-    parse_threshold_commands,
+import threading
+from typing import List, Optional, Tuple
+
+from src.bot import (
+    BotContext,
+    add_maintenance_jobs,
+    answer_value_requests,
+    board_settings,
+    determine_zone,
+    ensure_last_value,
+    fetch_check_readings,
+    handle_updates,
+    help_text,
+    load_boards,
+    loop_period_seconds,
+    next_check_delay,
+    queue_alerts,
+    queue_replies,
+    run_checks,
+    save_snapshot,
+    unseen_updates,
 )
+from src.config import Settings, load_settings
+from src.hosting import run_hosting
+from src.http_session import close_session, configure_session, set_telegram_api_base
+from src.logging_setup import setup_logging, stop_logging
+from src.metrics import CHECK_LAG_SECONDS, HEALTH, STARTUP, MetricsServer, beat
+from src.notifier import SendScheduler, send_telegram_message
+from src.outbox import Outbox, OutboxDrainer
+from src.resilience import RetryPolicy
+from src.scheduler import MISSED_DELAY, Scheduler
+from src.sharding import adopt_outboxes, load_coordinator_context, prepare_shards, run_sharded
+from src.subscribers import close_stores
+from src.updates import delete_webhook, get_updates, set_webhook
+from src.webhook import WebhookReceiver
 
+__all__ = ["determine_zone", "help_text", "main"]
 
-_running = True
+_stop = threading.Event()
 
 
 def _handle_signal(signum, frame):  # noqa: ANN001 - standard signal signature
-    global _running
-    _running = False
-
-
-def determine_zone(value: float, lower: float, upper: float) -> str:
-    if value >= upper:
-        return "above"
-    if value <= lower:
-        return "below"
-    return "neutral"
-
-
-def format_message(value: float, zone: str, lower: float, upper: float) -> str:
-    if zone == "above":
-        return f"⚠️ BTC dominance crossed ABOVE {upper:.2f}%\nCurrent: {value:.2f}%"
-    if zone == "below":
-        return f"⚠️ BTC dominance crossed BELOW {lower:.2f}%\nCurrent: {value:.2f}%"
-    return f"ℹ️ BTC dominance back between thresholds ({lower:.2f}% - {upper:.2f}%)\nCurrent: {value:.2f}%"
-
-
-def help_text() -> str:
-    return (
-        "Commands:\n"
-        "/start — subscribe\n"
-        "/stop — unsubscribe\n"
-        "/value — current BTC dominance\n"
-        "/settings — show your thresholds\n"
-        "/upper <value> — set your upper (0–100)\n"
-        "/lower <value> — set your lower (0–100)\n"
-        "/thresholds <upper> <lower> — set both\n"
-        "/reset — use global defaults\n"
-        "/help — this help"
-    )
+    _stop.set()
 
 
-def main() -> int:
-    settings = load_settings()
+def start_drainer(settings: Settings, outbox: Outbox) -> OutboxDrainer:
+    """Send queued replies and alerts in the background with up to ALERT_WORKERS in flight.
 
-    setup_logging(settings.log_file_path, settings.log_backup_days)
-    log = logging.getLogger(__name__)
+    In sharded mode the coordinator and each shard worker run a drainer, and
+    each gets an equal share of SEND_RATE_PER_SECOND.
+    """
 
-    # graceful shutdown
-    signal.signal(signal.SIGINT, _handle_signal)
-    signal.signal(signal.SIGTERM, _handle_signal)
+    def send(cid: int, text: str) -> None:
+        send_telegram_message(settings.telegram_bot_token, cid, text, settings.request_timeout_seconds)
 
-    state = read_state(settings.state_file_path)
-    subscribers: Dict[int, Subscriber] = read_subscribers(settings.subscribers_file_path)
-    log.info("starting bot state=%s subscribers=%d", state, len(subscribers))
+    retry = RetryPolicy(base_delay=settings.retry_base_seconds, max_delay=settings.check_interval_seconds)
+    senders = settings.shard_count + 1 if settings.shard_count > 1 else 1
+    scheduler = SendScheduler(
+        settings.send_rate_per_second / senders, settings.send_chat_rate_per_second, name=settings.bot_name
+    )
+    return OutboxDrainer(outbox, send, settings.alert_workers, retry, scheduler).start()
 
-    last_update_id: Optional[int] = None
-    last_value: Optional[float] = state.last_value
-    last_zone: Optional[str] = state.last_zone
 
-    next_check_time = time.time()
+def run_sync(ctx: BotContext, receiver: Optional[WebhookReceiver] = None) -> None:
+    """Single-threaded runtime: update polls, checks and upkeep run as jobs of one Scheduler.
 
-    while _running:
+    Checks keep their cadence on the monotonic clock, whatever a cycle costs or
+    the wall clock does, and the loop sleeps until the next deadline. With a
+    webhook `receiver` it blocks on incoming updates instead of polling,
+    waking at least once a second.
+    """
+    settings = ctx.settings
+    log = logging.getLogger(__name__)
+    scheduler = Scheduler()
+    last_update_id: Optional[int] = None
+
+    def handle(updates: List[dict]) -> None:
+        updates = unseen_updates(ctx, updates)
+        replies: List[Tuple[int, str, str]] = []
+        value_ids = handle_updates(ctx, updates, lambda *message: replies.append(message))
+        queue_replies(ctx, updates, replies)
+        # Answer /value with the most recent known value and per-user thresholds
+        if value_ids:
+            ensure_last_value(ctx)
+            answered: List[Tuple[int, str, str]] = []
+            answer_value_requests(ctx, value_ids, lambda *message: answered.append(message))
+            queue_replies(ctx, updates, answered, part="value")
+
+    def poll_updates(timeout: Optional[float] = None) -> None:
+        nonlocal last_update_id
         try:
-            # 1) Poll Telegram updates frequently for commands and interactions
-            try:
-                offset_param = last_update_id  # get_updates already expects the "next offset"
+            if receiver is not None:
+                updates = receiver.next_batch(min(1.0, timeout or 0.0))
+            else:
+                # get_updates already expects the "next offset"
                 last_update_id, updates = get_updates(
-                    settings.telegram_bot_token,
-                    offset_param,
-                    settings.updates_poll_seconds,
+                    settings.telegram_bot_token, last_update_id, settings.updates_poll_seconds
                 )
-                value_ids = set()
-                if updates:
-                    start_ids, stop_ids = extract_chat_ids_from_updates(updates)
-                    value_ids = extract_value_requests(updates)
-                    if start_ids:
-                        log.info("/start from %s", list(start_ids))
-                    if stop_ids:
-                        log.info("/stop from %s", list(stop_ids))
-
-                    # Add/remove subscribers
-                    changed = False
-                    for cid in start_ids:
-                        if cid not in subscribers:
-                            subscribers[cid] = Subscriber()
-                            changed = True
-                    for cid in stop_ids:
-                        if cid in subscribers:
-                            del subscribers[cid]
-                            changed = True
-
-                    # Handle threshold and help commands
-                    for cid, cmd, args in parse_threshold_commands(updates):
-                        if cid not in subscribers:
-                            subscribers[cid] = Subscriber()
-                            changed = True
-                        sub = subscribers[cid]
-                        if cmd == "settings":
-                            eff_upper = sub.upper if sub.upper is not None else settings.upper_threshold_percent
-                            eff_lower = sub.lower if sub.lower is not None else settings.lower_threshold_percent
-                            msg = (
-                                f"Your thresholds: upper={eff_upper:.2f}%, lower={eff_lower:.2f}%\n"
-                                f"Using {'custom' if sub.upper or sub.lower else 'global defaults'}."
-                            )
-                            try:
-                                send_telegram_message(settings.telegram_bot_token, cid, msg, settings.request_timeout_seconds)
-                                log.info("/settings replied to %s", cid)
-                            except Exception as e:  # noqa: BLE001
-                                log.warning("settings send error cid=%s err=%s", cid, repr(e))
-                        elif cmd in ("upper", "lower", "thresholds"):
-                            try:
-                                if cmd == "upper":
-                                    if not args:
-                                        raise ValueError("Usage: /upper <value>")
-                                    val = float(args[0])
-                                    if not (0 <= val <= 100):
-                                        raise ValueError("Upper must be between 0 and 100")
-                                    sub.upper = val
-                                elif cmd == "lower":
-                                    if not args:
-                                        raise ValueError("Usage: /lower <value>")
-                                    val = float(args[0])
-                                    if not (0 <= val <= 100):
-                                        raise ValueError("Lower must be between 0 and 100")
-                                    sub.lower = val
-                                else:  # thresholds
-                                    if len(args) < 2:
-                                        raise ValueError("Usage: /thresholds <upper> <lower>")
-                                    u = float(args[0])
-                                    l = float(args[1])
-                                    if not (0 <= u <= 100 and 0 <= l <= 100):
-                                        raise ValueError("Values must be between 0 and 100")
-                                    sub.upper = u
-                                    sub.lower = l
-                                eff_upper = sub.upper if sub.upper is not None else settings.upper_threshold_percent
-                                eff_lower = sub.lower if sub.lower is not None else settings.lower_threshold_percent
-                                if eff_lower >= eff_upper:
-                                    raise ValueError("Lower must be less than upper")
-                                write_subscribers(settings.subscribers_file_path, subscribers)
-                                log.info("saved thresholds for %s -> upper=%s lower=%s", cid, eff_upper, eff_lower)
-                                changed = False  # already wrote, avoid extra write
-                                send_telegram_message(
-                                    settings.telegram_bot_token,
-                                    cid,
-                                    f"Saved thresholds. upper={eff_upper:.2f}%, lower={eff_lower:.2f}%",
-                                    settings.request_timeout_seconds,
-                                )
-                            except Exception as e:  # noqa: BLE001
-                                try:
-                                    send_telegram_message(
-                                        settings.telegram_bot_token,
-                                        cid,
-                                        f"Threshold error: {e}",
-                                        settings.request_timeout_seconds,
-                                    )
-                                except Exception:
-                                    pass
-                                log.warning("threshold cmd error cid=%s cmd=%s args=%s err=%s", cid, cmd, args, repr(e))
-                        elif cmd == "reset":
-                            sub.upper = None
-                            sub.lower = None
-                            write_subscribers(settings.subscribers_file_path, subscribers)
-                            changed = False
-                            try:
-                                send_telegram_message(
-                                    settings.telegram_bot_token,
-                                    cid,
-                                    "Your thresholds have been reset to global defaults.",
-                                    settings.request_timeout_seconds,
-                                )
-                                log.info("reset thresholds for %s", cid)
-                            except Exception:
-                                pass
-                        elif cmd == "help":
-                            try:
-                                send_telegram_message(
-                                    settings.telegram_bot_token,
-                                    cid,
-                                    help_text(),
-                                    settings.request_timeout_seconds,
-                                )
-                                log.info("/help replied to %s", cid)
-                            except Exception as e:
-                                log.warning("help send error cid=%s err=%s", cid, repr(e))
-
-                    if changed:
-                        write_subscribers(settings.subscribers_file_path, subscribers)
-                        log.info("subscribers updated -> %d", len(subscribers))
-            except Exception as updates_err:  # noqa: BLE001
-                logging.getLogger(__name__).warning("updates error: %s", repr(updates_err))
-                value_ids = set()
-
-            # 2) If it's time, perform the dominance check and send alerts per user
-            now = time.time()
-            if now >= next_check_time:
-                try:
-                    current_value = fetch_btc_dominance_percent(settings.request_timeout_seconds)
-
-                    # Evaluate per-user alerts
-                    for cid, sub in list(subscribers.items()):
-                        upper = sub.upper if sub.upper is not None else settings.upper_threshold_percent
-                        lower = sub.lower if sub.lower is not None else settings.lower_threshold_percent
-                        if lower >= upper:
-                            # Skip invalid per-user config; notify user once?
-                            continue
-                        zone = determine_zone(current_value, lower, upper)
-                        if zone in ("above", "below") and zone != (sub.last_zone or "neutral"):
-                            msg = format_message(current_value, zone, lower, upper)
-                            try:
-                                send_telegram_message(settings.telegram_bot_token, cid, msg, settings.request_timeout_seconds)
-                                log.info("alert to %s zone=%s value=%.2f upper=%.2f lower=%.2f", cid, zone, current_value, upper, lower)
-                            except Exception as e:  # noqa: BLE001
-                                log.warning("alert send error cid=%s err=%s", cid, repr(e))
-                        if zone == "neutral" and (sub.last_zone in ("above", "below")):
-                            msg = format_message(current_value, zone, lower, upper)
-                            try:
-                                send_telegram_message(settings.telegram_bot_token, cid, msg, settings.request_timeout_seconds)
-                                log.info("neutral notice to %s value=%.2f", cid, current_value)
-                            except Exception as e:  # noqa: BLE001
-                                log.warning("alert send error cid=%s err=%s", cid, repr(e))
-                        sub.last_zone = zone
-                        sub.last_value = current_value
-
-                    # Persist per-user states
-                    write_subscribers(settings.subscribers_file_path, subscribers)
-
-                    # Persist global last value/zone for convenience
-                    last_value = current_value
-                    last_zone = None
-                    write_state(settings.state_file_path, BotState(last_zone=None, last_value=last_value))
-
-                    log.info("checked value %.2f for %d subscribers", current_value, len(subscribers))
-                finally:
-                    next_check_time = now + settings.check_interval_seconds
-
-            # 3) Respond to any /value requests with the most recent known value and per-user thresholds
-            if value_ids:
-                if last_value is None:
-                    try:
-                        last_value = fetch_btc_dominance_percent(settings.request_timeout_seconds)
-                    except Exception as e:  # noqa: BLE001
-                        logging.getLogger(__name__).warning("quick fetch error for /value: %s", repr(e))
-                for cid in value_ids:
-                    try:
-                        sub = subscribers.get(cid) or Subscriber()
-                        upper = sub.upper if sub.upper is not None else settings.upper_threshold_percent
-                        lower = sub.lower if sub.lower is not None else settings.lower_threshold_percent
-                        z = determine_zone(last_value or 0.0, lower, upper) if last_value is not None else "unknown"
-                        msg = (
-                            f"BTC dominance is {last_value:.2f}% (zone: {z})\n"
-                            f"Your thresholds: upper={upper:.2f}%, lower={lower:.2f}%"
-                            if last_value is not None
-                            else "BTC dominance value not available. Try again shortly."
-                        )
-                        send_telegram_message(settings.telegram_bot_token, cid, msg, settings.request_timeout_seconds)
-                        log.info("/value replied to %s", cid)
-                    except Exception as e:  # noqa: BLE001
-                        log.warning("/value send error cid=%s err=%s", cid, repr(e))
-
-        except Exception as error:  # noqa: BLE001
-            logging.getLogger(__name__).warning("loop error: %s", repr(error))
-
-        # Short sleep between update polls
-        for _ in range(settings.updates_poll_seconds):
-            if not _running:
-                break
-            time.sleep(1)
-
-    logging.getLogger(__name__).info("shutting down")
+            handle(updates)
+        except Exception as e:  # noqa: BLE001
+            log.warning("updates error: %s", repr(e))
+        STARTUP.ready()
+        beat("main", loop_period_seconds(settings))
+
+    def check() -> float:
+        CHECK_LAG_SECONDS.set(check_job.lag)
+        check_error: Optional[Exception] = None
+        try:
+            run_checks(ctx, fetch_check_readings(ctx), queue_alerts)
+        except Exception as e:  # noqa: BLE001
+            check_error = e
+            log.warning("check error: %s", repr(e))
+        return next_check_delay(ctx, check_error)
+
+    if receiver is None:
+        # Poll again UPDATES_POLL_SECONDS after each (long) poll returns
+        scheduler.every("updates", settings.updates_poll_seconds, poll_updates, missed=MISSED_DELAY)
+    check_job = scheduler.every("check", settings.check_interval_seconds, check)
+    add_maintenance_jobs(scheduler, [ctx])
+    scheduler.run(_stop, poll_updates if receiver is not None else None)
+
+
+def start_webhook(settings: Settings) -> WebhookReceiver:
+    """Start the webhook receiver and register WEBHOOK_URL with Telegram if set."""
+    log = logging.getLogger(__name__)
+    receiver = WebhookReceiver(
+        settings.webhook_listen_host,
+        settings.webhook_port,
+        settings.webhook_secret or "",
+        settings.webhook_path,
+    )
+    receiver.start()
+    if settings.webhook_url:
+        try:
+            set_webhook(
+                settings.telegram_bot_token,
+                settings.webhook_url,
+                settings.webhook_secret or "",
+                settings.request_timeout_seconds,
+            )
+            log.info("webhook registered url=%s", settings.webhook_url)
+        except Exception as e:  # noqa: BLE001
+            log.warning("setWebhook error: %s", repr(e))
+    else:
+        log.info("WEBHOOK_URL not set; register the webhook with Telegram yourself")
+    return receiver
+
+
+def clear_webhook(settings: Settings) -> None:
+    """Remove a webhook left registered by UPDATES_MODE=webhook; getUpdates answers 409 while one is set."""
+    try:
+        delete_webhook(settings.telegram_bot_token, settings.request_timeout_seconds)
+    except Exception as e:  # noqa: BLE001
+        logging.getLogger(__name__).warning("deleteWebhook error: %s", repr(e))
+
+
+def start_metrics_server(settings: Settings) -> Optional[MetricsServer]:
+    """Serve /metrics and /healthz unless METRICS_PORT is 0."""
+    if not settings.metrics_port:
+        return None
+    HEALTH.intervals = settings.health_intervals
+    metrics_server = MetricsServer(settings.metrics_host, settings.metrics_port)
+    metrics_server.start()
+    return metrics_server
+
+
+def main() -> int:
+    STARTUP.phase("imports")
+    settings = load_settings()
+
+    setup_logging(
+        settings.log_file_path,
+        settings.log_backup_days,
+        settings.log_mode,
+        settings.log_format,
+        settings.log_queue_size,
+        settings.log_max_bytes,
+        settings.log_compress,
+        settings.log_flush_seconds,
+    )
+    log = logging.getLogger(__name__)
+
+    configure_session(settings.http_pool_connections, settings.http_pool_maxsize)
+    set_telegram_api_base(settings.telegram_api_base)
+    STARTUP.phase("setup")
+    if settings.bots_file:
+        # Several bots in this process; run_hosting owns their whole lifecycle
+        run_hosting(settings)
+        stop_logging()
+        return 0
+    if settings.shard_count > 1:
+        # Workers load their own shards; the coordinator only fetches and routes
+        ctx = load_coordinator_context(settings)
+    else:
+        for _, own in board_settings(settings):
+            prepare_shards(own.subscribers_file_path, 1)
+        ctx = load_boards(settings)
+    STARTUP.phase("context")
+
+    metrics_server = start_metrics_server(settings)
+
+    # Replies and alerts go through the durable outbox; sends never block the loops.
+    # This process also sends what a different SHARD_COUNT left queued.
+    adopt_outboxes(ctx.outbox, settings.shard_count)
+    drainer = start_drainer(settings, ctx.outbox)
+
+    receiver: Optional[WebhookReceiver] = None
+    if settings.updates_mode == "webhook":
+        receiver = start_webhook(settings)
+    else:
+        clear_webhook(settings)
+    STARTUP.phase("services")
+
+    if settings.shard_count > 1:
+        # run_sharded installs its own SIGINT/SIGTERM handlers and stops the workers
+        run_sharded(ctx, receiver)
+    elif settings.runtime_mode == "async":
+        import asyncio
+
+        from src.async_runtime import run_async
+
+        # run_async installs its own SIGINT/SIGTERM handlers on the event loop
+        asyncio.run(run_async(ctx, receiver))
+    else:
+        # graceful shutdown
+        signal.signal(signal.SIGINT, _handle_signal)
+        signal.signal(signal.SIGTERM, _handle_signal)
+        run_sync(ctx, receiver)
+
+    log.info("shutting down")
+    if receiver is not None:
+        receiver.stop()
+    drainer.stop()
+    ctx.outbox.close()
+    if metrics_server is not None:
+        metrics_server.stop()
+    close_session()
+    close_stores()
+    if settings.shard_count <= 1:
+        save_snapshot(ctx)
+    stop_logging()
     return 0
 
 
 if __name__ == "__main__":
     raise SystemExit(main())
-
-
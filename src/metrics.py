@@ -0,0 +1,351 @@
+from __future__ import annotations
+
+import bisect
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: bucket counts (last one is +Inf), sum, count
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[Dict[str, str]]:
+        """Observe the block's duration; an `outcome` label (if declared) becomes 'error' on exceptions."""
+        labels = dict(labels)
+        if "outcome" in self.label_names:
+            labels.setdefault("outcome", "ok")
+        started = time.perf_counter()
+        try:
+            yield labels
+        except BaseException:
+            if "outcome" in self.label_names:
+                labels["outcome"] = "error"
+            raise
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return sum(series[0]) if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s[0])) for k, (c, s) in self._series.items())
+        lines: List[str] = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labels))  # type: ignore[return-value]
+
+    def histogram(
+        self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+FETCH_SECONDS = REGISTRY.histogram(
+    "btcdom_fetch_seconds", "Dominance fetch latency per provider.", ("provider", "outcome")
+)
+SEND_SECONDS = REGISTRY.histogram("btcdom_send_seconds", "Telegram sendMessage latency.", ("outcome",))
+GET_UPDATES_SECONDS = REGISTRY.histogram("btcdom_get_updates_seconds", "Telegram getUpdates latency.", ("outcome",))
+UPDATE_BATCH_SIZE = REGISTRY.histogram(
+    "btcdom_update_batch_size", "Updates per getUpdates or webhook batch.", buckets=SIZE_BUCKETS
+)
+PERSIST_SECONDS = REGISTRY.histogram(
+    "btcdom_persist_seconds", "Time spent reading and writing local files.", ("operation", "outcome")
+)
+CHECK_LAG_SECONDS = REGISTRY.gauge(
+    "btcdom_check_lag_seconds", "How late the last dominance check started relative to its schedule."
+)
+JOB_LAG_SECONDS = REGISTRY.gauge(
+    "btcdom_job_lag_seconds", "How late the last run of each scheduled job started.", ("job",)
+)
+LOOP_ITERATIONS = REGISTRY.counter("btcdom_loop_iterations_total", "Completed loop iterations.", ("loop",))
+LAST_ITERATION = REGISTRY.gauge(
+    "btcdom_loop_last_iteration_timestamp_seconds", "Unix time of the last completed loop iteration.", ("loop",)
+)
+DOMINANCE = REGISTRY.gauge("btcdom_dominance_percent", "Last checked dominance per metric.", ("metric",))
+SUBSCRIBERS = REGISTRY.gauge(
+    "btcdom_subscribers", "Subscribers held by this process per bot and metric.", ("bot", "metric")
+)
+ALERTS = REGISTRY.counter("btcdom_alerts_total", "Alert messages handed to delivery.")
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "btcdom_log_records_dropped_total", "Log records dropped because the log queue was full.", ("level",)
+)
+OUTBOX_PENDING = REGISTRY.gauge("btcdom_outbox_pending", "Outbound messages queued but not yet delivered.", ("bot",))
+SEND_RATE = REGISTRY.gauge("btcdom_send_rate_per_second", "Current global send rate allowed by the scheduler.", ("bot",))
+SEND_THROTTLED = REGISTRY.counter("btcdom_send_throttled_total", "Sends answered 429 by the Bot API.")
+STARTUP_SECONDS = REGISTRY.gauge("btcdom_startup_seconds", "Time spent in each startup phase.", ("phase",))
+
+
+class StartupTimer:
+    """Times startup phases until the first update poll has been handled.
+
+    The clock starts when this module is imported, which is among the first
+    imports of the bot, so the first phase covers module loading. `ready()`
+    logs the report once; later calls and phases are ignored.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter) -> None:
+        self._clock = clock
+        self._started = self._last = clock()
+        self._phases: List[Tuple[str, float]] = []
+        self._lock = threading.Lock()
+        self.done = False
+
+    def phase(self, name: str) -> None:
+        """Close the phase that ran since the previous mark under `name`."""
+        with self._lock:
+            if self.done:
+                return
+            now = self._clock()
+            duration = now - self._last
+            self._phases.append((name, duration))
+            self._last = now
+        STARTUP_SECONDS.set(duration, phase=name)
+
+    def ready(self, name: str = "first_poll") -> None:
+        if self.done:
+            return
+        self.phase(name)
+        with self._lock:
+            self.done = True
+            phases, total = list(self._phases), self._last - self._started
+        STARTUP_SECONDS.set(total, phase="total")
+        log.info("startup %.3fs to first poll: %s", total, " ".join(f"{n}={s:.3f}s" for n, s in phases))
+
+
+STARTUP = StartupTimer()
+
+
+class Health:
+    """Liveness of the bot's loops.
+
+    Each loop calls `beat(name, expected_seconds)` after every iteration; the
+    bot is unhealthy once any loop has been silent for more than
+    `intervals` times its expected period, or before any loop has run for
+    that long after start.
+    """
+
+    def __init__(self, intervals: float = 3.0, clock: Callable[[], float] = time.monotonic) -> None:
+        self.intervals = intervals
+        self._clock = clock
+        self._started = clock()
+        self._lock = threading.Lock()
+        self._loops: Dict[str, Tuple[float, float]] = {}
+
+    def beat(self, name: str, expected_seconds: float) -> None:
+        with self._lock:
+            self._loops[name] = (self._clock(), max(1.0, expected_seconds))
+        LOOP_ITERATIONS.inc(loop=name)
+        LAST_ITERATION.set(time.time(), loop=name)
+
+    def status(self) -> Tuple[bool, Dict[str, float]]:
+        """(healthy, seconds since each loop's last iteration)."""
+        now = self._clock()
+        with self._lock:
+            loops = dict(self._loops)
+        if not loops:
+            return now - self._started <= 60.0 * self.intervals, {}
+        ages = {name: now - last for name, (last, _) in loops.items()}
+        healthy = all(ages[name] <= expected * self.intervals for name, (_, expected) in loops.items())
+        return healthy, ages
+
+
+HEALTH = Health()
+
+
+def beat(name: str, expected_seconds: float) -> None:
+    HEALTH.beat(name, expected_seconds)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+
+    def do_GET(self) -> None:  # noqa: N802 - http.server naming
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            self._reply(200, self.server.registry.render(), "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/healthz":
+            healthy, ages = self.server.health.status()
+            body = "ok\n" if healthy else "stale\n"
+            body += "".join(f"{name} {age:.1f}s\n" for name, age in sorted(ages.items()))
+            self._reply(200 if healthy else 503, body, "text/plain; charset=utf-8")
+        else:
+            self._reply(404, "not found\n", "text/plain; charset=utf-8")
+
+    def _reply(self, status: int, body: str, content_type: str) -> None:
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002 - http.server signature
+        log.debug("metrics %s - %s", self.address_string(), format % args)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    registry: Registry
+    health: Health
+
+
+class MetricsServer:
+    """Serves `/metrics` (Prometheus text format) and `/healthz` on a daemon thread."""
+
+    def __init__(self, host: str, port: int, registry: Registry = REGISTRY, health: Health = HEALTH) -> None:
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self.health = health
+        self._server: Optional[_Server] = None
+
+    @property
+    def address(self) -> tuple:
+        return self._server.server_address if self._server else (self.host, self.port)
+
+    def start(self) -> None:
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.registry = self.registry
+        self._server.health = self.health
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        log.info("metrics listening on %s:%s", self.address[0], self.address[1])
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -1,35 +1,222 @@
 from __future__ import annotations
 
-from typing import Iterable
+import time
+from typing import Callable, Dict, Optional
 
 import requests
 
+from src.http_session import get_session, telegram_url
+from src.metrics import SEND_RATE, SEND_SECONDS, SEND_THROTTLED
+
+# Priority classes of outbound messages; lower ones are sent first
+PRIORITY_REPLY = 0  # answers to commands such as /value, /settings and /help
+PRIORITY_ALERT = 1  # bulk zone alerts
+
+# Bot API limits: about 30 messages/s overall and 1 message/s per chat (short bursts are tolerated)
+GLOBAL_RATE = 30.0
+CHAT_RATE = 1.0
+CHAT_BURST = 3
+
+_PRUNE_AT = 4096
+
 
 class NotifyError(Exception):
-    pass
+    """A failed Bot API call; `response` lets retry logic read the status and Retry-After.
+
+    `retry_after` is the flood-control wait Telegram sends in `parameters.retry_after`
+    of a 429 answer, if any.
+    """
+
+    def __init__(
+        self, message: str, response: Optional[requests.Response] = None, retry_after: Optional[float] = None
+    ) -> None:
+        super().__init__(message)
+        self.response = response
+        self.retry_after = retry_after
+
 
+def message_priority(key: str) -> int:
+    """Alerts are queued under `check...` keys; everything else answers a command."""
+    return PRIORITY_ALERT if key.startswith("check") else PRIORITY_REPLY
 
-def send_telegram_message(bot_token: str, chat_id: int, text: str, timeout_seconds: int = 15) -> None:
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    try:
+        body = response.json()
+    except ValueError:
+        return None
+    parameters = body.get("parameters") if isinstance(body, dict) else None
+    value = parameters.get("retry_after") if isinstance(parameters, dict) else None
+    return max(0.0, float(value)) if isinstance(value, (int, float)) else None
+
+
+def send_telegram_message(
+    bot_token: str,
+    chat_id: int,
+    text: str,
+    timeout_seconds: int = 15,
+    session: Optional[requests.Session] = None,
+) -> None:
+    url = telegram_url(bot_token, "sendMessage")
     payload = {
         "chat_id": chat_id,
         "text": text,
         "parse_mode": "Markdown",
         "disable_web_page_preview": True,
     }
-    response = requests.post(url, json=payload, timeout=timeout_seconds)
-    if response.status_code != 200:
-        raise NotifyError(f"Telegram sendMessage failed: {response.status_code} {response.text}")
+    with SEND_SECONDS.time():
+        response = (session or get_session()).post(url, json=payload, timeout=timeout_seconds)
+        if response.status_code != 200:
+            retry_after = _retry_after(response) if response.status_code == 429 else None
+            raise NotifyError(
+                f"Telegram sendMessage failed: {response.status_code} {response.text}", response, retry_after
+            )
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`; a rate of 0 means unlimited."""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp", "blocked_until")
+
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.stamp = now
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self.stamp:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+
+    def available(self, now: float) -> float:
+        if now < self.blocked_until:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        self._refill(now)
+        return self.tokens
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available."""
+        wait = max(0.0, self.blocked_until - now)
+        if self.rate > 0:
+            self._refill(now)
+            wait = max(wait, (1.0 - self.tokens) / self.rate)
+        return wait
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1.0
+
+    def block(self, now: float, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class SendScheduler:
+    """Paces sends under Telegram's limits with a global bucket plus one bucket per chat.
+
+    A 429 pauses that chat for the requested time and halves the global rate
+    (at most once per second, down to 1 msg/s); it then climbs back by
+    `recover_per_second` msg/s every second up to `rate`. Used only from the
+    outbox drainer thread, so it takes no locks.
+    """
+
+    def __init__(
+        self,
+        rate: float = GLOBAL_RATE,
+        chat_rate: float = CHAT_RATE,
+        chat_burst: int = CHAT_BURST,
+        recover_per_second: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+        name: str = "",
+    ) -> None:
+        self.name = name  # the hosted bot it paces, for metrics
+        self.max_rate = rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.recover_per_second = recover_per_second
+        self._clock = clock
+        now = clock()
+        # One second's worth of burst, so a quiet bot answers at once
+        self._global = TokenBucket(rate, rate, now)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._prune_at = _PRUNE_AT
+        self._recovered_at = now
+        self._cut_at = float("-inf")
+        SEND_RATE.set(rate, bot=self.name)
+
+    @property
+    def rate(self) -> float:
+        return self._global.rate
+
+    def _recover(self, now: float) -> None:
+        bucket = self._global
+        if 0 < bucket.rate < self.max_rate:
+            bucket._refill(now)
+            bucket.rate = min(self.max_rate, bucket.rate + (now - self._recovered_at) * self.recover_per_second)
+            SEND_RATE.set(bucket.rate, bot=self.name)
+        self._recovered_at = now
+
+    def available(self) -> float:
+        """Sends the global bucket allows right now (inf when unlimited)."""
+        now = self._clock()
+        self._recover(now)
+        return self._global.available(now)
+
+    def delay(self) -> float:
+        """Seconds until the global bucket allows another send."""
+        now = self._clock()
+        self._recover(now)
+        return self._global.delay(now)
 
+    def acquire(self, chat_id: int) -> float:
+        """Take a send slot for `chat_id`; returns 0, or the seconds to wait without taking one."""
+        now = self._clock()
+        self._recover(now)
+        chat = self._chat(chat_id, now)
+        wait = self._global.delay(now)
+        if chat is not None:
+            wait = max(wait, chat.delay(now))
+        if wait > 0:
+            return wait
+        self._global.take(now)
+        if chat is not None:
+            chat.take(now)
+        return 0.0
 
-def broadcast_message(bot_token: str, chat_ids: Iterable[int], text: str, timeout_seconds: int = 15) -> None:
-    errors = []
-    for cid in chat_ids:
-        try:
-            send_telegram_message(bot_token, cid, text, timeout_seconds)
-        except Exception as e:  # noqa: BLE001
-            errors.append((cid, str(e)))
-    if errors:
-        raise NotifyError(f"Failed to send to {len(errors)} subscribers: {errors}")
+    def throttled(self, chat_id: int, seconds: float) -> None:
+        """Telegram answered 429 for `chat_id`: back off for `seconds` and slow down overall."""
+        SEND_THROTTLED.inc()
+        now = self._clock()
+        chat = self._chat(chat_id, now)
+        if chat is not None:
+            chat.block(now, seconds)
+        bucket = self._global
+        if bucket.rate > 0 and now - self._cut_at >= 1.0:
+            self._recover(now)
+            bucket._refill(now)
+            bucket.rate = max(1.0, bucket.rate / 2)
+            bucket.tokens = min(bucket.tokens, 1.0)
+            self._cut_at = now
+            SEND_RATE.set(bucket.rate, bot=self.name)
 
+    def _chat(self, chat_id: int, now: float) -> Optional[TokenBucket]:
+        if self.chat_rate <= 0:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self._prune_at:
+                self._prune(now)
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
 
+    def _prune(self, now: float) -> None:
+        # A full, unblocked bucket is the same as none at all
+        self._chats = {
+            cid: bucket
+            for cid, bucket in self._chats.items()
+            if bucket.available(now) < bucket.burst or now < bucket.blocked_until
+        }
+        self._prune_at = max(_PRUNE_AT, 2 * len(self._chats))
@@ -0,0 +1,396 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.metrics import OUTBOX_PENDING, PERSIST_SECONDS
+from src.notifier import PRIORITY_REPLY, SendScheduler, message_priority
+from src.resilience import RetryPolicy, is_retryable
+
+log = logging.getLogger("src.main")
+
+# (key, chat_id, text, note); note is logged once the message has been sent
+Message = Tuple[str, int, str, str]
+
+# Rewrite the file once this many acks (or more acks than pending messages) accumulate
+COMPACT_AFTER_ACKS = 1000
+# The drainer writes acks at most this often (or once `workers` sends finished);
+# a crash can resend at most what was delivered in this window
+ACK_INTERVAL_SECONDS = 0.1
+# Transient send failures are retried this many times, and for at most this long after queueing
+MAX_ATTEMPTS = 10
+MAX_AGE_SECONDS = 24 * 3600.0
+
+
+@dataclass
+class OutboxItem:
+    key: str
+    chat_id: int
+    text: str
+    note: str = ""
+    attempts: int = 0
+    not_before: float = 0.0  # monotonic time before which it is not retried
+    in_flight: bool = False
+    priority: int = PRIORITY_REPLY
+    queued_at: float = 0.0  # unix time it was first queued
+
+
+class Outbox:
+    """Durable queue of outbound messages in an append-only JSON-lines file.
+
+    `put` appends one line per batch (plus optional progress marks) and
+    fsyncs it; `ack` appends the keys that were delivered or given up on.
+    The file is replayed on open, so unacknowledged messages survive
+    restarts. A key already in the file is ignored by `put`, which makes
+    re-enqueueing after a crash idempotent. Once enough acks accumulate the
+    file is rewritten with only the pending messages, the marks and the keys
+    of the latest batch per mark.
+
+    `take` hands out command replies before alerts, each class oldest first.
+    Unclaimed messages sit in one heap per class keyed by due time, so taking
+    a message or finding the next due one is O(log n) however long the queue.
+    """
+
+    def __init__(self, path: str, name: str = "") -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.name = name  # the hosted bot it belongs to, for metrics
+        self._cond = threading.Condition()
+        self._pending: "OrderedDict[str, OutboxItem]" = OrderedDict()
+        # Unclaimed messages as (not_before, seq, item): replies, then alerts; acked or
+        # re-queued items leave stale entries that are skipped when they reach the top
+        self._queues: Tuple[List[Tuple[float, int, OutboxItem]], ...] = ([], [])
+        self._seq = itertools.count()
+        self._done: Set[str] = set()  # acked keys still remembered for dedup
+        self._marks: Dict[str, int] = {}
+        self._mark_keys: Dict[str, List[str]] = {}  # keys of the latest batch carrying each mark
+        self._acks = 0  # acks since the last rewrite
+        self._load()
+        for item in self._pending.values():
+            self._schedule(item)
+        self._rewrite()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def pending(self) -> List[Message]:
+        with self._cond:
+            return [(item.key, item.chat_id, item.text, item.note) for item in self._pending.values()]
+
+    def mark(self, name: str) -> Optional[int]:
+        with self._cond:
+            return self._marks.get(name)
+
+    def put(self, messages: Iterable[Message], marks: Optional[Dict[str, int]] = None) -> int:
+        """Durably queue `messages` (and set `marks`) in one write; returns how many were new."""
+        batch = list(messages)
+        with self._cond:
+            fresh: Dict[str, OutboxItem] = {}
+            for key, cid, text, note in batch:
+                if key not in self._pending and key not in self._done and key not in fresh:
+                    fresh[key] = OutboxItem(
+                        key, int(cid), text, note, priority=message_priority(key), queued_at=time.time()
+                    )
+            if fresh or marks:
+                self._append(_put_record(list(fresh.values()), marks))
+            self._add(fresh.values())
+            for item in fresh.values():
+                self._schedule(item)
+            for name, value in (marks or {}).items():
+                self._marks[name] = value
+                self._mark_keys[name] = [key for key, _, _, _ in batch]
+            OUTBOX_PENDING.set(len(self._pending), bot=self.name)
+            self._cond.notify_all()
+        return len(fresh)
+
+    def take(self, limit: int) -> List[OutboxItem]:
+        """Claim up to `limit` due messages: replies first, then alerts, oldest first."""
+        now = time.monotonic()
+        items: List[OutboxItem] = []
+        with self._cond:
+            for queue in self._queues:
+                while len(items) < limit:
+                    due = self._head(queue)
+                    if due is None or due > now:
+                        break
+                    item = heapq.heappop(queue)[2]
+                    item.in_flight = True
+                    items.append(item)
+        return items
+
+    def ack(self, keys: List[str]) -> None:
+        """Remove delivered (or abandoned) messages for good."""
+        if not keys:
+            return
+        with self._cond:
+            for key in keys:
+                if self._pending.pop(key, None) is not None:
+                    self._done.add(key)
+            self._append({"ack": keys})
+            self._acks += len(keys)
+            if self._acks >= max(COMPACT_AFTER_ACKS, len(self._pending)):
+                self._file.close()
+                self._rewrite()
+                self._file = open(self.path, "a", encoding="utf-8")
+            OUTBOX_PENDING.set(len(self._pending), bot=self.name)
+            self._cond.notify_all()
+
+    def retry(self, item: OutboxItem, delay: float) -> None:
+        """Hand a claimed message back, due again after `delay` seconds."""
+        with self._cond:
+            item.in_flight = False
+            item.attempts += 1
+            item.not_before = time.monotonic() + delay
+            self._schedule(item)
+            self._cond.notify_all()
+
+    def defer(self, item: OutboxItem, delay: float) -> None:
+        """Hand back a claimed message that was not sent (e.g. rate limited); not counted as an attempt."""
+        with self._cond:
+            item.in_flight = False
+            item.not_before = time.monotonic() + delay
+            self._schedule(item)
+            self._cond.notify_all()
+
+    def wait(self, timeout: float) -> None:
+        """Block until messages are added or handed back, or `timeout` passes."""
+        with self._cond:
+            self._cond.wait(max(0.0, timeout))
+
+    def next_due(self) -> Optional[float]:
+        """Seconds until the earliest unclaimed message is due (None if there is none)."""
+        with self._cond:
+            waiting = [due for due in map(self._head, self._queues) if due is not None]
+        if not waiting:
+            return None
+        return max(0.0, min(waiting) - time.monotonic())
+
+    def join(self, timeout: float) -> bool:
+        """Wait until every message has been acked; False if `timeout` passed first."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def wake(self) -> None:
+        with self._cond:
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            self._file.close()
+
+    def _add(self, items: Iterable[OutboxItem]) -> None:
+        for item in items:
+            self._pending[item.key] = item
+
+    def _schedule(self, item: OutboxItem) -> None:
+        queue = self._queues[0 if item.priority == PRIORITY_REPLY else 1]
+        heapq.heappush(queue, (item.not_before, next(self._seq), item))
+
+    def _head(self, queue: List[Tuple[float, int, OutboxItem]]) -> Optional[float]:
+        """Due time of the first unclaimed message in `queue`, dropping stale entries on the way."""
+        while queue:
+            due, _, item = queue[0]
+            if not item.in_flight and item.not_before == due and self._pending.get(item.key) is item:
+                return due
+            heapq.heappop(queue)
+        return None
+
+    def _append(self, record: dict) -> None:
+        with PERSIST_SECONDS.time(operation="outbox_append"):
+            self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def _load(self) -> None:
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-write; it was never acknowledged
+                    log.warning("outbox: ignoring unreadable record in %s", self.path)
+                    break
+                self._replay(record)
+
+    def _replay(self, record: dict) -> None:
+        strings = record.get("strings", [])
+        batch = []
+        for row in record.get("put", []):
+            key, cid, text, note = row[:4]
+            batch.append(key)
+            if key not in self._done:
+                # Files written before queue times were recorded count from now
+                queued_at = row[4] if len(row) > 4 else time.time()
+                item = OutboxItem(key, int(cid), strings[text], strings[note], priority=message_priority(key))
+                item.queued_at = queued_at
+                self._add([item])
+        for name, value in (record.get("marks") or {}).items():
+            self._marks[name] = value
+            self._mark_keys[name] = batch + record.get("seen", [])
+        for key in record.get("ack", []) + record.get("seen", []):
+            self._pending.pop(key, None)
+            self._done.add(key)
+
+    def _rewrite(self) -> None:
+        keep = {key for keys in self._mark_keys.values() for key in keys}
+        record = _put_record(list(self._pending.values()), self._marks)
+        record["seen"] = sorted(keep & self._done)
+        tmp_path = f"{self.path}.tmp"
+        with PERSIST_SECONDS.time(operation="outbox_rewrite"):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        self._done &= keep
+        self._acks = 0
+        OUTBOX_PENDING.set(len(self._pending), bot=self.name)
+
+
+def _put_record(items: List[OutboxItem], marks: Optional[Dict[str, int]]) -> dict:
+    # Alert texts repeat across a batch, so strings are stored once and referenced by index
+    strings: Dict[str, int] = {}
+    rows = []
+    for item in items:
+        text = strings.setdefault(item.text, len(strings))
+        note = strings.setdefault(item.note, len(strings))
+        rows.append([item.key, item.chat_id, text, note, round(item.queued_at, 3)])
+    record: dict = {"put": rows, "strings": list(strings)}
+    if marks:
+        record["marks"] = dict(marks)
+    return record
+
+
+class OutboxDrainer:
+    """Sends outbox messages from a background thread with up to `workers` sends in flight.
+
+    Sends are paced by `scheduler` (unlimited by default). Delivered messages
+    and permanent failures (e.g. 403 blocked by the user) are acked in
+    batches; transient failures (network, 429, 5xx) are handed back with
+    backoff that honours Retry-After, and a 429 also slows the scheduler down.
+    A message that still fails after `max_attempts` tries, or `max_age_seconds`
+    after it was queued, is dropped like a permanent failure.
+    """
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        send: Callable[[int, str], None],
+        workers: int = 16,
+        retry_policy: Optional[RetryPolicy] = None,
+        scheduler: Optional[SendScheduler] = None,
+        max_attempts: int = MAX_ATTEMPTS,
+        max_age_seconds: float = MAX_AGE_SECONDS,
+    ) -> None:
+        self.outbox = outbox
+        self.max_attempts = max(1, max_attempts)
+        self.max_age_seconds = max_age_seconds
+        self.send = send
+        self.workers = max(1, workers)
+        self.retry_policy = retry_policy or RetryPolicy(base_delay=1.0, max_delay=60.0)
+        self.scheduler = scheduler or SendScheduler(rate=0, chat_rate=0)
+        self._stop = threading.Event()
+        self._deadline = 0.0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "OutboxDrainer":
+        self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, drain_seconds: float = 5.0) -> None:
+        """Keep sending what is due for up to `drain_seconds`; the rest stays queued on disk."""
+        self._deadline = time.monotonic() + drain_seconds
+        self._stop.set()
+        self.outbox.wake()
+        if self._thread is not None:
+            self._thread.join(drain_seconds + 1.0)
+        left = len(self.outbox)
+        if left:
+            log.info("outbox: %d messages left queued for the next start", left)
+
+    def _run(self) -> None:
+        in_flight: Dict[Future, OutboxItem] = {}
+        finished: List[str] = []
+        acked_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sender") as pool:
+            while True:
+                stopping = self._stop.is_set()
+                if stopping and time.monotonic() >= self._deadline:
+                    break
+                # Keep a few sends queued per worker so workers never wait on this thread
+                free = min(self.workers * 4 - len(in_flight), self.scheduler.available())
+                for item in self.outbox.take(int(free)) if free >= 1 else ():
+                    wait_seconds = self.scheduler.acquire(item.chat_id)
+                    if wait_seconds > 0:
+                        self.outbox.defer(item, wait_seconds)
+                        continue
+                    in_flight[pool.submit(self.send, item.chat_id, item.text)] = item
+                if in_flight:
+                    done, _ = wait(in_flight, timeout=ACK_INTERVAL_SECONDS, return_when=FIRST_COMPLETED)
+                    finished.extend(self._settle([(future, in_flight.pop(future)) for future in done]))
+                now = time.monotonic()
+                if finished and (not in_flight or len(finished) >= self.workers * 4 or now - acked_at >= ACK_INTERVAL_SECONDS):
+                    try:
+                        self.outbox.ack(finished)
+                    except Exception as e:  # noqa: BLE001
+                        # The messages stay pending (claimed) and are resent after a restart
+                        log.warning("outbox ack error: %s", repr(e))
+                    finished, acked_at = [], now
+                if not in_flight:
+                    if stopping:
+                        break
+                    due = self.outbox.next_due()
+                    if due is not None:
+                        due = max(due, self.scheduler.delay())
+                    self.outbox.wait(1.0 if due is None else min(1.0, due))
+            if finished:
+                self.outbox.ack(finished)
+
+    def _settle(self, results: List[Tuple[Future, OutboxItem]]) -> List[str]:
+        """Log and classify finished sends; returns the keys to ack."""
+        finished: List[str] = []
+        for future, item in results:
+            error = future.exception()
+            if error is None:
+                finished.append(item.key)
+                if item.note:
+                    log.info("%s", item.note)
+            elif is_retryable(error) and not self._expired(item):
+                delay = self.retry_policy.delay(item.attempts + 1, error)
+                if getattr(getattr(error, "response", None), "status_code", None) == 429:
+                    self.scheduler.throttled(item.chat_id, delay)
+                log.warning("send error cid=%s err=%s, retry in %.1fs", item.chat_id, repr(error), delay)
+                self.outbox.retry(item, delay)
+            else:
+                attempts = item.attempts + 1
+                log.warning("send error cid=%s err=%s, dropped after %d attempt(s)", item.chat_id, repr(error), attempts)
+                finished.append(item.key)
+        return finished
+
+    def _expired(self, item: OutboxItem) -> bool:
+        """True once `item` has used its attempts or outlived its age limit."""
+        return item.attempts + 1 >= self.max_attempts or time.time() - item.queued_at >= self.max_age_seconds
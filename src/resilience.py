@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import email.utils
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional, TypeVar
+
+import requests
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while a circuit breaker is open."""
+
+    def __init__(self, name: str, retry_in: float) -> None:
+        super().__init__(f"circuit '{name}' open, retry in {retry_in:.1f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def _status_of(error: BaseException) -> Optional[int]:
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def _chain(error: Optional[BaseException]) -> Iterator[BaseException]:
+    # Wrapped errors (raise X from cause) are classified by their causes too
+    while error is not None:
+        yield error
+        error = error.__cause__
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Transient failures (network, timeouts, 429, 5xx) are retryable; other 4xx and bad data are not."""
+    for item in _chain(error):
+        if isinstance(item, CircuitOpenError):
+            return True
+        status = _status_of(item)
+        if status is not None:
+            return status in RETRYABLE_STATUS
+        if isinstance(item, (requests.ConnectionError, requests.Timeout)):
+            return True
+    return False
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Seconds requested by the error's `retry_after` or a Retry-After header (delta or HTTP date), if any."""
+    for item in _chain(error):
+        seconds = _retry_after_of(item)
+        if seconds is not None:
+            return seconds
+    return None
+
+
+def _retry_after_of(error: BaseException) -> Optional[float]:
+    if isinstance(error, CircuitOpenError):
+        return error.retry_in
+    requested = getattr(error, "retry_after", None)
+    if requested is not None:
+        return max(0.0, float(requested))
+    response = getattr(error, "response", None)
+    header = getattr(response, "headers", {}).get("Retry-After") if response is not None else None
+    if not header:
+        return None
+    try:
+        return max(0.0, float(header))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter that honours Retry-After."""
+
+    attempts: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    jitter: float = 1.0  # fraction of the backoff that is randomised
+
+    def delay(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """Delay before retry number `attempt` (1-based)."""
+        backoff = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        backoff -= random.uniform(0, backoff * self.jitter)
+        requested = retry_after_seconds(error) if error is not None else None
+        if requested is not None:
+            backoff = max(backoff, min(requested, self.max_delay))
+        return backoff
+
+    def call(self, operation: Callable[[], T], sleep: Callable[[float], None] = time.sleep) -> T:
+        """Run `operation`, retrying retryable errors. Blocks; keep it off the bot loop."""
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return operation()
+            except Exception as error:  # noqa: BLE001 - classified below
+                if attempt >= self.attempts or not is_retryable(error):
+                    raise
+                sleep(self.delay(attempt, error))
+        raise AssertionError("unreachable")
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures.
+
+    While open, calls fail fast with CircuitOpenError. After `reset_seconds`
+    (or a longer Retry-After) one half-open probe is let through; success
+    closes the circuit, failure re-opens it with a doubled timeout, capped at
+    `max_reset_seconds`. A failure carrying Retry-After opens it at once for
+    at least that long. Non-retryable errors (4xx, bad data) do not count:
+    the upstream answered, so opening the circuit would not help.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_seconds: float = 60.0,
+        max_reset_seconds: float = 900.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.max_reset_seconds = max_reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_until: Optional[float] = None
+        self._current_reset = reset_seconds
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_until is None:
+                return "closed"
+            if self._probing or self._clock() >= self._opened_until:
+                return "half_open"
+            return "open"
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may proceed now."""
+        with self._lock:
+            if self._opened_until is None:
+                return
+            now = self._clock()
+            if now < self._opened_until or self._probing:
+                raise CircuitOpenError(self.name, max(0.0, self._opened_until - now))
+            self._probing = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_until = None
+            self._current_reset = self.reset_seconds
+            self._probing = False
+
+    def record_failure(self, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if error is not None and not is_retryable(error):
+                self._probing = False
+                return
+            self._failures += 1
+            requested = retry_after_seconds(error) if error is not None else None
+            if self._probing:
+                self._current_reset = min(self.max_reset_seconds, self._current_reset * 2)
+            elif self._failures < self.failure_threshold and requested is None:
+                return
+            self._probing = False
+            self._opened_until = self._clock() + max(self._current_reset, requested or 0.0)
+
+    def call(self, operation: Callable[[], T]) -> T:
+        self.before_call()
+        try:
+            result = operation()
+        except Exception as error:
+            self.record_failure(error)
+            raise
+        self.record_success()
+        return result
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import heapq
+import logging
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+from src.metrics import JOB_LAG_SECONDS
+
+log = logging.getLogger("src.main")
+
+# What a periodic job does after running late (or taking longer than its interval)
+MISSED_SKIP = "skip"  # keep the original cadence and drop the runs that were missed
+MISSED_CATCH_UP = "catch_up"  # run every missed deadline, back to back
+MISSED_DELAY = "delay"  # run `interval` after the previous run finished
+MISSED_POLICIES = (MISSED_SKIP, MISSED_CATCH_UP, MISSED_DELAY)
+
+# A job returns None to keep its interval, or the seconds until its next run
+JobFn = Callable[[], Optional[float]]
+
+
+@dataclass(eq=False)
+class Job:
+    name: str
+    fn: JobFn
+    interval: Optional[float]  # None for a one-shot job
+    jitter: float = 0.0  # each deadline is pushed back by up to this many seconds
+    missed: str = MISSED_SKIP
+    base: float = 0.0  # the deadline without jitter, on the monotonic clock
+    due: float = 0.0
+    lag: float = 0.0  # how late the current (or last) run started
+    runs: int = 0
+    cancelled: bool = field(default=False, repr=False)
+
+
+class Scheduler:
+    """Runs periodic and one-shot jobs at deadlines on the monotonic clock.
+
+    Deadlines live in a heap, so finding the next one is O(1) and adding or
+    rescheduling a job O(log n); `run` sleeps exactly until the next
+    deadline. A job that raises is logged and keeps its schedule. Jobs run
+    on the thread that calls `run_due`, one at a time.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic, rng: Optional[random.Random] = None) -> None:
+        self._clock = clock
+        self._rng = rng or random.Random()
+        self._heap: List[Tuple[float, int, Job]] = []
+        self._seq = 0
+
+    def every(
+        self,
+        name: str,
+        interval: float,
+        fn: JobFn,
+        delay: float = 0.0,
+        jitter: float = 0.0,
+        missed: str = MISSED_SKIP,
+    ) -> Job:
+        """Run `fn` every `interval` seconds, first after `delay`.
+
+        Only MISSED_DELAY jobs may have an interval of 0: they run again as soon as they return.
+        """
+        if interval < 0 or (interval == 0 and missed != MISSED_DELAY):
+            raise ValueError(f"job {name}: interval must be positive, got {interval}")
+        if missed not in MISSED_POLICIES:
+            raise ValueError(f"job {name}: missed must be one of {', '.join(MISSED_POLICIES)}, got {missed!r}")
+        job = Job(name, fn, float(interval), max(0.0, jitter), missed)
+        self._schedule(job, self._clock() + max(0.0, delay))
+        return job
+
+    def once(self, name: str, delay: float, fn: JobFn, jitter: float = 0.0) -> Job:
+        """Run `fn` once after `delay` seconds; a number it returns runs it again after that many seconds."""
+        job = Job(name, fn, None, max(0.0, jitter))
+        self._schedule(job, self._clock() + max(0.0, delay))
+        return job
+
+    def cancel(self, job: Job) -> None:
+        # Left in the heap and dropped when it comes up, which keeps cancel O(1)
+        job.cancelled = True
+
+    def _schedule(self, job: Job, base: float) -> None:
+        job.base = base
+        job.due = base + (self._rng.uniform(0.0, job.jitter) if job.jitter else 0.0)
+        self._seq += 1
+        heapq.heappush(self._heap, (job.due, self._seq, job))
+
+    def _pop_cancelled(self) -> None:
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+
+    def next_delay(self) -> float:
+        """Seconds until the earliest deadline (0 if one is due, inf without jobs)."""
+        self._pop_cancelled()
+        if not self._heap:
+            return math.inf
+        return max(0.0, self._heap[0][0] - self._clock())
+
+    def run_due(self) -> float:
+        """Run every job whose deadline has passed; returns `next_delay()`.
+
+        Deadlines are compared with the time on entry: a MISSED_CATCH_UP job
+        runs its missed deadlines here, but jobs that overrun their interval
+        cannot keep the call going forever.
+        """
+        now = self._clock()
+        while True:
+            self._pop_cancelled()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            _, _, job = heapq.heappop(self._heap)
+            self._run(job)
+        return self.next_delay()
+
+    def _run(self, job: Job) -> None:
+        started = self._clock()
+        job.lag = max(0.0, started - job.due)
+        JOB_LAG_SECONDS.set(job.lag, job=job.name)
+        job.runs += 1
+        override: Optional[float] = None
+        try:
+            override = job.fn()
+        except Exception as e:  # noqa: BLE001
+            log.warning("job %s error: %s", job.name, repr(e))
+        if job.cancelled:
+            return
+        finished = self._clock()
+        if override is not None:
+            # Measured from the deadline, so a job that paces itself does not drift either;
+            # one that is already overdue runs again straight away
+            base = (finished if job.missed == MISSED_DELAY else job.base) + max(0.0, override)
+            base = max(base, finished)
+        elif job.interval is None:
+            return
+        elif job.missed == MISSED_DELAY:
+            base = finished + job.interval
+        else:
+            base = job.base + job.interval
+            if job.missed == MISSED_SKIP and base < finished:
+                missed = math.ceil((finished - base) / job.interval)
+                log.info("job %s missed %d run(s)", job.name, missed)
+                base += missed * job.interval
+        self._schedule(job, base)
+
+    def run(self, stop: threading.Event, wait: Optional[Callable[[float], None]] = None) -> None:
+        """Run jobs until `stop` is set, sleeping until the next deadline in between.
+
+        The sleep is `stop.wait`, so a signal handler that sets `stop` ends it
+        at once. `wait(seconds)` replaces it, e.g. to block on incoming
+        updates; it may return early and is called again with the time left.
+        """
+        while not stop.is_set():
+            delay = self.run_due()
+            if stop.is_set():
+                break
+            if wait is not None:
+                wait(delay)
+            else:
+                stop.wait(None if math.isinf(delay) else delay)
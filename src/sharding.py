@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+import dataclasses
+import glob
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.bot import (
+    BotContext,
+    add_maintenance_jobs,
+    answer_value_requests,
+    apply_readings,
+    board_settings,
+    ensure_last_value,
+    fetch_check_readings,
+    handle_updates,
+    last_readings,
+    load_boards,
+    loop_period_seconds,
+    next_check_delay,
+    queue_alerts,
+    queue_replies,
+    record_readings,
+    run_checks,
+    save_snapshot,
+    unseen_updates,
+)
+from src.config import Settings
+from src.http_session import close_session, configure_session, set_telegram_api_base
+from src.logging_setup import listen_for_queue_logging, setup_queue_logging
+from src.metrics import CHECK_LAG_SECONDS, STARTUP, beat
+from src.outbox import Outbox
+from src.scheduler import MISSED_DELAY, Scheduler
+from src.subscribers import (
+    Subscriber,
+    close_stores,
+    is_sqlite_path,
+    legacy_json_path,
+    read_subscribers,
+    write_subscribers,
+)
+from src.updates import get_updates, parse_update
+from src.webhook import WebhookReceiver
+
+log = logging.getLogger("src.main")
+
+_SHARD_RE = re.compile(r"\.(\d+)-of-(\d+)")
+_JOIN_SECONDS = 10.0
+_REVIVE_SECONDS = 5.0  # how often the coordinator restarts workers that died
+# Answered by the coordinator, which keeps the history, instead of the chat's shard
+COORDINATOR_COMMANDS = ("history",)
+
+# Messages from the coordinator to a worker:
+#   ("updates", [update, ...])  commands for chats owned by the shard
+#   ("value", readings)         latest value per metric, sent ahead of updates containing /value
+#   ("check", readings)         run a dominance check of every metric against `readings`
+#   ("stop", None)
+Message = Tuple[str, object]
+
+
+def shard_of(chat_id: int, count: int) -> int:
+    return chat_id % count if count > 1 else 0
+
+
+def shard_path(file_path: str, index: int, count: int) -> str:
+    """`subscribers.db` -> `subscribers.2-of-4.db`; unchanged when not sharded."""
+    if count <= 1:
+        return file_path
+    root, ext = os.path.splitext(file_path)
+    return f"{root}.{index}-of-{count}{ext}"
+
+
+def shard_settings(settings: Settings, index: int, count: int) -> Settings:
+    """Per-shard settings: own subscriber store, state file and outbox; history stays with the coordinator."""
+    return dataclasses.replace(
+        settings,
+        subscribers_file_path=shard_path(settings.subscribers_file_path, index, count),
+        state_file_path=shard_path(settings.state_file_path, index, count),
+        outbox_file_path=shard_path(settings.outbox_file_path, index, count),
+        history_file_path="",
+    )
+
+
+def _other_layouts(file_path: str, count: int) -> List[str]:
+    root, ext = os.path.splitext(file_path)
+    found = []
+    for candidate in glob.glob(f"{glob.escape(root)}.*-of-*{glob.escape(ext)}"):
+        # Only `<root>.i-of-n<ext>`: not e.g. `<root>.eth.0-of-2<ext>`, another metric's store
+        match = _SHARD_RE.fullmatch(candidate[len(root) : len(candidate) - len(ext)])
+        if match and int(match.group(2)) != count:
+            found.append(candidate)
+    return sorted(found)
+
+
+def prepare_shards(file_path: str, count: int) -> int:
+    """Split subscribers into `count` shard stores if that layout does not exist yet.
+
+    Sources are the unsharded store and shard stores of any other count; they
+    are merged, re-partitioned and renamed to `<name>.resharded`. With
+    `count` 1 this merges shards back into the single store. Returns the
+    number of subscribers moved.
+    """
+    targets = [shard_path(file_path, i, count) for i in range(count)]
+    if any(os.path.exists(path) for path in targets):
+        return 0
+    sources = _other_layouts(file_path, count)
+    if count > 1 and (
+        os.path.exists(file_path) or (is_sqlite_path(file_path) and os.path.exists(legacy_json_path(file_path)))
+    ):
+        sources.insert(0, file_path)
+    if not sources:
+        return 0
+
+    merged: Dict[int, Subscriber] = {}
+    for source in sources:
+        merged.update(read_subscribers(source))
+    parts: List[Dict[int, Subscriber]] = [{} for _ in range(count)]
+    for cid, sub in merged.items():
+        parts[shard_of(cid, count)][cid] = sub
+    for path, part in zip(targets, parts):
+        write_subscribers(path, part)
+    close_stores()
+    for source in sources:
+        if os.path.exists(source):
+            os.replace(source, f"{source}.resharded")
+    log.info("resharded %d subscribers from %s into %d stores", len(merged), sources, count)
+    return len(merged)
+
+
+def adopt_outboxes(outbox: Outbox, count: int) -> int:
+    """Move messages left in outboxes of another shard count into `outbox`.
+
+    The old files are renamed to `<name>.resharded`. Returns the number of
+    messages moved.
+    """
+    moved = 0
+    for path in _other_layouts(outbox.path, count):
+        old = Outbox(path)
+        moved += outbox.put(old.pending())
+        old.close()
+        os.replace(path, f"{path}.resharded")
+    if moved:
+        log.info("moved %d queued messages from outboxes of another shard count", moved)
+    return moved
+
+
+def route_updates(updates: List[dict], count: int) -> Tuple[Dict[int, List[dict]], Set[int], List[dict]]:
+    """Group command updates by owning shard; also return the shards that got a /value.
+
+    Commands in COORDINATOR_COMMANDS need no subscriber and read the
+    coordinator's history, so they are returned separately for it to answer.
+    """
+    routed: Dict[int, List[dict]] = {}
+    wants_value: Set[int] = set()
+    local: List[dict] = []
+    for upd in updates:
+        cmd = parse_update(upd)
+        if cmd is None:
+            continue
+        if cmd.name in COORDINATOR_COMMANDS:
+            local.append(upd)
+            continue
+        shard = shard_of(cmd.chat_id, count)
+        routed.setdefault(shard, []).append(upd)
+        if cmd.name == "value":
+            wants_value.add(shard)
+    return routed, wants_value, local
+
+
+class _ShardPrefix(logging.Filter):
+    def __init__(self, index: int, count: int) -> None:
+        super().__init__()
+        self.prefix = f"[shard {index}/{count}] "
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.msg = self.prefix + record.getMessage()
+        record.args = ()
+        return True
+
+
+def run_worker(settings: Settings, index: int, count: int, inbox, log_queue) -> None:  # noqa: ANN001 - mp queues
+    """Worker process: owns one subscriber shard, evaluates zones and sends its own alerts."""
+    # The coordinator handles signals and tells workers to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    setup_queue_logging(log_queue, _ShardPrefix(index, count))
+
+    from src.main import start_drainer
+
+    own = shard_settings(settings, index, count)
+    configure_session(own.http_pool_connections, own.http_pool_maxsize)
+    set_telegram_api_base(own.telegram_api_base)
+    ctx = load_boards(settings, derive=lambda board: shard_settings(board, index, count))
+    drainer = start_drainer(own, ctx.outbox)
+
+    while True:
+        kind, payload = inbox.get()
+        try:
+            if kind == "stop":
+                break
+            if kind == "value":
+                apply_readings(ctx, payload)
+            elif kind == "check":
+                run_checks(ctx, payload, queue_alerts)
+            elif kind == "updates":
+                updates = unseen_updates(ctx, payload)
+                replies: List[Tuple[int, str, str]] = []
+                value_ids = handle_updates(ctx, updates, lambda *message: replies.append(message))
+                if value_ids:
+                    answer_value_requests(ctx, value_ids, lambda *message: replies.append(message))
+                queue_replies(ctx, updates, replies)
+        except Exception as e:  # noqa: BLE001
+            log.warning("worker error kind=%s: %s", kind, repr(e))
+
+    drainer.stop()
+    ctx.outbox.close()
+    close_session()
+    close_stores()
+    save_snapshot(ctx)
+
+
+class ShardPool:
+    """Worker processes, one per shard, each fed through its own queue."""
+
+    def __init__(self, settings: Settings, count: int) -> None:
+        self.settings = settings
+        self.count = count
+        self._mp = multiprocessing.get_context("spawn")
+        self.log_queue = self._mp.Queue()
+        self.inboxes = [self._mp.Queue() for _ in range(count)]
+        self.processes: List[Optional[multiprocessing.process.BaseProcess]] = [None] * count
+
+    def _spawn(self, index: int) -> None:
+        proc = self._mp.Process(
+            target=run_worker,
+            args=(self.settings, index, self.count, self.inboxes[index], self.log_queue),
+            name=f"shard-{index}",
+            daemon=True,
+        )
+        proc.start()
+        self.processes[index] = proc
+
+    def start(self) -> None:
+        for index in range(self.count):
+            self._spawn(index)
+
+    def revive(self) -> None:
+        """Restart dead workers; their queues (and pending messages) are kept."""
+        for index, proc in enumerate(self.processes):
+            if proc is not None and not proc.is_alive():
+                log.warning("shard %d worker exited code=%s, restarting", index, proc.exitcode)
+                self._spawn(index)
+
+    def send(self, index: int, kind: str, payload: object = None) -> None:
+        self.inboxes[index].put((kind, payload))
+
+    def broadcast(self, kind: str, payload: object = None) -> None:
+        for index in range(self.count):
+            self.send(index, kind, payload)
+
+    def stop(self) -> None:
+        self.broadcast("stop")
+        deadline = time.monotonic() + _JOIN_SECONDS
+        for proc in self.processes:
+            if proc is not None:
+                proc.join(max(0.0, deadline - time.monotonic()))
+                if proc.is_alive():
+                    proc.terminate()
+
+
+def load_coordinator_context(settings: Settings) -> BotContext:
+    """Context for the coordinator: fetcher, cache and history, but no subscribers."""
+    return load_boards(settings, empty=True)
+
+
+def run_sharded(ctx: BotContext, receiver: Optional[WebhookReceiver] = None) -> None:
+    """Coordinator loop: fetch once per check and fan commands and values out to shard workers."""
+    settings = ctx.settings
+    count = settings.shard_count
+    for _, own in board_settings(settings):
+        prepare_shards(own.subscribers_file_path, count)
+
+    stop = threading.Event()
+
+    def _stop(signum, frame):  # noqa: ANN001 - standard signal signature
+        stop.set()
+
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+
+    pool = ShardPool(settings, count)
+    listener = listen_for_queue_logging(pool.log_queue)
+    pool.start()
+    log.info("sharded mode started workers=%d", count)
+
+    scheduler = Scheduler()
+    last_update_id: Optional[int] = None
+
+    def route(timeout: Optional[float] = None) -> None:
+        nonlocal last_update_id
+        try:
+            if receiver is not None:
+                updates = receiver.next_batch(min(1.0, timeout or 0.0))
+            else:
+                last_update_id, updates = get_updates(
+                    settings.telegram_bot_token, last_update_id, settings.updates_poll_seconds
+                )
+            if updates:
+                routed, wants_value, local = route_updates(updates, count)
+                if local:
+                    replies: List[Tuple[int, str, str]] = []
+                    handle_updates(ctx, local, lambda *message: replies.append(message))
+                    queue_replies(ctx, local, replies, part="coordinator")
+                if wants_value:
+                    ensure_last_value(ctx)
+                    for shard in wants_value:
+                        pool.send(shard, "value", last_readings(ctx))
+                for shard, batch in routed.items():
+                    pool.send(shard, "updates", batch)
+        except Exception as e:  # noqa: BLE001
+            log.warning("updates error: %s", repr(e))
+        STARTUP.ready()
+        beat("main", loop_period_seconds(settings))
+
+    def check() -> float:
+        CHECK_LAG_SECONDS.set(check_job.lag)
+        check_error: Optional[Exception] = None
+        try:
+            readings = fetch_check_readings(ctx)
+            record_readings(ctx, readings)
+            pool.broadcast("check", readings)
+            shown = ", ".join(f"{name}={value:.2f}" for name, value in readings.items())
+            log.info("broadcast values %s to %d shards", shown, count)
+        except Exception as e:  # noqa: BLE001
+            check_error = e
+            log.warning("check error: %s", repr(e))
+        return next_check_delay(ctx, check_error)
+
+    if receiver is None:
+        scheduler.every("updates", settings.updates_poll_seconds, route, missed=MISSED_DELAY)
+    check_job = scheduler.every("check", settings.check_interval_seconds, check)
+    scheduler.every("revive", _REVIVE_SECONDS, pool.revive, delay=_REVIVE_SECONDS)
+    add_maintenance_jobs(scheduler, [ctx])
+    try:
+        scheduler.run(stop, route if receiver is not None else None)
+    finally:
+        pool.stop()
+        listener.stop()
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import logging
+import mmap
+import os
+import struct
+from typing import Dict, Mapping, Optional, Tuple, Union
+
+from src.metrics import PERSIST_SECONDS
+from src.subscriber_table import ZONE_CODES, ZONE_NAMES, ZONE_NONE, SubscriberTable, load_numpy
+from src.subscribers import Subscriber
+
+log = logging.getLogger("src.main")
+
+MAGIC = b"BTCDSNP1"
+# magic, record count, then (size, mtime_ns, inode) of the store file and of its SQLite -wal file
+_HEADER = struct.Struct("<8sQ6q")
+# chat_id, upper, lower, last_value (NaN = None), last_zone (a ZONE_* code); packed, 33 bytes
+_RECORD = struct.Struct("<qdddb")
+_FIELDS = (("chat_id", "<i8"), ("upper", "<f8"), ("lower", "<f8"), ("last_value", "<f8"), ("last_zone", "i1"))
+
+Stamp = Tuple[int, int, int, int, int, int]
+
+_NAN = float("nan")
+
+
+def _nan(value: Optional[float]) -> float:
+    return _NAN if value is None else float(value)
+
+
+def _opt(value: float) -> Optional[float]:
+    return None if value != value else value  # NaN -> None
+
+
+def snapshot_path(file_path: str) -> str:
+    """`subscribers.db` -> `subscribers.snap`."""
+    return os.path.splitext(file_path)[0] + ".snap"
+
+
+def store_stamp(file_path: str) -> Stamp:
+    """Identity of the store's current contents; any write to it changes this."""
+    stamp = []
+    for path in (file_path, f"{file_path}-wal"):
+        try:
+            st = os.stat(path)
+            stamp.extend((st.st_size, st.st_mtime_ns, st.st_ino))
+        except OSError:
+            stamp.extend((-1, -1, -1))
+    return tuple(stamp)  # type: ignore[return-value]
+
+
+def write_snapshot(file_path: str, subscribers: Mapping[int, Subscriber]) -> int:
+    """Write the snapshot for the store at `file_path`; returns the number of records.
+
+    Only call this once `subscribers` matches what the store holds and the
+    store is closed, e.g. on shutdown: the snapshot is stamped with the
+    store's current state and trusted while that stamp still matches.
+    """
+    path = snapshot_path(file_path)
+    tmp_path = f"{path}.tmp"
+    with PERSIST_SECONDS.time(operation="snapshot_write"):
+        header = _HEADER.pack(MAGIC, len(subscribers), *store_stamp(file_path))
+        np = load_numpy() if isinstance(subscribers, SubscriberTable) else None
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            if np is not None:
+                records = np.empty(len(subscribers), dtype=np.dtype(list(_FIELDS)))
+                for name, _ in _FIELDS:
+                    records[name] = getattr(subscribers, name)
+                f.write(records.tobytes())
+            else:
+                body = bytearray()
+                for cid in sorted(subscribers):
+                    sub = subscribers[cid]
+                    zone = ZONE_CODES.get(sub.last_zone or "", ZONE_NONE)
+                    body += _RECORD.pack(cid, _nan(sub.upper), _nan(sub.lower), _nan(sub.last_value), zone)
+                f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    return len(subscribers)
+
+
+def read_snapshot(
+    file_path: str, columnar: bool = False
+) -> Optional[Union[Dict[int, Subscriber], SubscriberTable]]:
+    """Load the snapshot for the store at `file_path` if it is still current.
+
+    Returns a SubscriberTable with `columnar` (columns copied straight out
+    of the mapped file with NumPy) or a dict of Subscriber, or None when the
+    snapshot is missing, unreadable or older than the store.
+    """
+    path = snapshot_path(file_path)
+    try:
+        with PERSIST_SECONDS.time(operation="snapshot_read"), open(path, "rb") as f:
+            magic, count, *stamp = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC or tuple(stamp) != store_stamp(file_path):
+                return None
+            if os.fstat(f.fileno()).st_size != _HEADER.size + count * _RECORD.size:
+                log.warning("snapshot %s has the wrong size, ignoring it", path)
+                return None
+            if count == 0:
+                return SubscriberTable() if columnar else {}
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if columnar:
+                    return _table_from(mapped, count)
+                return {
+                    cid: Subscriber(upper=_opt(up), lower=_opt(lo), last_zone=ZONE_NAMES.get(zone), last_value=_opt(lv))
+                    for cid, up, lo, lv, zone in _RECORD.iter_unpack(mapped[_HEADER.size :])
+                }
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, struct.error) as e:
+        log.warning("snapshot %s unreadable, ignoring it: %s", path, repr(e))
+        return None
+
+
+def _table_from(mapped: mmap.mmap, count: int) -> SubscriberTable:
+    np = load_numpy()
+    if np is None:
+        rows = list(_RECORD.iter_unpack(mapped[_HEADER.size :]))
+        columns = {name: [row[i] for row in rows] for i, (name, _) in enumerate(_FIELDS)}
+    else:
+        records = np.frombuffer(mapped, dtype=np.dtype(list(_FIELDS)), count=count, offset=_HEADER.size)
+        columns = {name: records[name].copy() for name, _ in _FIELDS}
+        del records  # release the buffer so the map can close
+    return SubscriberTable.from_columns(
+        columns["chat_id"], columns["upper"], columns["lower"], columns["last_zone"], columns["last_value"]
+    )
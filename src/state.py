@@ -4,11 +4,14 @@ import json
 import os
 from dataclasses import dataclass, asdict
 
+from src.metrics import PERSIST_SECONDS
+
 
 @dataclass
 class BotState:
     last_zone: str | None  # 'above' | 'below' | 'neutral' | None
     last_value: float | None
+    checks: int = 0  # completed dominance checks; numbers each check's outbox keys
 
 
 def ensure_parent_directory(file_path: str) -> None:
@@ -21,7 +24,9 @@ def read_state(file_path: str) -> BotState:
     try:
         with open(file_path, "r", encoding="utf-8") as f:
             data = json.load(f)
-            return BotState(last_zone=data.get("last_zone"), last_value=data.get("last_value"))
+            return BotState(
+                last_zone=data.get("last_zone"), last_value=data.get("last_value"), checks=int(data.get("checks") or 0)
+            )
     except FileNotFoundError:
         return BotState(last_zone=None, last_value=None)
     except Exception:
@@ -30,10 +35,11 @@ def read_state(file_path: str) -> BotState:
 
 
 def write_state(file_path: str, state: BotState) -> None:
-    ensure_parent_directory(file_path)
-    tmp_path = f"{file_path}.tmp"
-    with open(tmp_path, "w", encoding="utf-8") as f:
-        json.dump(asdict(state), f)
-    os.replace(tmp_path, file_path)
+    with PERSIST_SECONDS.time(operation="state_write"):
+        ensure_parent_directory(file_path)
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(state), f)
+        os.replace(tmp_path, file_path)
 
 
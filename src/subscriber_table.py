@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import math
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Mapping, MutableMapping, Optional, Tuple
+
+from src.alert_plan import AlertGroup, AlertPlan, format_message
+from src.subscribers import Subscriber
+
+# Optional: vectorized evaluation; the array-module fallback works everywhere.
+# Imported by the first table (see load_numpy) so the dict backend never pays for it.
+np = None
+_numpy_tried = False
+
+# last_zone is stored as a small int
+ZONE_NONE, ZONE_NEUTRAL, ZONE_ABOVE, ZONE_BELOW = 0, 1, 2, 3
+ZONE_NAMES = {ZONE_NEUTRAL: "neutral", ZONE_ABOVE: "above", ZONE_BELOW: "below"}
+ZONE_CODES = {name: code for code, name in ZONE_NAMES.items()}
+
+_NAN = float("nan")
+
+
+def load_numpy():  # noqa: ANN201 - numpy module or None
+    """Import NumPy on first use; None if it is not installed."""
+    global np, _numpy_tried
+    if not _numpy_tried:
+        _numpy_tried = True
+        try:
+            import numpy  # type: ignore
+        except ImportError:  # pragma: no cover - depends on the environment
+            numpy = None
+        np = numpy
+    return np
+
+
+def _opt(value: float) -> Optional[float]:
+    return None if value != value else value  # NaN -> None
+
+
+def _nan(value: Optional[float]) -> float:
+    return _NAN if value is None else float(value)
+
+
+class SubscriberRow:
+    """Live view of one table row with the same attributes as Subscriber.
+
+    Rows are located by chat id on every access, so a view stays valid while
+    other chats are added or removed.
+    """
+
+    __slots__ = ("_table", "chat_id")
+
+    def __init__(self, table: "SubscriberTable", chat_id: int) -> None:
+        self._table = table
+        self.chat_id = chat_id
+
+    def _get(self, column: str):  # noqa: ANN202 - column element type
+        return self._table._column(column)[self._table._position(self.chat_id)]
+
+    def _set(self, column: str, value: float) -> None:
+        self._table._column(column)[self._table._position(self.chat_id)] = value
+
+    @property
+    def upper(self) -> Optional[float]:
+        return _opt(float(self._get("upper")))
+
+    @upper.setter
+    def upper(self, value: Optional[float]) -> None:
+        self._set("upper", _nan(value))
+
+    @property
+    def lower(self) -> Optional[float]:
+        return _opt(float(self._get("lower")))
+
+    @lower.setter
+    def lower(self, value: Optional[float]) -> None:
+        self._set("lower", _nan(value))
+
+    @property
+    def last_zone(self) -> Optional[str]:
+        return ZONE_NAMES.get(int(self._get("last_zone")))
+
+    @last_zone.setter
+    def last_zone(self, value: Optional[str]) -> None:
+        self._set("last_zone", ZONE_CODES.get(value or "", ZONE_NONE))
+
+    @property
+    def last_value(self) -> Optional[float]:
+        return _opt(float(self._get("last_value")))
+
+    @last_value.setter
+    def last_value(self, value: Optional[float]) -> None:
+        self._set("last_value", _nan(value))
+
+    def snapshot(self) -> Subscriber:
+        return Subscriber(upper=self.upper, lower=self.lower, last_zone=self.last_zone, last_value=self.last_value)
+
+    def __repr__(self) -> str:
+        return f"SubscriberRow({self.chat_id}, {self.snapshot()!r})"
+
+
+class SubscriberTable(MutableMapping[int, SubscriberRow]):
+    """Subscribers as parallel columns sorted by chat id.
+
+    Columns: chat_id, upper and lower (NaN = use the default), last_zone (a
+    ZONE_* code) and last_value (NaN = unknown). About 33 bytes per chat,
+    against several hundred for a dict of Subscriber objects. Lookups are a
+    binary search; adding or removing a chat shifts the columns, which is
+    cheap next to how rarely it happens. Uses NumPy arrays when NumPy is
+    installed and the stdlib array module otherwise; `compile_plan`
+    evaluates the whole population in one vectorized pass with NumPy.
+    """
+
+    _COLUMNS = ("chat_id", "upper", "lower", "last_zone", "last_value")
+
+    def __init__(self) -> None:
+        if load_numpy() is not None:
+            self.chat_id = np.empty(0, dtype=np.int64)
+            self.upper = np.empty(0, dtype=np.float64)
+            self.lower = np.empty(0, dtype=np.float64)
+            self.last_zone = np.empty(0, dtype=np.int8)
+            self.last_value = np.empty(0, dtype=np.float64)
+        else:
+            self.chat_id = array("q")
+            self.upper = array("d")
+            self.lower = array("d")
+            self.last_zone = array("b")
+            self.last_value = array("d")
+
+    @classmethod
+    def from_subscribers(cls, subscribers: Mapping[int, Subscriber]) -> "SubscriberTable":
+        items = sorted(subscribers.items())
+        return cls.from_columns(
+            [cid for cid, _ in items],
+            [_nan(s.upper) for _, s in items],
+            [_nan(s.lower) for _, s in items],
+            [ZONE_CODES.get(s.last_zone or "", ZONE_NONE) for _, s in items],
+            [_nan(s.last_value) for _, s in items],
+        )
+
+    @classmethod
+    def from_columns(cls, chat_id, upper, lower, last_zone, last_value) -> "SubscriberTable":  # noqa: ANN001
+        """Adopt columns already sorted by chat id (NumPy arrays or sequences of the column types)."""
+        table = cls()
+        for name, values in zip(cls._COLUMNS, (chat_id, upper, lower, last_zone, last_value)):
+            current = getattr(table, name)
+            if np is not None:
+                setattr(table, name, np.ascontiguousarray(values, dtype=current.dtype))
+            else:
+                setattr(table, name, array(current.typecode, values))
+        return table
+
+    def _column(self, name: str):  # noqa: ANN202 - numpy or array column
+        return getattr(self, name)
+
+    def _find(self, chat_id: int) -> Tuple[int, bool]:
+        if np is not None:
+            pos = int(np.searchsorted(self.chat_id, chat_id))
+        else:
+            pos = bisect_left(self.chat_id, chat_id)
+        return pos, pos < len(self.chat_id) and int(self.chat_id[pos]) == chat_id
+
+    def _position(self, chat_id: int) -> int:
+        pos, found = self._find(chat_id)
+        if not found:
+            raise KeyError(chat_id)
+        return pos
+
+    # Mapping interface
+
+    def __len__(self) -> int:
+        return len(self.chat_id)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter([int(cid) for cid in self.chat_id])
+
+    def __contains__(self, chat_id: object) -> bool:
+        return isinstance(chat_id, int) and self._find(chat_id)[1]
+
+    def __getitem__(self, chat_id: int) -> SubscriberRow:
+        self._position(chat_id)
+        return SubscriberRow(self, chat_id)
+
+    def __setitem__(self, chat_id: int, sub: Subscriber) -> None:
+        values = (chat_id, _nan(sub.upper), _nan(sub.lower), ZONE_CODES.get(sub.last_zone or "", 0), _nan(sub.last_value))
+        pos, found = self._find(chat_id)
+        for name, value in zip(self._COLUMNS, values):
+            column = getattr(self, name)
+            if found:
+                column[pos] = value
+            elif np is not None:
+                setattr(self, name, np.insert(column, pos, value))
+            else:
+                column.insert(pos, value)
+
+    def __delitem__(self, chat_id: int) -> None:
+        pos = self._position(chat_id)
+        for name in self._COLUMNS:
+            column = getattr(self, name)
+            if np is not None:
+                setattr(self, name, np.delete(column, pos))
+            else:
+                del column[pos]
+
+    def pop(self, chat_id: int, *default):  # noqa: ANN002, ANN201 - dict.pop signature
+        """Remove a chat and return a detached Subscriber (a row view would dangle)."""
+        if chat_id not in self:
+            if default:
+                return default[0]
+            raise KeyError(chat_id)
+        snapshot = SubscriberRow(self, chat_id).snapshot()
+        del self[chat_id]
+        return snapshot
+
+    def to_subscribers(self) -> Dict[int, Subscriber]:
+        return {cid: SubscriberRow(self, cid).snapshot() for cid in self}
+
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).itemsize * len(self) for name in self._COLUMNS)
+
+    # Evaluation
+
+    def compile_plan(
+        self, value: float, default_upper: float, default_lower: float, label: str = "BTC dominance"
+    ) -> AlertPlan:
+        """Evaluate every chat against `value`; same grouping and messages as alert_plan.compile_plan.
+
+        As there, `zone_updates` lists only chats whose stored zone changes,
+        so an unchanged population costs no per-chat work afterwards.
+        """
+        if np is None:
+            return self._compile_plan_python(value, default_upper, default_lower, label)
+        upper = np.where(np.isnan(self.upper), default_upper, self.upper)
+        lower = np.where(np.isnan(self.lower), default_lower, self.lower)
+        valid = lower < upper
+        zone = np.where(value >= upper, ZONE_ABOVE, np.where(value <= lower, ZONE_BELOW, ZONE_NEUTRAL)).astype(np.int8)
+        previous = np.where(self.last_zone == ZONE_NONE, ZONE_NEUTRAL, self.last_zone).astype(np.int8)
+
+        plan = AlertPlan(value=value, skipped_invalid=int(np.count_nonzero(~valid)))
+        changed = np.flatnonzero(valid & (zone != self.last_zone))
+        plan.zone_updates = [
+            (int(cid), ZONE_NAMES[int(z)]) for cid, z in zip(self.chat_id[changed].tolist(), zone[changed].tolist())
+        ]
+
+        notify = np.flatnonzero(valid & (zone != previous))
+        if notify.size:
+            # Factorize each key column and fold them into one int64 group key;
+            # 1-D unique/argsort is far cheaper than np.unique(axis=0) on rows.
+            lowers, lower_idx = np.unique(lower[notify], return_inverse=True)
+            uppers, upper_idx = np.unique(upper[notify], return_inverse=True)
+            transition = previous[notify].astype(np.int64) * 4 + zone[notify]
+            keys = (transition * len(lowers) + lower_idx.reshape(-1)) * len(uppers) + upper_idx.reshape(-1)
+            order = np.argsort(keys, kind="stable")
+            sorted_keys = keys[order]
+            starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            bounds = np.r_[starts, len(sorted_keys)].tolist()
+            chat_ids = self.chat_id[notify][order]
+            for g, key in enumerate(sorted_keys[starts].tolist()):
+                key, u = divmod(key, len(uppers))
+                key, lo = divmod(key, len(lowers))
+                prev_code, zone_code = divmod(key, 4)
+                g_lower, g_upper = float(lowers[lo]), float(uppers[u])
+                zone_name = ZONE_NAMES[zone_code]
+                plan.groups.append(
+                    AlertGroup(
+                        ZONE_NAMES[prev_code],
+                        zone_name,
+                        g_lower,
+                        g_upper,
+                        format_message(value, zone_name, g_lower, g_upper, label),
+                        chat_ids[bounds[g] : bounds[g + 1]].tolist(),
+                    )
+                )
+        return plan
+
+    def _compile_plan_python(
+        self, value: float, default_upper: float, default_lower: float, label: str = "BTC dominance"
+    ) -> AlertPlan:
+        plan = AlertPlan(value=value)
+        groups: Dict[Tuple[int, int, float, float], AlertGroup] = {}
+        for cid, up, lo, stored in zip(self.chat_id, self.upper, self.lower, self.last_zone):
+            upper = default_upper if math.isnan(up) else up
+            lower = default_lower if math.isnan(lo) else lo
+            if lower >= upper:
+                plan.skipped_invalid += 1
+                continue
+            zone = ZONE_ABOVE if value >= upper else ZONE_BELOW if value <= lower else ZONE_NEUTRAL
+            if zone != stored:
+                plan.zone_updates.append((cid, ZONE_NAMES[zone]))
+            previous = stored or ZONE_NEUTRAL
+            if zone == previous:
+                continue
+            key = (previous, zone, lower, upper)
+            group = groups.get(key)
+            if group is None:
+                zone_name = ZONE_NAMES[zone]
+                group = groups[key] = AlertGroup(
+                    ZONE_NAMES[previous], zone_name, lower, upper, format_message(value, zone_name, lower, upper, label)
+                )
+                plan.groups.append(group)
+            group.chat_ids.append(cid)
+        return plan
+
+    def apply_zone_updates(self, updates: List[Tuple[int, str]], value: float) -> None:
+        """Store new zones (and the value they were evaluated at) for `updates`."""
+        if np is not None:
+            if updates:
+                cids = np.fromiter((cid for cid, _ in updates), dtype=np.int64, count=len(updates))
+                codes = np.fromiter((ZONE_CODES[zone] for _, zone in updates), dtype=np.int8, count=len(updates))
+                positions = np.searchsorted(self.chat_id, cids)
+                self.last_zone[positions] = codes
+                self.last_value[positions] = value
+            return
+        for cid, zone in updates:
+            pos = self._position(cid)
+            self.last_zone[pos] = ZONE_CODES[zone]
+            self.last_value[pos] = value
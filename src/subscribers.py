@@ -2,8 +2,14 @@ from __future__ import annotations
 
 import json
 import os
-from dataclasses import asdict, dataclass
-from typing import Dict, Optional
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from src.metrics import PERSIST_SECONDS
+
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
 
 
 @dataclass
@@ -11,7 +17,7 @@ class Subscriber:
     upper: Optional[float] = None
     lower: Optional[float] = None
     last_zone: Optional[str] = None  # 'above' | 'below' | 'neutral'
-    last_value: Optional[float] = None
+    last_value: Optional[float] = None  # value at which last_zone was last set
 
 
 def _ensure_parent(file_path: str) -> None:
@@ -20,7 +26,119 @@ def _ensure_parent(file_path: str) -> None:
         os.makedirs(directory, exist_ok=True)
 
 
+def is_sqlite_path(file_path: str) -> bool:
+    return file_path.lower().endswith(SQLITE_SUFFIXES)
+
+
+class SqliteSubscriberStore:
+    """Row-per-subscriber store in SQLite (WAL mode) so changes are written incrementally."""
+
+    def __init__(self, file_path: str) -> None:
+        _ensure_parent(file_path)
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(file_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS subscribers ("
+            "chat_id INTEGER PRIMARY KEY, upper REAL, lower REAL, last_zone TEXT, last_value REAL)"
+        )
+        self._conn.commit()
+
+    def load(self) -> Dict[int, Subscriber]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chat_id, upper, lower, last_zone, last_value FROM subscribers"
+            ).fetchall()
+        return {
+            int(cid): Subscriber(upper=upper, lower=lower, last_zone=last_zone, last_value=last_value)
+            for cid, upper, lower, last_zone, last_value in rows
+        }
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM subscribers LIMIT 1").fetchone() is None
+
+    def apply(self, upserts: Iterable[Tuple[int, Subscriber]], deletes: Iterable[int] = ()) -> None:
+        """Write changed rows and remove deleted ones in a single transaction."""
+        rows = [(cid, s.upper, s.lower, s.last_zone, s.last_value) for cid, s in upserts]
+        removed = [(cid,) for cid in deletes]
+        if not rows and not removed:
+            return
+        with self._lock, self._conn:
+            if rows:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO subscribers (chat_id, upper, lower, last_zone, last_value) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+            if removed:
+                self._conn.executemany("DELETE FROM subscribers WHERE chat_id = ?", removed)
+
+    def replace_all(self, subscribers: Mapping[int, Subscriber]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM subscribers")
+            self._conn.executemany(
+                "INSERT INTO subscribers (chat_id, upper, lower, last_zone, last_value) VALUES (?, ?, ?, ?, ?)",
+                [(cid, s.upper, s.lower, s.last_zone, s.last_value) for cid, s in subscribers.items()],
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_stores: Dict[str, SqliteSubscriberStore] = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(file_path: str) -> SqliteSubscriberStore:
+    """Return the cached store for `file_path`, opening it on first use."""
+    key = os.path.abspath(file_path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = SqliteSubscriberStore(file_path)
+            _stores[key] = store
+        return store
+
+
+def close_stores() -> None:
+    with _stores_lock:
+        for store in _stores.values():
+            store.close()
+        _stores.clear()
+
+
+def legacy_json_path(file_path: str) -> str:
+    return os.path.splitext(file_path)[0] + ".json"
+
+
+def migrate_json_to_sqlite(json_path: str, store: SqliteSubscriberStore) -> int:
+    """Import a JSON (dict or legacy list) subscribers file into `store`.
+
+    The source is renamed to `<name>.migrated` so it is not imported again.
+    Returns the number of subscribers imported.
+    """
+    subscribers = _read_json_subscribers(json_path)
+    store.replace_all(subscribers)
+    os.replace(json_path, f"{json_path}.migrated")
+    return len(subscribers)
+
+
 def read_subscribers(file_path: str) -> Dict[int, Subscriber]:
+    with PERSIST_SECONDS.time(operation="subscribers_read"):
+        if is_sqlite_path(file_path):
+            store = open_store(file_path)
+            legacy = legacy_json_path(file_path)
+            if store.is_empty() and os.path.exists(legacy):
+                migrate_json_to_sqlite(legacy, store)
+            return store.load()
+        return _read_json_subscribers(file_path)
+
+
+def _read_json_subscribers(file_path: str) -> Dict[int, Subscriber]:
     try:
         with open(file_path, "r", encoding="utf-8") as f:
             data = json.load(f)
@@ -61,12 +179,39 @@ def _safe_float(x):
         return None
 
 
-def write_subscribers(file_path: str, subscribers: Dict[int, Subscriber]) -> None:
-    _ensure_parent(file_path)
-    serializable = {str(cid): asdict(sub) for cid, sub in subscribers.items()}
-    tmp_path = f"{file_path}.tmp"
-    with open(tmp_path, "w", encoding="utf-8") as f:
-        json.dump(serializable, f)
-    os.replace(tmp_path, file_path)
-
-
+def _to_json(sub: Subscriber) -> dict:
+    # Attribute access rather than asdict() so table row views serialize too
+    return {"upper": sub.upper, "lower": sub.lower, "last_zone": sub.last_zone, "last_value": sub.last_value}
+
+
+def write_subscribers(
+    file_path: str,
+    subscribers: Mapping[int, Subscriber],
+    dirty: Optional[Iterable[int]] = None,
+    removed: Optional[Iterable[int]] = None,
+) -> None:
+    """Persist subscribers.
+
+    With a SQLite path and `dirty`/`removed` given, only those chat ids are
+    written or deleted; otherwise the full set is stored. JSON files are always
+    rewritten in full.
+    """
+    with PERSIST_SECONDS.time(operation="subscribers_write"):
+        if is_sqlite_path(file_path):
+            store = open_store(file_path)
+            if dirty is None and removed is None:
+                store.replace_all(subscribers)
+                return
+            upserts: List[Tuple[int, Subscriber]] = [
+                (cid, subscribers[cid]) for cid in (dirty or ()) if cid in subscribers
+            ]
+            deletes = [cid for cid in (removed or ()) if cid not in subscribers]
+            store.apply(upserts, deletes)
+            return
+
+        _ensure_parent(file_path)
+        serializable = {str(cid): _to_json(sub) for cid, sub in subscribers.items()}
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(serializable, f)
+        os.replace(tmp_path, file_path)
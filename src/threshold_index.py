@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from src.subscribers import Subscriber
+
+
+class _SortedColumn:
+    """Parallel sorted lists of threshold values and their chat ids."""
+
+    def __init__(self) -> None:
+        self.values: List[float] = []
+        self.chat_ids: List[int] = []
+
+    def add(self, value: float, cid: int) -> None:
+        pos = bisect_right(self.values, value)
+        self.values.insert(pos, value)
+        self.chat_ids.insert(pos, cid)
+
+    def remove(self, value: float, cid: int) -> None:
+        start = bisect_left(self.values, value)
+        end = bisect_right(self.values, value)
+        for pos in range(start, end):
+            if self.chat_ids[pos] == cid:
+                del self.values[pos]
+                del self.chat_ids[pos]
+                return
+
+    def slice(self, start: int, end: int) -> List[int]:
+        return self.chat_ids[start:end]
+
+
+class ThresholdIndex:
+    """Index of effective per-subscriber thresholds.
+
+    Zones are inclusive (value >= upper is 'above', value <= lower is 'below'),
+    so moving from `previous` to `current` can only change the zone of
+    subscribers whose upper lies in (lo, hi] or whose lower lies in [lo, hi),
+    where lo/hi are the min/max of the two values. Subscribers whose thresholds
+    changed since the last check (or who are new) are kept in a pending set
+    and always returned once.
+    """
+
+    def __init__(self, default_upper: float, default_lower: float) -> None:
+        self.default_upper = default_upper
+        self.default_lower = default_lower
+        self._uppers = _SortedColumn()
+        self._lowers = _SortedColumn()
+        self._entries: Dict[int, Tuple[float, float]] = {}
+        self._pending: Set[int] = set()
+
+    @classmethod
+    def build(
+        cls, subscribers: Dict[int, Subscriber], default_upper: float, default_lower: float
+    ) -> "ThresholdIndex":
+        index = cls(default_upper, default_lower)
+        uppers: List[Tuple[float, int]] = []
+        lowers: List[Tuple[float, int]] = []
+        for cid, sub in subscribers.items():
+            upper, lower = index._effective(sub)
+            index._entries[cid] = (upper, lower)
+            uppers.append((upper, cid))
+            lowers.append((lower, cid))
+        for column, pairs in ((index._uppers, uppers), (index._lowers, lowers)):
+            pairs.sort()
+            column.values = [v for v, _ in pairs]
+            column.chat_ids = [c for _, c in pairs]
+        # Stored zones may predate the persisted value; evaluate everyone once
+        index._pending.update(index._entries)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, cid: object) -> bool:
+        return cid in self._entries
+
+    def _effective(self, sub: Subscriber) -> Tuple[float, float]:
+        upper = sub.upper if sub.upper is not None else self.default_upper
+        lower = sub.lower if sub.lower is not None else self.default_lower
+        return upper, lower
+
+    def update(self, cid: int, sub: Subscriber) -> None:
+        """Insert or refresh a subscriber after its thresholds may have changed."""
+        upper, lower = self._effective(sub)
+        current = self._entries.get(cid)
+        if current != (upper, lower):
+            if current is not None:
+                self._uppers.remove(current[0], cid)
+                self._lowers.remove(current[1], cid)
+            self._uppers.add(upper, cid)
+            self._lowers.add(lower, cid)
+            self._entries[cid] = (upper, lower)
+        self._pending.add(cid)
+
+    def remove(self, cid: int) -> None:
+        current = self._entries.pop(cid, None)
+        if current is not None:
+            self._uppers.remove(current[0], cid)
+            self._lowers.remove(current[1], cid)
+        self._pending.discard(cid)
+
+    def mark_pending(self, chat_ids: Iterable[int]) -> None:
+        self._pending.update(cid for cid in chat_ids if cid in self._entries)
+
+    def candidates(self, previous: Optional[float], current: float) -> Set[int]:
+        """Return chat ids whose zone may differ between `previous` and `current`.
+
+        Consumes the pending set. With no previous value every subscriber is
+        returned.
+        """
+        if previous is None:
+            self._pending.clear()
+            return set(self._entries)
+        lo, hi = (previous, current) if previous <= current else (current, previous)
+        result = set(self._pending)
+        self._pending.clear()
+        if lo != hi:
+            uv = self._uppers.values
+            result.update(self._uppers.slice(bisect_right(uv, lo), bisect_right(uv, hi)))
+            lv = self._lowers.values
+            result.update(self._lowers.slice(bisect_left(lv, lo), bisect_left(lv, hi)))
+        return result
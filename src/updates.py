@@ -1,29 +1,39 @@
 from __future__ import annotations
 
-from typing import Iterable, Optional, Tuple
+from typing import Iterable, List, NamedTuple, Optional, Tuple
 
 import requests
 
+from src.http_session import get_session, telegram_url
+from src.metrics import GET_UPDATES_SECONDS, UPDATE_BATCH_SIZE
+
 
 class UpdatesError(Exception):
     pass
 
 
-def get_updates(bot_token: str, offset: Optional[int], timeout_seconds: int) -> Tuple[int, list]:
+def get_updates(
+    bot_token: str,
+    offset: Optional[int],
+    timeout_seconds: int,
+    session: Optional[requests.Session] = None,
+) -> Tuple[int, list]:
     """Poll Telegram getUpdates.
 
     Returns: (last_update_id, updates_list)
     """
-    url = f"https://api.telegram.org/bot{bot_token}/getUpdates"
+    url = telegram_url(bot_token, "getUpdates")
     params = {"timeout": timeout_seconds}
     if offset is not None:
         params["offset"] = offset
-    response = requests.get(url, params=params, timeout=timeout_seconds + 5)
-    response.raise_for_status()
-    data = response.json()
-    if not data.get("ok"):
-        raise UpdatesError(f"getUpdates failed: {data}")
+    with GET_UPDATES_SECONDS.time():
+        response = (session or get_session()).get(url, params=params, timeout=timeout_seconds + 5)
+        response.raise_for_status()
+        data = response.json()
+        if not data.get("ok"):
+            raise UpdatesError(f"getUpdates failed: {data}")
     updates = data.get("result", [])
+    UPDATE_BATCH_SIZE.observe(len(updates))
     last_id = offset or 0
     for upd in updates:
         if isinstance(upd, dict) and "update_id" in upd:
@@ -34,76 +44,65 @@ def get_updates(bot_token: str, offset: Optional[int], timeout_seconds: int) ->
     return next_offset, updates
 
 
-def extract_chat_ids_from_updates(updates: Iterable[dict]) -> Tuple[set[int], set[int]]:
-    """Return (start_ids, stop_ids) collected from /start and /stop commands."""
-    start_ids: set[int] = set()
-    stop_ids: set[int] = set()
-    for upd in updates:
-        message = upd.get("message") if isinstance(upd, dict) else None
-        if not isinstance(message, dict):
-            continue
-        chat = message.get("chat") or {}
-        chat_id = chat.get("id")
-        if not isinstance(chat_id, int):
-            continue
-        text = message.get("text") or ""
-        text = text.strip().lower()
-        if text == "/start" or text.startswith("/start@"):
-            start_ids.add(chat_id)
-        elif text == "/stop" or text.startswith("/stop@"):
-            stop_ids.add(chat_id)
-    return start_ids, stop_ids
-
-
-def extract_value_requests(updates: Iterable[dict]) -> set[int]:
-    """Return set of chat ids who asked for /value."""
-    value_ids: set[int] = set()
-    for upd in updates:
-        message = upd.get("message") if isinstance(upd, dict) else None
-        if not isinstance(message, dict):
-            continue
-        chat = message.get("chat") or {}
-        chat_id = chat.get("id")
-        if not isinstance(chat_id, int):
-            continue
-        text = message.get("text") or ""
-        text = text.strip().lower()
-        if text == "/value" or text.startswith("/value@"):
-            value_ids.add(chat_id)
-    return value_ids
-
-
-def parse_threshold_commands(updates: Iterable[dict]):
-    """Yield tuples of (chat_id, cmd, args) for threshold-related commands.
-
-    cmd in {"thresholds", "upper", "lower", "settings", "reset", "help"}
-    args: list[str]
-    """
+def _call(bot_token: str, method: str, payload: dict, timeout_seconds: int, session: Optional[requests.Session]) -> None:
+    url = telegram_url(bot_token, method)
+    response = (session or get_session()).post(url, json=payload, timeout=timeout_seconds)
+    response.raise_for_status()
+    data = response.json()
+    if not data.get("ok"):
+        raise UpdatesError(f"{method} failed: {data}")
+
+
+def set_webhook(
+    bot_token: str,
+    url: str,
+    secret_token: str,
+    timeout_seconds: int = 15,
+    session: Optional[requests.Session] = None,
+) -> None:
+    """Register `url` as the bot's webhook; Telegram echoes `secret_token` in a header on every POST."""
+    payload = {"url": url, "secret_token": secret_token, "allowed_updates": ["message"]}
+    _call(bot_token, "setWebhook", payload, timeout_seconds, session)
+
+
+def delete_webhook(bot_token: str, timeout_seconds: int = 15, session: Optional[requests.Session] = None) -> None:
+    """Remove the webhook so getUpdates works again (pending updates are kept)."""
+    _call(bot_token, "deleteWebhook", {"drop_pending_updates": False}, timeout_seconds, session)
+
+
+class Command(NamedTuple):
+    """A parsed bot command: name is lowercased without the slash or @botname suffix."""
+
+    update_id: int
+    chat_id: int
+    name: str
+    args: Tuple[str, ...]
+
+
+def parse_update(upd: object) -> Optional[Command]:
+    """Parse one update into a Command, or None if it is not a command message."""
+    message = upd.get("message") if isinstance(upd, dict) else None
+    if not isinstance(message, dict):
+        return None
+    chat = message.get("chat") or {}
+    chat_id = chat.get("id")
+    if not isinstance(chat_id, int):
+        return None
+    text = (message.get("text") or "").strip()
+    if not text.startswith("/"):
+        return None
+    parts = text.split()
+    name = parts[0][1:].split("@", 1)[0].lower()
+    if not name:
+        return None
+    return Command(upd.get("update_id", 0), chat_id, name, tuple(parts[1:]))
+
+
+def parse_updates(updates: Iterable[dict]) -> List[Command]:
+    """Parse a batch of updates in a single pass, keeping message order."""
+    commands: List[Command] = []
     for upd in updates:
-        message = upd.get("message") if isinstance(upd, dict) else None
-        if not isinstance(message, dict):
-            continue
-        chat = message.get("chat") or {}
-        chat_id = chat.get("id")
-        if not isinstance(chat_id, int):
-            continue
-        text = (message.get("text") or "").strip()
-        if not text.startswith("/"):
-            continue
-        cmd_and_args = text.split()
-        cmd = cmd_and_args[0].lower()
-        args = cmd_and_args[1:]
-        if cmd == "/thresholds" or cmd.startswith("/thresholds@"):
-            yield chat_id, "thresholds", args
-        elif cmd == "/upper" or cmd.startswith("/upper@"):
-            yield chat_id, "upper", args
-        elif cmd == "/lower" or cmd.startswith("/lower@"):
-            yield chat_id, "lower", args
-        elif cmd == "/settings" or cmd.startswith("/settings@"):
-            yield chat_id, "settings", args
-        elif cmd == "/reset" or cmd.startswith("/reset@"):
-            yield chat_id, "reset", args
-        elif cmd == "/help" or cmd.startswith("/help@"):
-            yield chat_id, "help", args
-
-
+        cmd = parse_update(upd)
+        if cmd is not None:
+            commands.append(cmd)
+    return commands
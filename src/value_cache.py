@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Callable, Generic, Optional, TypeVar
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Flight(Generic[T]):
+    """One upstream fetch that any number of callers can wait on."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: Optional[T] = None
+        self.error: Optional[BaseException] = None
+
+
+class ValueCache(Generic[T]):
+    """TTL cache with stale-while-revalidate and single-flight fetching.
+
+    - Younger than `ttl_seconds`: served from cache.
+    - Younger than `ttl_seconds + stale_seconds`: served from cache while one
+      background refresh runs (only when the caller allows stale values).
+    - Otherwise callers block on a fetch; concurrent callers share it.
+
+    So at most one upstream request is made per TTL window however many
+    readers there are. The bot caches the readings of all metrics together.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], T],
+        ttl_seconds: float,
+        stale_seconds: float = 0.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._value: Optional[T] = None
+        self._fetched_at: Optional[float] = None
+        self._flight: Optional[_Flight[T]] = None
+
+    def peek(self) -> Optional[T]:
+        """Return the cached value regardless of age, without fetching."""
+        return self._value
+
+    def age(self) -> Optional[float]:
+        fetched_at = self._fetched_at
+        return None if fetched_at is None else self._clock() - fetched_at
+
+    def put(self, value: T) -> None:
+        with self._lock:
+            self._value = value
+            self._fetched_at = self._clock()
+
+    def get(self, allow_stale: bool = True) -> T:
+        """Return a cached or freshly fetched value; raises if a required fetch fails."""
+        with self._lock:
+            age = None if self._fetched_at is None else self._clock() - self._fetched_at
+            if age is not None and self._value is not None:
+                if age < self.ttl_seconds:
+                    return self._value
+                if allow_stale and age < self.ttl_seconds + self.stale_seconds:
+                    if self._flight is None:
+                        self._flight = _Flight()
+                        threading.Thread(
+                            target=self._run_flight, args=(self._flight,), name="value-refresh", daemon=True
+                        ).start()
+                    return self._value
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight()
+
+        if leader:
+            self._run_flight(flight)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value  # type: ignore[return-value]
+
+    def refresh(self) -> T:
+        """Force a fetch now (joining one already in flight)."""
+        with self._lock:
+            self._fetched_at = None
+        return self.get(allow_stale=False)
+
+    def _run_flight(self, flight: _Flight[T]) -> None:
+        try:
+            value = self._fetch()
+        except BaseException as e:  # noqa: BLE001 - delivered to every waiter
+            flight.error = e
+            log.warning("value refresh failed: %s", repr(e))
+        else:
+            flight.value = value
+            with self._lock:
+                self._value = value
+                self._fetched_at = self._clock()
+        finally:
+            with self._lock:
+                if self._flight is flight:
+                    self._flight = None
+            flight.done.set()
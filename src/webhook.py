@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import hmac
+import json
+import logging
+import queue
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, List, Optional, Set
+
+from src.metrics import UPDATE_BATCH_SIZE
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+MAX_BODY_BYTES = 1 << 20
+SEEN_WINDOW = 4096  # recent update ids remembered for de-duplication
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+
+    def do_POST(self) -> None:  # noqa: N802 - http.server naming
+        receiver = self.server.receiver
+        if self.path.split("?", 1)[0] != receiver.path:
+            self._reply(404)
+            return
+        token = self.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), receiver.secret_token.encode()):
+            self._reply(403)
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if not (0 < length <= MAX_BODY_BYTES):
+            self._reply(413 if length > MAX_BODY_BYTES else 400)
+            return
+        try:
+            update = json.loads(self.rfile.read(length))
+        except ValueError:
+            self._reply(400)
+            return
+        if not isinstance(update, dict) or "update_id" not in update:
+            self._reply(400)
+            return
+        receiver.push(update)
+        self._reply(200)
+
+    def do_GET(self) -> None:  # noqa: N802 - http.server naming
+        self._reply(405)
+
+    def _reply(self, status: int) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002 - http.server signature
+        log.debug("webhook %s - %s", self.address_string(), format % args)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    receiver: "WebhookReceiver"
+
+
+class WebhookReceiver:
+    """Built-in HTTP receiver for Telegram webhook updates.
+
+    POSTs to `path` carrying the configured secret token header are queued
+    and answered 200 immediately; `next_batch` hands them to the same command
+    handling used for polling. Updates are de-duplicated by update_id since
+    Telegram re-sends on slow or failed responses.
+    """
+
+    def __init__(self, host: str, port: int, secret_token: str, path: str = "/telegram") -> None:
+        if not secret_token:
+            raise ValueError("A webhook secret token is required")
+        self.host = host
+        self.port = port
+        self.secret_token = secret_token
+        self.path = path if path.startswith("/") else f"/{path}"
+        self._queue: "queue.Queue[dict]" = queue.Queue()
+        self._seen_lock = threading.Lock()
+        self._seen: Set[int] = set()
+        self._seen_order: Deque[int] = deque()
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> tuple:
+        return self._server.server_address if self._server else (self.host, self.port)
+
+    def push(self, update: dict) -> None:
+        with self._seen_lock:
+            update_id = update.get("update_id")
+            if isinstance(update_id, int):
+                if update_id in self._seen:
+                    return
+                self._seen.add(update_id)
+                self._seen_order.append(update_id)
+                if len(self._seen_order) > SEEN_WINDOW:
+                    self._seen.discard(self._seen_order.popleft())
+        self._queue.put(update)
+
+    def start(self) -> None:
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.receiver = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name="webhook", daemon=True)
+        self._thread.start()
+        log.info("webhook listening on %s:%s%s", self.address[0], self.address[1], self.path)
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def next_batch(self, timeout_seconds: float) -> List[dict]:
+        """Block up to `timeout_seconds` for an update, then return everything queued."""
+        try:
+            batch = [self._queue.get(timeout=max(0.0, timeout_seconds))]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                UPDATE_BATCH_SIZE.observe(len(batch))
+                return batch
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import os
+import sys
+
+import pytest
+
+# The tests import `src`, `bench` and `backtest` from the repository root, as `python -m src.main` does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fake_servers import Behaviour, FakeTelegram  # noqa: E402
+from src.http_session import build_session, set_session, set_telegram_api_base  # noqa: E402
+
+
+@pytest.fixture
+def telegram():
+    """A local Bot API stand-in; the shared HTTP session sends every Bot API call to it."""
+    fake = FakeTelegram(Behaviour()).start()
+    set_session(build_session())
+    set_telegram_api_base(fake.base_url)
+    yield fake
+    set_telegram_api_base("")
+    set_session(None)
+    fake.stop()
+
+
+@pytest.fixture
+def make_settings(tmp_path):
+    """Settings with every file under `tmp_path`; keyword arguments override environment variables."""
+    from src.config import load_settings
+
+    def make(**env: str):
+        base = {
+            "TELEGRAM_BOT_TOKEN": "test",
+            "SUBSCRIBERS_FILE_PATH": str(tmp_path / "subscribers.db"),
+            "STATE_FILE_PATH": str(tmp_path / "state.json"),
+            "HISTORY_FILE_PATH": str(tmp_path / "history.bin"),
+            "OUTBOX_FILE_PATH": str(tmp_path / "outbox.jsonl"),
+        }
+        base.update(env)
+        return load_settings(base)
+
+    return make
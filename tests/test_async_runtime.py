@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+
+from src.async_runtime import dominance_check, scheduled_jobs
+from src.bot import load_boards
+from src.subscribers import close_stores
+
+
+def test_checks_and_upkeep_run_off_the_event_loop(make_settings, monkeypatch):
+    ctx = load_boards(make_settings(CHECK_INTERVAL_SECONDS="60"))
+    monkeypatch.setattr("src.async_runtime.fetch_check_readings", lambda ctx: {"btc": 50.0})
+    monkeypatch.setattr("src.bot.FLUSH_SECONDS", 0.01)
+    threads = {}
+
+    def recording(name: str, fn):
+        def run(*args):
+            threads[name] = threading.current_thread()
+            return fn(*args)
+
+        return run
+
+    monkeypatch.setattr("src.async_runtime.run_checks", recording("check", lambda *args: []))
+    monkeypatch.setattr("src.bot.flush_boards", recording("flush", lambda boards: None))
+    lock = threading.Lock()
+
+    async def scenario() -> None:
+        assert await dominance_check([ctx], lock) == 60
+        stop = asyncio.Event()
+        jobs = asyncio.ensure_future(scheduled_jobs([ctx], stop, lock))
+        while "flush" not in threads:
+            await asyncio.sleep(0.01)
+        stop.set()
+        await asyncio.wait_for(jobs, 5.0)
+
+    asyncio.run(scenario())
+    assert set(threads) == {"check", "flush"}
+    assert threading.main_thread() not in threads.values()
+    assert not lock.locked()
+    ctx.outbox.close()
+    close_stores()
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from backtest.engine import Series, replay, replay_scalar  # noqa: E402
+from src.alert_plan import determine_zone  # noqa: E402
+
+FLAP_SECONDS = 1800.0
+
+
+def _expected(ts, values, upper: float, lower: float) -> dict:
+    """Counts of a subscriber with these thresholds, check by check with the bot's determine_zone."""
+    counts = {"alerts": 0, "above": 0, "below": 0, "neutral": 0, "flaps": 0}
+    previous, last_alert = "neutral", None
+    for stamp, value in zip(ts, values):
+        zone = determine_zone(value, lower, upper)
+        if zone == previous:
+            continue
+        counts["alerts"] += 1
+        counts[zone] += 1
+        if last_alert is not None and stamp - last_alert <= FLAP_SECONDS:
+            counts["flaps"] += 1
+        previous, last_alert = zone, stamp
+    return counts
+
+
+def _series(samples: int, seed: int) -> Series:
+    rng = random.Random(seed)
+    ts, values, value = [], [], 50.0
+    for i in range(samples):
+        # Half-point steps so samples land exactly on thresholds, where the comparisons are inclusive
+        value = min(65.0, max(35.0, value + rng.choice([-1.5, -0.5, 0.0, 0.5, 1.5, 6.0, -6.0])))
+        ts.append(i * 300.0 + rng.choice([0.0, 60.0]))
+        values.append(value)
+    return Series(np.asarray(ts), np.asarray(values))
+
+
+def test_replay_matches_determine_zone():
+    series = _series(3000, seed=11)
+    pairs = [(upper, lower) for upper in np.arange(50.0, 62.5, 0.5) for lower in np.arange(38.0, 50.0, 0.5)]
+    upper = np.asarray([u for u, _ in pairs])
+    lower = np.asarray([lo for _, lo in pairs])
+    result = replay(series, upper, lower, FLAP_SECONDS)
+
+    ts, values = series.ts.tolist(), series.values.tolist()
+    for i, (u, lo) in enumerate(pairs):
+        expected = _expected(ts, values, u, lo)
+        got = {name: int(getattr(result, name)[i]) for name in expected}
+        assert got == expected, (u, lo)
+        assert replay_scalar(series.values, u, lo) == expected["alerts"]
+
+
+def test_time_in_zone_and_peak():
+    series = Series(np.asarray([0.0, 10.0, 20.0, 40.0]), np.asarray([50.0, 56.0, 44.0, 50.0]))
+    result = replay(series, np.asarray([55.0, 60.0]), np.asarray([45.0, 40.0]), FLAP_SECONDS, weights=[3, 1])
+    assert result.alerts.tolist() == [3, 0]
+    # Each sample holds until the next one: 10s at 50, 10s at 56, 20s at 44
+    assert result.time_above.tolist() == pytest.approx([0.25, 0.0])
+    assert result.time_below.tolist() == pytest.approx([0.5, 0.0])
+    assert result.time_neutral.tolist() == pytest.approx([0.25, 1.0])
+    assert result.peak_per_check == 3.0
+
+
+def test_empty_inputs():
+    empty = replay(Series(np.zeros(0), np.zeros(0)), np.asarray([55.0]), np.asarray([45.0]))
+    assert empty.alerts.tolist() == [0]
+    assert len(replay(_series(10, seed=1), np.zeros(0), np.zeros(0)).alerts) == 0
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import pytest
+
+from src.bot import load_boards, queue_alerts, run_check
+from src.subscribers import Subscriber, close_stores, write_subscribers
+
+
+@pytest.fixture
+def ctx(make_settings):
+    ctx = load_boards(make_settings(UPPER_THRESHOLD_PERCENT="55", LOWER_THRESHOLD_PERCENT="45"))
+    for cid in (1, 2):
+        ctx.subscribers[cid] = Subscriber()
+        ctx.reindex(cid, ctx.subscribers[cid])
+    run_check(ctx, 50.0, lambda result: queue_alerts(ctx, result))
+    yield ctx
+    ctx.outbox.close()
+    close_stores()
+
+
+def test_failed_delivery_keeps_the_old_zones(ctx):
+    def broken(result):
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        run_check(ctx, 60.0, broken)
+    assert [sub.last_zone for sub in ctx.subscribers.values()] == ["neutral", "neutral"]
+    ctx.flush_subscribers()
+
+    run_check(ctx, 60.0, lambda result: queue_alerts(ctx, result))
+    assert sorted(cid for _, cid, _, _ in ctx.outbox.pending()) == [1, 2]
+    assert [sub.last_zone for sub in ctx.subscribers.values()] == ["above", "above"]
+
+
+def test_dict_and_columnar_store_the_same_zones(make_settings, tmp_path):
+    subscribers = {cid: Subscriber(upper=52.0 + cid % 5, lower=44.0 + cid % 3) for cid in range(1, 40)}
+    subscribers[40] = Subscriber(upper=40.0, lower=50.0)  # invalid, never evaluated
+    stored = {}
+    for backend in ("dict", "columnar"):
+        base = tmp_path / backend
+        write_subscribers(str(base / "subscribers.db"), subscribers)
+        ctx = load_boards(
+            make_settings(
+                SUBSCRIBER_BACKEND=backend,
+                SUBSCRIBER_SNAPSHOT="0",
+                SUBSCRIBERS_FILE_PATH=str(base / "subscribers.db"),
+                STATE_FILE_PATH=str(base / "state.json"),
+                OUTBOX_FILE_PATH=str(base / "outbox.jsonl"),
+                HISTORY_FILE_PATH="",
+            )
+        )
+        for value in (50.0, 50.5, 56.0, 56.0, 44.0, 50.0, 62.0, 63.0):
+            run_check(ctx, value, lambda result: queue_alerts(ctx, result))
+            # A threshold change that keeps the zone makes the chat a candidate of the next check
+            sub = ctx.subscribers[2]
+            sub.lower = 40.0 if sub.lower != 40.0 else 41.0
+            ctx.reindex(2, sub)
+        stored[backend] = {cid: (sub.last_zone, sub.last_value) for cid, sub in ctx.subscribers.items()}
+        ctx.outbox.close()
+        close_stores()
+    assert stored["dict"] == stored["columnar"]
+    assert stored["dict"][40] == (None, None)
+    # last_value is where the zone last changed, not the latest check
+    assert stored["dict"][1] == stored["dict"][2] == ("above", 62.0)
+
+
+def test_failed_delivery_keeps_threshold_changes_pending(ctx):
+    sub = ctx.subscribers[2]
+    sub.upper = 49.0  # now above at the unchanged value
+    ctx.reindex(2, sub)
+
+    def broken(result):
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        run_check(ctx, 50.0, broken)
+    run_check(ctx, 50.0, lambda result: queue_alerts(ctx, result))
+    assert [cid for _, cid, _, _ in ctx.outbox.pending()] == [2]
+    assert sub.last_zone == "above"
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import pytest
+
+from src.bot import handle_updates, load_boards
+from src.commands import UNSAVED_REPLY, CommandRouter
+from src.subscribers import close_stores, read_subscribers
+from src.updates import parse_updates
+
+
+def _update(update_id: int, chat_id: int, text: str) -> dict:
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": text}}
+
+
+@pytest.fixture
+def ctx(make_settings):
+    ctx = load_boards(make_settings(UPPER_THRESHOLD_PERCENT="55", LOWER_THRESHOLD_PERCENT="45"))
+    yield ctx
+    ctx.outbox.close()
+    close_stores()
+
+
+def test_parses_commands_in_one_pass():
+    updates = [
+        _update(1, 10, "/Upper@dominance_bot 56"),
+        _update(2, 10, "hello"),
+        {"update_id": 3, "message": {"chat": {"id": "x"}, "text": "/start"}},
+        {"update_id": 4, "edited_message": {}},
+        _update(5, 11, "/ "),
+        _update(6, 11, " /value "),
+    ]
+    assert [(c.update_id, c.chat_id, c.name, c.args) for c in parse_updates(updates)] == [
+        (1, 10, "upper", ("56",)),
+        (6, 11, "value", ()),
+    ]
+
+
+def test_replies_follow_a_single_write(ctx):
+    updates = [
+        _update(1, 10, "/start"),
+        _update(2, 10, "/upper 58"),
+        _update(3, 11, "/thresholds 50 40"),
+        _update(4, 11, "/value"),
+        _update(5, 12, "/unknown"),
+        _update(6, 11, "/lower 60"),
+    ]
+    replies = []
+    assert handle_updates(ctx, updates, lambda *message: replies.append(message)) == {11}
+    assert [(cid, text.split(".")[0]) for cid, text, _ in replies] == [
+        (10, "Saved thresholds"),
+        (11, "Saved thresholds"),
+        (11, "Threshold error: Lower must be less than upper"),
+    ]
+    assert not ctx.dirty
+    close_stores()
+    stored = read_subscribers(ctx.settings.subscribers_file_path)
+    assert (stored[10].upper, stored[11].upper, stored[11].lower) == (58.0, 50.0, 40.0)
+    assert 12 not in stored
+
+
+def test_stop_removes_the_row(ctx):
+    handle_updates(ctx, [_update(1, 10, "/start"), _update(2, 11, "/start")], lambda *message: None)
+    handle_updates(ctx, [_update(3, 10, "/stop")], lambda *message: None)
+    assert sorted(ctx.subscribers) == [11]
+    close_stores()
+    assert sorted(read_subscribers(ctx.settings.subscribers_file_path)) == [11]
+
+
+def test_a_failing_handler_does_not_stop_the_batch(ctx):
+    router = CommandRouter()
+    seen = []
+
+    @router.command("boom")
+    def boom(ctx, cmd, batch) -> None:
+        raise ValueError("boom")
+
+    @router.command("echo", "say")
+    def echo(ctx, cmd, batch) -> None:
+        seen.append(cmd.name)
+        batch.reply(cmd.chat_id, " ".join(cmd.args))
+
+    replies = []
+    updates = [_update(1, 10, "/boom"), _update(2, 10, "/echo hi"), _update(3, 11, "/say there")]
+    router.dispatch(ctx, updates, lambda *message: replies.append(message))
+    assert router.commands == ("boom", "echo", "say")
+    assert seen == ["echo", "say"]
+    assert replies == [(10, "hi", ""), (11, "there", "")]
+
+
+def test_unsaved_changes_are_not_confirmed(ctx, monkeypatch):
+    handle_updates(ctx, [_update(1, 11, "/start")], lambda *message: None)
+
+    def failing_write(*args, **kwargs) -> None:
+        raise OSError("disk full")
+
+    monkeypatch.setattr("src.bot.write_subscribers", failing_write)
+    replies = []
+    updates = [_update(2, 10, "/upper 58"), _update(3, 10, "/settings"), _update(4, 11, "/settings")]
+    handle_updates(ctx, updates, lambda *message: replies.append(message))
+    assert [cid for cid, _, _ in replies] == [11, 10]
+    assert replies[0][1].startswith("Your thresholds") and replies[1][1] == UNSAVED_REPLY
+
+    # The change stays dirty and is written by the next flush
+    monkeypatch.undo()
+    assert ctx.dirty == {10}
+    ctx.flush_subscribers()
+    close_stores()
+    assert read_subscribers(ctx.settings.subscribers_file_path)[10].upper == 58.0
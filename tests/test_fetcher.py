@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from bench.fake_servers import Behaviour, FakeCoinGecko
+from src.fetcher import FetchError, HedgedFetcher, Metric, Provider, parse_metrics
+from src.http_session import build_session
+from src.resilience import CircuitOpenError
+
+PATH = "data.market_cap_percentage.{coin}"
+
+
+@pytest.fixture
+def stand_ins():
+    started = []
+
+    def start(latency: float, value: float) -> Provider:
+        fake = FakeCoinGecko(Behaviour(latency_seconds=latency), values=[value]).start()
+        started.append(fake)
+        return Provider(f"p{len(started)}", fake.global_url, PATH)
+
+    yield start
+    for fake in started:
+        fake.stop()
+
+
+def _fetcher(providers, **kwargs) -> HedgedFetcher:
+    kwargs.setdefault("default_hedge_seconds", 0.05)
+    return HedgedFetcher(providers, timeout_seconds=2.0, session=build_session(), **kwargs)
+
+
+def test_hedges_to_the_next_provider_when_slow(stand_ins):
+    slow, fast = stand_ins(0.6, 51.0), stand_ins(0.0, 52.0)
+    fetcher = _fetcher([slow, fast])
+    started = time.monotonic()
+    assert fetcher.fetch() == {"btc": 52.0}
+    assert time.monotonic() - started < 0.5
+
+
+def test_prefers_the_provider_with_the_lower_p95(stand_ins):
+    slow, fast = stand_ins(0.05, 51.0), stand_ins(0.0, 52.0)
+    fetcher = _fetcher([slow, fast], default_hedge_seconds=1.0)
+    for provider in (slow, fast):
+        for _ in range(5):
+            fetcher._timed(provider)
+    assert fetcher.ordered() == [fast, slow]
+    assert fetcher.fetch() == {"btc": 52.0}
+
+
+def test_failures_hedge_at_once_and_open_the_breaker(stand_ins):
+    good = stand_ins(0.0, 53.0)
+    broken = Provider("broken", good.url.replace("/global", "/missing"), PATH)
+    fetcher = _fetcher([broken, good], default_hedge_seconds=1.0, breaker_threshold=2)
+    started = time.monotonic()
+    assert fetcher.fetch() == {"btc": 53.0}
+    assert time.monotonic() - started < 0.5
+    # 404s are not retryable, so they never open the circuit
+    fetcher.fetch()
+    assert fetcher.breakers["broken"].state == "closed"
+
+    fetcher = _fetcher([Provider("down", "http://127.0.0.1:9/api", PATH)], breaker_threshold=2)
+    for _ in range(2):
+        with pytest.raises(FetchError):
+            fetcher.fetch()
+    with pytest.raises(CircuitOpenError):
+        fetcher.fetch()
+
+
+def test_reads_every_metric_from_one_response(stand_ins):
+    provider = stand_ins(0.0, 55.0)
+    metrics = parse_metrics("btc,eth@20/10,both=btc+eth")
+    assert metrics[1] == Metric("eth", ("eth",), 20.0, 10.0)
+    fetcher = _fetcher([provider], metrics=metrics)
+    assert fetcher.fetch() == {"btc": 55.0, "eth": 45.0, "both": 100.0}
+    with pytest.raises(ValueError):
+        _fetcher([Provider("single", provider.url, "data.btc")], metrics=metrics)
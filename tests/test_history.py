@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from src.history import SAMPLE, HistoryStore
+
+DAY = 86400.0
+
+
+def _fill(store: HistoryStore, start: float, end: float, step: float) -> list:
+    samples = []
+    ts = start
+    while ts < end:
+        value = 50.0 + (ts % 7200) / 3600.0  # a 2h sawtooth between 50 and 52
+        store.append(ts, value)
+        samples.append((ts, value))
+        ts += step
+    return samples
+
+
+def _rollup(samples: list, width: int) -> list:
+    groups: dict = {}
+    for ts, value in samples:
+        groups.setdefault(ts - ts % width, []).append(value)
+    return [(ts, min(v), max(v), sum(v) / len(v), len(v)) for ts, v in sorted(groups.items())]
+
+
+def test_rollups_match_the_raw_samples(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.bin"))
+    samples = _fill(store, 10 * DAY, 10 * DAY + 5 * 3600, 300)
+    store.downsample()
+    # Incremental: later samples re-open the last bucket of each tier
+    samples += _fill(store, 10 * DAY + 5 * 3600, 12 * DAY + 100, 300)
+    store.downsample()
+    store.downsample()
+
+    for tier, width in (("1m", 60), ("1h", 3600), ("1d", 86400)):
+        got = [tuple(b) for b in store.buckets(tier, 0, 20 * DAY)]
+        assert got == pytest.approx(_rollup(samples, width)), tier
+
+
+def test_query_picks_the_finest_tier_that_fits(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.bin"))
+    _fill(store, 10 * DAY, 13 * DAY, 60)
+    store.downsample()
+    end = 13 * DAY
+
+    raw = store.query(end - 3600, end)
+    assert len(raw) == 60 and raw == store.samples(end - 3600, end)
+    assert len(store.query(end - 2 * DAY, end, max_points=50)) == 48  # hourly buckets
+    assert len(store.query(end - 3 * DAY, end, max_points=10)) == 3  # daily buckets
+    assert store.query(end, end - 1) == []
+    assert store.latest() == (end - 60, pytest.approx(50.0 + 7140 / 3600))
+
+
+def test_ignores_a_torn_trailing_record(tmp_path):
+    path = tmp_path / "history.bin"
+    store = HistoryStore(str(path))
+    store.append(100.0, 50.0)
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 5)  # a crash mid-append
+    assert len(store) == 1
+    store.append(160.0, 51.0)
+    assert path.stat().st_size == 2 * SAMPLE.size
+    assert store.samples(0, 1000) == [(100.0, 50.0), (160.0, 51.0)]
+
+
+def test_history_command_reports_the_true_extremes(make_settings):
+    from src.bot import handle_updates, load_boards
+    from src.subscribers import close_stores
+
+    ctx = load_boards(make_settings())
+    end = time.time()
+    # A week of 5-minute samples, too many for raw points, with one short spike each way
+    for i in range(7 * 288):
+        ts = end - 7 * DAY + i * 300
+        value = 60.0 if i == 1000 else 40.0 if i == 1500 else 50.0
+        ctx.history.append(ts, value)
+    ctx.history.downsample()
+    replies = []
+    update = {"update_id": 1, "message": {"chat": {"id": 7}, "text": "/history 7d"}}
+    handle_updates(ctx, [update], lambda *message: replies.append(message))
+    assert "Low 40.00%, high 60.00%" in replies[0][1]
+    ctx.outbox.close()
+    close_stores()
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import pytest
+import requests
+
+from src import http_session
+from src.http_session import (
+    TELEGRAM_API_BASE,
+    USER_AGENT,
+    close_session,
+    configure_session,
+    get_session,
+    set_session,
+    set_telegram_api_base,
+    telegram_url,
+)
+from src.notifier import NotifyError, send_telegram_message
+
+
+class StubSession(requests.Session):
+    def __init__(self) -> None:
+        super().__init__()
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+        super().close()
+
+
+@pytest.fixture(autouse=True)
+def _reset():
+    yield
+    configure_session(4, 16)
+    set_telegram_api_base("")
+
+
+def test_shared_session_uses_the_configured_pools():
+    configure_session(2, 32)
+    session = get_session()
+    assert get_session() is session
+    adapter = session.get_adapter("https://api.telegram.org")
+    assert (adapter._pool_connections, adapter._pool_maxsize) == (2, 32)
+    assert adapter.max_retries.total == 0
+    assert session.headers["User-Agent"] == USER_AGENT
+
+    # Reconfiguring drops the old session and its pools
+    configure_session(4, 8)
+    assert get_session() is not session
+    assert get_session().get_adapter("http://localhost")._pool_maxsize == 8
+
+
+def test_set_and_close_replace_the_session():
+    first, second = StubSession(), StubSession()
+    set_session(first)
+    assert get_session() is first
+    set_session(first)
+    assert not first.closed
+    set_session(second)
+    assert first.closed and get_session() is second
+    close_session()
+    assert second.closed and http_session._session is None
+    assert isinstance(get_session(), requests.Session)
+
+
+def test_telegram_api_base():
+    assert telegram_url("T", "getMe") == f"{TELEGRAM_API_BASE}/botT/getMe"
+    set_telegram_api_base("http://127.0.0.1:8081/")
+    assert telegram_url("T", "sendMessage") == "http://127.0.0.1:8081/botT/sendMessage"
+    set_telegram_api_base("")
+    assert telegram_url("T", "getMe") == f"{TELEGRAM_API_BASE}/botT/getMe"
+
+
+def test_messages_go_through_the_shared_session(telegram):
+    for cid in (1, 2, 3):
+        send_telegram_message("test", cid, "hello")
+    assert telegram.stats() == {"requests": 3, "sent": 3, "message_id": 3}
+
+    telegram.behaviour.rate_limit_every = 1
+    with pytest.raises(NotifyError) as error:
+        send_telegram_message("test", 1, "hello")
+    assert error.value.retry_after == 1
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+import requests
+
+from src.outbox import Outbox, OutboxDrainer
+from src.resilience import RetryPolicy
+
+FAST_RETRY = RetryPolicy(base_delay=0.001, max_delay=0.002)
+
+
+def test_put_ack_retry_survive_reopen(tmp_path):
+    path = str(tmp_path / "outbox.jsonl")
+    outbox = Outbox(path)
+    messages = [
+        ("check:1:10", 10, "alert", "alert to 10"),
+        ("check:1:11", 11, "alert", "alert to 11"),
+        ("update:5:commands:0", 12, "reply", ""),
+    ]
+    assert outbox.put(messages, marks={"check": 1}) == 3
+    assert outbox.put(messages[:1]) == 0
+
+    taken = outbox.take(10)
+    assert [item.key for item in taken] == ["update:5:commands:0", "check:1:10", "check:1:11"]
+    assert outbox.take(10) == []
+    reply, first, second = taken
+    outbox.ack([reply.key])
+    outbox.retry(first, 60.0)
+    outbox.defer(second, 60.0)
+    assert first.attempts == 1 and second.attempts == 0
+    assert outbox.take(10) == []
+    outbox.close()
+
+    reopened = Outbox(path)
+    assert sorted(key for key, _, _, _ in reopened.pending()) == ["check:1:10", "check:1:11"]
+    assert reopened.mark("check") == 1
+    # Acked and pending keys stay known, so re-queueing a batch after a crash adds nothing
+    assert reopened.put(messages) == 0
+    items = reopened.take(10)
+    assert [(item.chat_id, item.note) for item in items] == [(10, "alert to 10"), (11, "alert to 11")]
+    assert all(item.queued_at == pytest.approx(first.queued_at, abs=0.01) for item in items)
+    reopened.ack([item.key for item in items])
+    reopened.close()
+
+    assert len(Outbox(path)) == 0
+
+
+def test_compaction_keeps_pending_and_marks(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.outbox.COMPACT_AFTER_ACKS", 2)
+    path = str(tmp_path / "outbox.jsonl")
+    outbox = Outbox(path)
+    outbox.put([(f"check:1:{cid}", cid, "alert", "") for cid in range(5)], marks={"check": 1})
+    outbox.ack(["check:1:0", "check:1:1", "check:1:2"])
+    outbox.close()
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+
+    reopened = Outbox(path)
+    assert [key for key, _, _, _ in reopened.pending()] == ["check:1:3", "check:1:4"]
+    assert reopened.mark("check") == 1
+    assert reopened.put([("check:1:0", 0, "alert", "")]) == 0
+    reopened.close()
+
+
+def _http_error(status: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def _drain(tmp_path, error: Exception, **kwargs) -> int:
+    """Drain one message whose every send fails with `error`; returns the number of sends."""
+    outbox = Outbox(str(tmp_path / "outbox.jsonl"))
+    outbox.put([("check:1:7", 7, "alert", "")])
+    calls = []
+
+    def send(cid: int, text: str) -> None:
+        calls.append(cid)
+        raise error
+
+    drainer = OutboxDrainer(outbox, send, workers=2, retry_policy=FAST_RETRY, **kwargs).start()
+    assert outbox.join(5.0)
+    drainer.stop(0.1)
+    outbox.close()
+    assert len(Outbox(str(tmp_path / "outbox.jsonl"))) == 0
+    return len(calls)
+
+
+def test_drainer_gives_up_after_max_attempts(tmp_path):
+    assert _drain(tmp_path, requests.ConnectionError("down"), max_attempts=3) == 3
+
+
+def test_drainer_gives_up_on_old_messages(tmp_path):
+    assert _drain(tmp_path, _http_error(502), max_age_seconds=0.0) == 1
+
+
+def test_drainer_drops_permanent_failures_at_once(tmp_path):
+    assert _drain(tmp_path, _http_error(403), max_attempts=10) == 1
+
+
+def test_drainer_sends_replies_before_alerts(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.jsonl"))
+    outbox.put([(f"check:1:{cid}", cid, "alert", "") for cid in range(20)])
+    outbox.put([("update:1:commands:0", 99, "reply", "")])
+    sent = []
+    drainer = OutboxDrainer(outbox, lambda cid, text: sent.append(cid), workers=1).start()
+    assert outbox.join(5.0)
+    drainer.stop(0.1)
+    outbox.close()
+    assert sent[0] == 99
+    assert sorted(sent[1:]) == list(range(20))
+
+
+def test_drainer_fans_out_with_bounded_concurrency(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.jsonl"))
+    outbox.put([(f"check:1:{cid}", cid, "alert", "") for cid in range(200)])
+    lock = threading.Lock()
+    active, peak, sent = [0], [0], []
+
+    def send(cid: int, text: str) -> None:
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.01)
+        with lock:
+            active[0] -= 1
+        if cid == 13:
+            raise _http_error(403)  # one chat blocked the bot; the rest still get theirs
+        sent.append(cid)
+
+    started = time.monotonic()
+    drainer = OutboxDrainer(outbox, send, workers=8).start()
+    assert outbox.join(10.0)
+    drainer.stop(0.1)
+    outbox.close()
+    assert peak[0] == 8
+    assert sorted(sent) == [cid for cid in range(200) if cid != 13]
+    assert time.monotonic() - started < 200 * 0.01 / 2
+
+
+def test_take_follows_due_times(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.jsonl"))
+    outbox.put([(f"check:1:{cid}", cid, "alert", "") for cid in range(3)])
+    outbox.put([("update:1:commands:0", 9, "reply", "")])
+    reply, first = outbox.take(2)
+    assert (reply.chat_id, first.chat_id) == (9, 0)
+    outbox.defer(reply, 60.0)
+    outbox.retry(first, 0.0)
+    # The deferred reply waits; the retried alert is due again, behind those due before it
+    assert [item.chat_id for item in outbox.take(10)] == [1, 2, 0]
+    assert 59.0 < outbox.next_due() <= 60.0
+    outbox.close()
+
+
+def test_draining_a_large_broadcast_stays_linear(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.jsonl"))
+    outbox.put([(f"check:1:{cid}", cid, "alert", "") for cid in range(50000)])
+    started = time.monotonic()
+    taken = 0
+    while outbox.next_due() is not None:
+        taken += len(outbox.take(1))
+    assert taken == 50000
+    assert time.monotonic() - started < 5.0
+    outbox.close()
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import email.utils
+import time
+
+import pytest
+import requests
+
+from src.fetcher import FetchError
+from src.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, is_retryable, retry_after_seconds
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _http_error(status: int, retry_after: str = "") -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    if retry_after:
+        response.headers["Retry-After"] = retry_after
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def _raising(error: Exception):
+    def operation() -> None:
+        raise error
+
+    return operation
+
+
+def test_classifies_errors():
+    assert is_retryable(requests.ConnectionError("down"))
+    assert is_retryable(_http_error(503)) and is_retryable(_http_error(429))
+    assert not is_retryable(_http_error(404))
+    assert not is_retryable(ValueError("bad json"))
+    try:
+        raise FetchError("wrapped") from requests.Timeout("slow")
+    except FetchError as wrapped:
+        assert is_retryable(wrapped)
+
+
+def test_reads_retry_after():
+    assert retry_after_seconds(_http_error(429, "7")) == 7.0
+    when = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 < retry_after_seconds(_http_error(503, when)) <= 30
+    assert retry_after_seconds(_http_error(503, "soon")) is None
+    assert retry_after_seconds(CircuitOpenError("x", 4.0)) == 4.0
+
+
+def test_retry_policy_backs_off_and_stops_on_permanent_errors():
+    policy = RetryPolicy(attempts=4, base_delay=1.0, max_delay=3.0, jitter=0.0)
+    assert [policy.delay(attempt) for attempt in (1, 2, 3, 4)] == [1.0, 2.0, 3.0, 3.0]
+    assert policy.delay(1, _http_error(429, "2.5")) == 2.5
+    assert policy.delay(1, _http_error(429, "600")) == 3.0
+
+    sleeps, errors = [], [requests.ConnectionError("down"), _http_error(502)]
+
+    def operation() -> str:
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert policy.call(operation, sleep=sleeps.append) == "ok"
+    assert sleeps == [1.0, 2.0]
+    with pytest.raises(requests.HTTPError):
+        policy.call(_raising(_http_error(400)), sleep=sleeps.append)
+    assert len(sleeps) == 2
+
+
+def test_breaker_opens_probes_and_backs_off():
+    clock = Clock()
+    breaker = CircuitBreaker("api", failure_threshold=2, reset_seconds=10, max_reset_seconds=30, clock=clock)
+    breaker.record_failure(_http_error(404))
+    breaker.record_failure(requests.ConnectionError("down"))
+    assert breaker.state == "closed"
+    breaker.record_failure(requests.ConnectionError("down"))
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_in == 10
+
+    # One probe at a time; a failed probe doubles the timeout up to the cap
+    for reset in (20, 30, 30):
+        clock.now += 100
+        breaker.before_call()
+        assert breaker.state == "half_open"
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_failure(requests.Timeout("slow"))
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError) as error:
+            breaker.before_call()
+        assert error.value.retry_in == reset
+
+    clock.now += 100
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+
+
+def test_retry_after_opens_the_breaker_at_once():
+    clock = Clock()
+    breaker = CircuitBreaker("api", failure_threshold=5, reset_seconds=10, clock=clock)
+    with pytest.raises(requests.HTTPError):
+        breaker.call(_raising(_http_error(429, "45")))
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.call(lambda: "never")
+    assert error.value.retry_in == 45
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import random
+import threading
+
+import pytest
+
+from src.scheduler import MISSED_CATCH_UP, MISSED_DELAY, MISSED_SKIP, Scheduler
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _overrunning(clock: Clock, runs: list, seconds: float):
+    """A job that takes `seconds` on its first run and no time afterwards."""
+
+    def job() -> None:
+        runs.append(clock.now)
+        if len(runs) == 1:
+            clock.now += seconds
+
+    return job
+
+
+def test_skip_drops_missed_runs_and_keeps_the_cadence():
+    clock, runs = Clock(), []
+    scheduler = Scheduler(clock)
+    scheduler.every("job", 10, _overrunning(clock, runs, 25), missed=MISSED_SKIP)
+    assert scheduler.run_due() == 5  # the 10s and 20s runs are dropped; next on the 30s grid
+    clock.now = 30
+    scheduler.run_due()
+    assert runs == [0, 30]
+
+
+def test_catch_up_runs_every_missed_deadline():
+    clock, runs = Clock(), []
+    scheduler = Scheduler(clock)
+    scheduler.every("job", 10, _overrunning(clock, runs, 25), missed=MISSED_CATCH_UP)
+    assert scheduler.run_due() == 0
+    assert scheduler.run_due() == 5
+    assert runs == [0, 25, 25]
+
+
+def test_delay_counts_from_the_end_of_the_previous_run():
+    clock, runs = Clock(), []
+    scheduler = Scheduler(clock)
+    scheduler.every("job", 10, _overrunning(clock, runs, 25), missed=MISSED_DELAY)
+    assert scheduler.run_due() == 10
+    clock.now = 35
+    scheduler.run_due()
+    assert runs == [0, 35]
+
+
+def test_late_start_is_reported_as_lag():
+    clock = Clock()
+    scheduler = Scheduler(clock)
+    job = scheduler.every("job", 10, lambda: None, delay=10)
+    clock.now = 13
+    assert scheduler.run_due() == 7
+    assert job.lag == 3 and job.runs == 1
+
+
+def test_returned_delay_overrides_the_interval():
+    clock, runs = Clock(), []
+    scheduler = Scheduler(clock)
+
+    def job() -> float:
+        runs.append(clock.now)
+        return 2.0
+
+    scheduler.every("job", 10, job)
+    assert scheduler.run_due() == 2
+    clock.now = 2
+    assert scheduler.run_due() == 2
+    assert runs == [0, 2]
+
+
+def test_once_job_runs_once_unless_it_reschedules():
+    clock, runs = Clock(), []
+    scheduler = Scheduler(clock)
+    scheduler.once("plain", 1, lambda: runs.append("plain"))
+    scheduler.once("again", 1, lambda: runs.append("again") or (5.0 if runs.count("again") < 2 else None))
+    clock.now = 1
+    assert scheduler.run_due() == 5
+    clock.now = 6
+    assert scheduler.run_due() == float("inf")
+    assert runs == ["plain", "again", "again"]
+
+
+def test_errors_and_cancel():
+    clock, runs = Clock(), []
+    scheduler = Scheduler(clock)
+
+    def failing() -> None:
+        runs.append(clock.now)
+        raise RuntimeError("boom")
+
+    scheduler.every("failing", 10, failing)
+    cancelled = scheduler.every("cancelled", 1, lambda: runs.append("cancelled"), delay=1)
+    scheduler.cancel(cancelled)
+    assert scheduler.run_due() == 10
+    clock.now = 10
+    scheduler.run_due()
+    assert runs == [0, 10]
+
+
+def test_jitter_stays_within_bounds():
+    clock = Clock()
+    scheduler = Scheduler(clock, random.Random(1))
+    jobs = [scheduler.every(f"job{i}", 60, lambda: None, delay=10, jitter=5) for i in range(50)]
+    assert all(10 <= job.due <= 15 for job in jobs)
+    assert len({job.due for job in jobs}) > 1
+
+
+def test_rejects_bad_jobs():
+    scheduler = Scheduler(Clock())
+    with pytest.raises(ValueError):
+        scheduler.every("job", 0, lambda: None)
+    with pytest.raises(ValueError):
+        scheduler.every("job", 1, lambda: None, missed="sometimes")
+    scheduler.every("busy", 0, lambda: None, missed=MISSED_DELAY)
+
+
+def test_run_stops_when_the_event_is_set():
+    stop = threading.Event()
+    runs = []
+    scheduler = Scheduler()
+    scheduler.every("job", 0.01, lambda: runs.append(1) or (stop.set() if len(runs) == 3 else None))
+    worker = threading.Thread(target=scheduler.run, args=(stop,), daemon=True)
+    worker.start()
+    worker.join(2.0)
+    assert not worker.is_alive()
+    assert len(runs) == 3
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import os
+import time
+
+from src.bot import handle_updates
+from src.sharding import load_coordinator_context, prepare_shards, route_updates, shard_of, shard_path
+from src.subscribers import Subscriber, close_stores, read_subscribers, write_subscribers
+
+
+def _update(update_id: int, chat_id: int, text: str) -> dict:
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": text}}
+
+
+def test_shard_paths():
+    assert shard_path("/data/subscribers.db", 2, 4) == "/data/subscribers.2-of-4.db"
+    assert shard_path("/data/subscribers.db", 0, 1) == "/data/subscribers.db"
+    assert [shard_of(cid, 3) for cid in (3, 4, 5, -1)] == [0, 1, 2, 2]
+
+
+def test_reshard_moves_every_subscriber(tmp_path):
+    path = str(tmp_path / "subscribers.db")
+    subscribers = {cid: Subscriber(upper=50.0 + cid % 7) for cid in range(1, 101)}
+    write_subscribers(path, subscribers)
+    close_stores()
+
+    assert prepare_shards(path, 3) == 100
+    assert os.path.exists(f"{path}.resharded")
+    parts = [read_subscribers(shard_path(path, i, 3)) for i in range(3)]
+    assert all(shard_of(cid, 3) == i for i, part in enumerate(parts) for cid in part)
+    assert prepare_shards(path, 3) == 0  # already in that layout
+
+    # Changing SHARD_COUNT again merges the old layout into the new one
+    close_stores()
+    assert prepare_shards(path, 2) == 100
+    merged = {**read_subscribers(shard_path(path, 0, 2)), **read_subscribers(shard_path(path, 1, 2))}
+    assert merged == subscribers
+    close_stores()
+
+
+def test_routes_commands_to_the_owning_shard():
+    updates = [_update(1, 4, "/start"), _update(2, 5, "/value"), _update(3, 6, "/history 7d"), {"update_id": 4}]
+    routed, wants_value, local = route_updates(updates, 2)
+    assert routed == {0: [updates[0]], 1: [updates[1]]}
+    assert wants_value == {1}
+    assert local == [updates[2]]
+
+
+def test_coordinator_answers_history(make_settings):
+    ctx = load_coordinator_context(make_settings(SHARD_COUNT="2"))
+    now = time.time()
+    for i, value in enumerate((50.0, 52.0, 51.0)):
+        ctx.history.append(now - 300 + i * 60, value)
+    replies = []
+    handle_updates(ctx, [_update(1, 7, "/history")], lambda *message: replies.append(message))
+    [(cid, text, _)] = replies
+    assert cid == 7
+    assert "50.00% → 51.00%" in text and "high 52.00%" in text
+    ctx.outbox.close()
+    close_stores()
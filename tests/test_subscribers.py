@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+
+import pytest
+
+from src.subscribers import Subscriber, close_stores, read_subscribers, write_subscribers
+
+
+@pytest.fixture(autouse=True)
+def _close():
+    yield
+    close_stores()
+
+
+def _rows(path: str) -> list:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT chat_id, upper, lower, last_zone, last_value FROM subscribers ORDER BY 1").fetchall()
+
+
+def test_migrates_the_json_file_once(tmp_path):
+    legacy = tmp_path / "subscribers.json"
+    legacy.write_text(json.dumps({"1": {"upper": "56", "last_zone": "above"}, "2": None, "x": {}}))
+    path = str(tmp_path / "subscribers.db")
+
+    assert read_subscribers(path) == {1: Subscriber(upper=56.0, last_zone="above"), 2: Subscriber()}
+    assert not legacy.exists() and os.path.exists(f"{legacy}.migrated")
+
+    # A JSON file showing up again is ignored once the table has rows
+    legacy.write_text(json.dumps({"3": {}}))
+    close_stores()
+    assert sorted(read_subscribers(path)) == [1, 2]
+
+
+def test_migrates_the_legacy_id_list(tmp_path):
+    (tmp_path / "subscribers.json").write_text("[5, 6]")
+    assert read_subscribers(str(tmp_path / "subscribers.db")) == {5: Subscriber(), 6: Subscriber()}
+
+
+def test_writes_only_dirty_and_removed_rows(tmp_path):
+    path = str(tmp_path / "subscribers.db")
+    subscribers = {cid: Subscriber(lower=40.0) for cid in (1, 2, 3)}
+    write_subscribers(path, subscribers)
+
+    subscribers[1].last_zone = "below"
+    subscribers[2].upper = 60.0  # changed but not marked dirty, so not written
+    del subscribers[3]
+    write_subscribers(path, subscribers, dirty=[1, 99], removed=[3])
+    assert _rows(path) == [(1, None, 40.0, "below", None), (2, None, 40.0, None, None)]
+
+    # A chat that re-subscribed before the flush keeps its row
+    write_subscribers(path, subscribers, removed=[2])
+    assert [row[0] for row in _rows(path)] == [1, 2]
+
+
+def test_json_paths_are_rewritten_in_full(tmp_path):
+    path = str(tmp_path / "subscribers.json")
+    write_subscribers(path, {7: Subscriber(upper=55.5)}, dirty=[])
+    assert read_subscribers(path) == {7: Subscriber(upper=55.5)}
+    assert not os.path.exists(f"{path}.migrated")
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import random
+
+from bench.synthetic import make_subscribers
+from src.alert_plan import determine_zone
+from src.subscribers import Subscriber
+from src.threshold_index import ThresholdIndex
+
+UPPER, LOWER = 55.0, 45.0
+
+
+def _zone(sub: Subscriber, value: float) -> str:
+    upper = sub.upper if sub.upper is not None else UPPER
+    lower = sub.lower if sub.lower is not None else LOWER
+    return determine_zone(value, lower, upper)
+
+
+def _value(rng: random.Random, subscribers: dict) -> float:
+    # Often land exactly on someone's threshold, where the inclusive comparisons matter
+    if rng.random() < 0.3:
+        sub = subscribers[rng.choice(list(subscribers))]
+        return rng.choice([sub.upper or UPPER, sub.lower or LOWER])
+    return round(rng.uniform(38.0, 62.0), 1)
+
+
+def test_candidates_cover_every_zone_change():
+    rng = random.Random(7)
+    subscribers = make_subscribers(2000, seed=3)
+    index = ThresholdIndex.build(subscribers, UPPER, LOWER)
+    previous = 50.0
+    assert index.candidates(None, previous) == set(subscribers)
+    zones = {cid: _zone(sub, previous) for cid, sub in subscribers.items()}
+    next_cid = len(subscribers) + 1
+
+    for _ in range(500):
+        # Threshold changes, new subscribers and unsubscribes between checks
+        for _ in range(rng.randrange(4)):
+            action = rng.random()
+            if action < 0.5:
+                cid = rng.choice(list(subscribers))
+                subscribers[cid].upper = round(rng.uniform(50.0, 60.0), 1)
+                index.update(cid, subscribers[cid])
+            elif action < 0.8:
+                subscribers[next_cid] = Subscriber(lower=round(rng.uniform(40.0, 50.0), 1))
+                zones[next_cid] = "neutral"
+                index.update(next_cid, subscribers[next_cid])
+                next_cid += 1
+            else:
+                cid = rng.choice(list(subscribers))
+                del subscribers[cid], zones[cid]
+                index.remove(cid)
+
+        current = _value(rng, subscribers)
+        changed = {cid for cid, sub in subscribers.items() if _zone(sub, current) != zones[cid]}
+        candidates = index.candidates(previous, current)
+        assert changed <= candidates
+        assert candidates <= set(subscribers)
+        zones = {cid: _zone(sub, current) for cid, sub in subscribers.items()}
+        previous = current
+
+
+def test_small_moves_visit_few_subscribers():
+    subscribers = make_subscribers(5000, seed=5)
+    index = ThresholdIndex.build(subscribers, UPPER, LOWER)
+    index.candidates(None, 50.0)
+    assert index.candidates(50.0, 50.5) == set()
+    crossed = index.candidates(50.5, UPPER)
+    assert crossed == {cid for cid, sub in subscribers.items() if _zone(sub, UPPER) != _zone(sub, 50.5)}
+    assert 0 < len(crossed) < len(subscribers)
+
+
+def test_changed_thresholds_are_returned_once():
+    subscribers = {1: Subscriber(), 2: Subscriber()}
+    index = ThresholdIndex.build(subscribers, UPPER, LOWER)
+    index.candidates(None, 50.0)
+    subscribers[2].upper = 49.0
+    index.update(2, subscribers[2])
+    assert index.candidates(50.0, 50.0) == {2}
+    assert index.candidates(50.0, 50.0) == set()
+    index.mark_pending([1, 99])
+    assert index.candidates(50.0, 50.0) == {1}
+    index.remove(1)
+    assert index.candidates(50.0, 50.0) == set()
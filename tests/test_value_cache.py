@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from src.value_cache import ValueCache
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Upstream:
+    """A fetch that blocks until released, counting calls."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.error = None
+
+    def __call__(self) -> float:
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5.0)
+        if self.error is not None:
+            raise self.error
+        return 50.0 + self.calls
+
+
+def test_concurrent_readers_share_one_fetch():
+    upstream = Upstream()
+    cache = ValueCache(upstream, ttl_seconds=60, clock=Clock())
+    results = []
+    readers = [threading.Thread(target=lambda: results.append(cache.get())) for _ in range(8)]
+    for reader in readers:
+        reader.start()
+    assert upstream.started.wait(5.0)
+    upstream.release.set()
+    for reader in readers:
+        reader.join(5.0)
+    assert results == [51.0] * 8
+    assert upstream.calls == 1
+    assert cache.get() == 51.0 and upstream.calls == 1
+
+
+def test_stale_values_are_served_while_one_refresh_runs():
+    clock, upstream = Clock(), Upstream()
+    upstream.release.set()
+    cache = ValueCache(upstream, ttl_seconds=60, stale_seconds=30, clock=clock)
+    assert cache.get() == 51.0
+
+    clock.now = 70
+    upstream.release.clear()
+    upstream.started.clear()
+    assert cache.get() == 51.0
+    assert upstream.started.wait(5.0)
+    assert cache.get() == 51.0  # the refresh is still running; no second one starts
+    upstream.release.set()
+    for _ in range(500):
+        if cache.peek() == 52.0:
+            break
+        time.sleep(0.01)
+    assert cache.get() == 52.0 and upstream.calls == 2
+
+    # Past the stale window, or when stale values are not allowed, callers wait for a fetch
+    clock.now = 200
+    assert cache.get() == 53.0
+    clock.now = 275
+    assert cache.get(allow_stale=False) == 54.0
+    assert cache.age() == 0
+
+
+def test_failed_fetches_reach_every_waiter_and_keep_the_old_value():
+    clock, upstream = Clock(), Upstream()
+    upstream.release.set()
+    cache = ValueCache(upstream, ttl_seconds=60, clock=clock)
+    cache.put(49.0)
+    clock.now = 100
+    upstream.error = RuntimeError("upstream down")
+    with pytest.raises(RuntimeError):
+        cache.get()
+    with pytest.raises(RuntimeError):
+        cache.refresh()
+    assert cache.peek() == 49.0
+    upstream.error = None
+    assert cache.refresh() == 53.0
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import pytest
+
+from src.bot import handle_updates, load_boards, queue_replies
+from src.config import load_settings
+from src.http_session import get_session
+from src.main import start_drainer, start_webhook
+from src.subscribers import close_stores
+from src.webhook import SECRET_HEADER
+
+SECRET = "s3cret"
+
+
+@pytest.fixture
+def settings(tmp_path, telegram):
+    return load_settings(
+        {
+            "TELEGRAM_BOT_TOKEN": "test",
+            "TELEGRAM_API_BASE": telegram.base_url,
+            "UPDATES_MODE": "webhook",
+            "WEBHOOK_SECRET": SECRET,
+            "WEBHOOK_URL": "https://bot.example.com/telegram",
+            "WEBHOOK_LISTEN_HOST": "127.0.0.1",
+            "WEBHOOK_PORT": "0",
+            "SUBSCRIBERS_FILE_PATH": str(tmp_path / "subscribers.db"),
+            "STATE_FILE_PATH": str(tmp_path / "state.json"),
+            "HISTORY_FILE_PATH": str(tmp_path / "history.bin"),
+            "OUTBOX_FILE_PATH": str(tmp_path / "outbox.jsonl"),
+        }
+    )
+
+
+@pytest.fixture
+def receiver(settings):
+    receiver = start_webhook(settings)
+    yield receiver
+    receiver.stop()
+
+
+def _post(receiver, update: dict, secret: str = SECRET, path: str = "/telegram") -> int:
+    host, port = receiver.address[:2]
+    headers = {SECRET_HEADER: secret} if secret is not None else {}
+    return get_session().post(f"http://{host}:{port}{path}", json=update, headers=headers, timeout=5).status_code
+
+
+def _update(update_id: int, chat_id: int, text: str) -> dict:
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": text}}
+
+
+def test_registers_the_webhook(receiver, telegram):
+    assert telegram.stats().get("requests") == 1
+
+
+def test_rejects_requests_without_the_secret(receiver):
+    assert _post(receiver, _update(1, 10, "/start"), secret=None) == 403
+    assert _post(receiver, _update(1, 10, "/start"), secret="guess") == 403
+    assert _post(receiver, _update(1, 10, "/start"), path="/other") == 404
+    assert _post(receiver, {"message": {}}) == 400
+    assert receiver.next_batch(0.05) == []
+    assert _post(receiver, _update(1, 10, "/start")) == 200
+    assert [u["update_id"] for u in receiver.next_batch(1.0)] == [1]
+
+
+def test_redelivered_updates_are_handled_once(settings, receiver, telegram):
+    ctx = load_boards(settings)
+    for update in (_update(1, 10, "/start"), _update(2, 10, "/help"), _update(3, 11, "/help")):
+        assert _post(receiver, update) == 200
+    # Telegram re-sends updates it got no timely answer for
+    assert _post(receiver, _update(3, 11, "/help")) == 200
+    assert _post(receiver, _update(2, 10, "/help")) == 200
+
+    updates = receiver.next_batch(1.0)
+    assert [u["update_id"] for u in updates] == [1, 2, 3]
+    replies = []
+    handle_updates(ctx, updates, lambda *message: replies.append(message))
+    queue_replies(ctx, updates, replies)
+    assert [cid for cid, _, _ in replies] == [10, 11]
+
+    drainer = start_drainer(settings, ctx.outbox)
+    assert ctx.outbox.join(5.0)
+    drainer.stop(0.1)
+    ctx.outbox.close()
+    close_stores()
+    assert telegram.stats().get("sent") == 2